@@ -0,0 +1,357 @@
+import gc
+import os
+import pathlib
+import random
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+
+dir = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(dir)
+sys.path.append(dir+'/external')
+import lists
+import metadataCatalog
+import multiProcess
+import pathCatalog
+import paths
+import query
+import regex
+
+
+def timer(function, *args, **kwargs):
+    """Time a single call of the function
+
+    :param function: 'function' Function to be timed
+    :param args: Arguments to be passed into the function call
+    :param kwargs: Keyword args to be passed into the function call
+    :return: 'list' seconds elapsed and the result of the function
+    """
+    start = time.perf_counter()
+    result = function(*args, **kwargs)
+    return time.perf_counter() - start, result
+
+
+def memory(function, *args, **kwargs):
+    """Measure the memory still allocated by the result of the function
+
+    :param function: 'function' Function to be measured
+    :param args: Arguments to be passed into the function call
+    :param kwargs: Keyword args to be passed into the function call
+    :return: 'list' bytes allocated and the result of the function
+    """
+    gc.collect()
+    tracemalloc.start()
+    try:
+        result = function(*args, **kwargs)
+        gc.collect()
+        size = tracemalloc.get_traced_memory()[0]
+    finally:
+        tracemalloc.stop()
+    return size, result
+
+
+def syntheticPaths(count=1000000, per_directory=500):
+    """Generate path strings resembling a large asset library
+
+    :param count: 'int' number of paths to generate
+    :param per_directory: 'int' number of files in each directory
+    :return: 'list' path strings
+    """
+    results = []
+    for i in range(count):
+        directory = i // per_directory
+        results.append(os.path.join(
+            os.sep, 'assets', 'project_{:03d}'.format(directory % 97),
+            'textures', 'set_{:05d}'.format(directory),
+            'texture_{:07d}_diffuse.png'.format(i)))
+    return results
+
+
+def syntheticTree(root, depth=3, width=8, files=10):
+    """Build a directory tree of empty files to benchmark against
+
+    :param root: 'str' directory the tree will be created in
+    :param depth: 'int' number of nested directory levels
+    :param width: 'int' number of child directories in each directory
+    :param files: 'int' number of files in each directory
+    :return: 'int' number of directories created
+    """
+    count = 1
+    for i in range(files):
+        open(os.path.join(root, 'image_{:04d}.png'.format(i)), 'w').close()
+    if depth:
+        for i in range(width):
+            child = os.path.join(root, 'folder_{:03d}'.format(i))
+            os.mkdir(child)
+            count += syntheticTree(child, depth - 1, width, files)
+    return count
+
+
+class _LatentScandir(object):
+    def __init__(self, scandir, latency):
+        """Stand-in for the scandir module, sleeping before each directory
+         listing to mimic the round-trip of a network filesystem.
+
+        :param scandir: 'module' scandir module to wrap
+        :param latency: 'float' seconds to wait on each listing
+        """
+        self.module = scandir
+        self.latency = latency
+
+    def scandir(self, path):
+        time.sleep(self.latency)
+        return self.module.scandir(path)
+
+
+def walk(depth=3, width=8, files=10, latency=0.002, threads=(1, 4, 16, 32)):
+    """Compare the serial and concurrent walks of paths.getPaths over a
+     synthetic tree with an injected latency on every directory listing.
+
+    :param depth: 'int' number of nested directory levels
+    :param width: 'int' number of child directories in each directory
+    :param files: 'int' number of files in each directory
+    :param latency: 'float' seconds added to each directory listing
+    :param threads: 'list' thread counts to time the walk with
+    """
+    root = tempfile.mkdtemp()
+    module = paths.scandir
+    try:
+        count = syntheticTree(root, depth, width, files)
+        paths.scandir = _LatentScandir(module, latency)
+        expected = None
+        for threadCount in threads:
+            elapsed, result = timer(paths.getPaths, root, threads=threadCount)
+            if expected is None:
+                expected = result
+            match = 'match' if result == expected else 'MISMATCH'
+            print('walk\t{} dirs\t{} threads\t{:.3f}s\t{}'.format(
+                count, threadCount, elapsed, match))
+    finally:
+        paths.scandir = module
+        shutil.rmtree(root)
+
+
+def pathMemory(count=1000000):
+    """Compare the memory used by a list of pathlib.WindowsPath with a
+     pathCatalog.PathCatalog holding the same paths.
+
+    :param count: 'int' number of paths to store
+    """
+    strings = syntheticPaths(count)
+    size, result = memory(lambda: [pathlib.PureWindowsPath(p) for p in strings])
+    print('pathMemory\t{} paths\tWindowsPath list\t{:.1f}MB'.format(
+        count, size / 1024.0 ** 2))
+    del result
+    size, result = memory(pathCatalog.PathCatalog, strings)
+    print('pathMemory\t{} paths\tPathCatalog\t{:.1f}MB'.format(
+        count, size / 1024.0 ** 2))
+
+
+def _regexFilter(items, includes=[], excludes=[], required=[], starts=[],
+                 ends=[]):
+    """Filter the items with the regExpressions of regex.precompile, the way
+     items were evaluated before the compiled matcher."""
+    regs = regex.precompile(includes=includes, excludes=excludes,
+                            required=required, starts=starts, ends=ends)
+    includesREGs, excludesREGs, requiredREGs, startsREGs, endsREGs = regs
+    results = []
+    for item in items:
+        itemString = str(item)
+        if any(not r.search(itemString)
+               for r in requiredREGs + startsREGs + endsREGs):
+            continue
+        if any(r.search(itemString) for r in excludesREGs):
+            continue
+        if any(not r.search(itemString) for r in includesREGs):
+            continue
+        results.append(item)
+    return results
+
+
+def _matcherFilter(items, **terms):
+    """Filter the items with regex.Matcher"""
+    matcher = regex.Matcher(**terms)
+    return [item for item in items if matcher.match(str(item))]
+
+
+FILTER_QUERIES = [
+    ('extension', {'ends': ['.png', '.jpg', '.exr']}),
+    ('substring', {'includes': ['diffuse']}),
+    ('required', {'required': ['textures', 'set_001']}),
+    ('excludes', {'excludes': ['project_01', 'project_02']}),
+    ('many terms', {'includes': ['texture_{:07d}'.format(i)
+                                 for i in range(0, 100000, 499)]}),
+    ('wildcard', {'includes': ['set_*_diffuse']}),
+]
+
+
+def filterMatch(count=1000000):
+    """Compare filtering with the regExpressions of regex.precompile against
+     the literal fast paths of regex.Matcher.
+
+    :param count: 'int' number of paths to filter
+    """
+    items = syntheticPaths(count)
+    for name, terms in FILTER_QUERIES:
+        regexTime, expected = timer(_regexFilter, items, **terms)
+        matcherTime, result = timer(_matcherFilter, items, **terms)
+        match = 'match' if result == expected else 'MISMATCH'
+        print('filterMatch\t{} paths\t{}\tregex {:.3f}s\tmatcher {:.3f}s'
+              '\t{:.1f}x\t{}'.format(count, name, regexTime, matcherTime,
+                                     regexTime / max(matcherTime, 1e-9), match))
+
+
+def filterParallel(counts=(100000, 1000000, 5000000), processes=None):
+    """Compare filtering in a single thread against the chunks evaluated by
+     the worker processes of multiProcess.ProcessFilter, using the queries
+     that fall back to regExpressions.
+
+    :param counts: 'list' numbers of paths to filter
+    :param processes: 'int' number of worker processes, defaults to the
+        number of cores
+    """
+    queries = [('wildcard', {'includes': ['set_*_diffuse']}),
+               ('wildcards', {'includes': ['set_0*1_*', 'texture_*9_*'],
+                              'excludes': ['project_0*5']})]
+    for count in counts:
+        items = syntheticPaths(count)
+        backend = multiProcess.ProcessFilter(processes=processes, threshold=0)
+        try:
+            # encoding the items and starting the processes only happens on
+            # the first run, time it separately
+            encode, result = timer(backend._encode, items, lists._enumerate)
+            warmup = lists.FilterList(includes=['*'])
+            startup, result = timer(backend.run, items, warmup._query(),
+                                    enumerate=lists._enumerate)
+            print('filterParallel\t{} paths\tencode {:.3f}s\tfirst run '
+                  '{:.3f}s'.format(count, encode, startup))
+            for name, terms in queries:
+                serialTime, expected = timer(lists.FilterList().run, items,
+                                             **terms)
+                filterList = lists.FilterList()
+                filterList.setBackend(backend)
+                parallelTime, result = timer(filterList.run, items, **terms)
+                match = 'match' if result == expected else 'MISMATCH'
+                print('filterParallel\t{} paths\t{}\tserial {:.3f}s'
+                      '\tprocesses {:.3f}s\t{:.1f}x\t{}'.format(
+                          count, name, serialTime, parallelTime,
+                          serialTime / max(parallelTime, 1e-9), match))
+        finally:
+            backend.close()
+
+
+def syntheticImages(root, count=200, size=2048):
+    """Write noisy PNG images to decode
+
+    :param root: 'str' directory the images will be written to
+    :param count: 'int' number of images
+    :param size: 'int' width and height of the images
+    :return: 'list' file paths of the images
+    """
+    from PySide2 import QtGui
+    results = []
+    data = os.urandom(size * size * 4)
+    image = QtGui.QImage(data, size, size, QtGui.QImage.Format_RGBA8888)
+    for i in range(count):
+        path = os.path.join(root, 'image_{:04d}.png'.format(i))
+        image.save(path)
+        results.append(path)
+    return results
+
+
+def _threadDecode(files, size, threads):
+    """Decode the files scaled down on a multiThread.ThreadPool"""
+    from PySide2 import QtCore, QtGui
+    import multiThread
+
+    def read(path):
+        reader = QtGui.QImageReader(path)
+        reader.setScaledSize(reader.size().scaled(size, size,
+                                                  QtCore.Qt.KeepAspectRatio))
+        return reader.read()
+    threadPool = multiThread.ThreadPool(function=read, maxThreadCount=threads)
+    results = list(threadPool.map(functionArgs=[[f] for f in files]))
+    threadPool.shutdown()
+    return results
+
+
+def _processDecode(decoder, files, threads):
+    """Decode the files with the multiProcess.ProcessDecoder, copying each
+     image out of its slot like the icons do."""
+    import multiThread
+
+    def read(path):
+        thumbnail = decoder.decode(path)
+        image = decoder.image(thumbnail).copy()
+        decoder.release(thumbnail)
+        return image
+    threadPool = multiThread.ThreadPool(function=read, maxThreadCount=threads)
+    results = list(threadPool.map(functionArgs=[[f] for f in files]))
+    threadPool.shutdown()
+    return results
+
+
+def decodeThumbnails(count=200, size=256, processes=(1, 4, 16, 32)):
+    """Compare decoding thumbnails on threads against the worker processes
+     of multiProcess.ProcessDecoder.
+
+    :param count: 'int' number of images to decode
+    :param size: 'int' maximum width and height of the thumbnails
+    :param processes: 'list' worker counts to time the decoders with
+    """
+    root = tempfile.mkdtemp()
+    try:
+        files = syntheticImages(root, count)
+        for workers in processes:
+            elapsed, result = timer(_threadDecode, files, size, workers)
+            print('decodeThumbnails\t{} images\t{} threads\t{:.3f}s'.format(
+                count, workers, elapsed))
+            decoder = multiProcess.ProcessDecoder(processes=workers, size=size)
+            try:
+                # start the processes before timing
+                _processDecode(decoder, files[:workers], workers)
+                elapsed, result = timer(_processDecode, decoder, files,
+                                        decoder.var_slots)
+            finally:
+                decoder.close()
+            print('decodeThumbnails\t{} images\t{} processes\t{:.3f}s'.format(
+                count, workers, elapsed))
+    finally:
+        shutil.rmtree(root)
+
+
+def metadataQuery(count=1000000):
+    """Time sorting and selecting over the columns of a
+     metadataCatalog.MetadataCatalog, against checking the predicates item by
+     item with the metadata of each row.
+
+    :param count: 'int' number of rows
+    """
+    generator = random.Random(0)
+    paths = syntheticPaths(count)
+    catalog = metadataCatalog.MetadataCatalog(paths)
+    now = time.time()
+    catalog._write([(i, metadataCatalog.STATE_READ, 1,
+                     generator.randint(16, 8192), generator.randint(16, 8192),
+                     generator.randint(1024, 64 * 1024 ** 2),
+                     now - generator.randint(0, 86400 * 365))
+                    for i in range(count)])
+    backend = 'numpy' if metadataCatalog.numpy is not None else 'array'
+    for field in ('size', 'mtime', 'pixels'):
+        elapsed, result = timer(catalog.sort, field)
+        print('metadataQuery\t{} rows\t{}\tsort {}\t{:.3f}s'.format(
+            count, backend, field, elapsed))
+    filterQuery = query.parse('size>2MB w>=4096 mtime<30d')
+    itemTime, expected = timer(filterQuery.filter, range(count),
+                               metadata=catalog.metadata, indexed=True)
+    columnTime, result = timer(filterQuery.filter, paths, catalog=catalog)
+    match = 'match' if result == [paths[i] for i in expected] else 'MISMATCH'
+    print('metadataQuery\t{} rows\t{}\tper item {:.3f}s\tcolumns {:.3f}s'
+          '\t{}'.format(count, backend, itemTime, columnTime, match))
+
+if __name__ == '__main__':
+    benchmarks = sys.argv[1:] or ['walk']
+    for name in benchmarks:
+        globals()[name]()
@@ -0,0 +1,235 @@
+import collections
+import concurrent.futures
+import hashlib
+import os
+import sqlite3
+import threading
+
+import paths
+
+# bytes hashed at the start and end of a file to tell files of the same size
+# apart before hashing them completely
+EDGE_SIZE = 64 * 1024
+# bytes read at once when hashing a whole file
+READ_SIZE = 1024 ** 2
+
+
+def _digest():
+    """Hash used for the digests"""
+    return hashlib.blake2b(digest_size=20)
+
+
+def partialDigest(path, size):
+    """Digest of the first and last EDGE_SIZE bytes of a file, which is the
+     digest of the whole file for files up to twice that size.
+
+    :param path: 'str' file path
+    :param size: 'int' size of the file
+    :return: 'bytes' digest, None if the file can't be read
+    """
+    digest = _digest()
+    try:
+        # buffered reads return the bytes asked for unless the file ends,
+        # a single raw read can return less over network storage
+        with open(str(path), 'rb') as stream:
+            if size <= EDGE_SIZE * 2:
+                digest.update(stream.read())
+            else:
+                digest.update(stream.read(EDGE_SIZE))
+                stream.seek(-EDGE_SIZE, os.SEEK_END)
+                digest.update(stream.read(EDGE_SIZE))
+    except OSError:
+        return None
+    return digest.digest()
+
+
+def fullDigest(path):
+    """Digest of the whole file, read in large blocks
+
+    :param path: 'str' file path
+    :return: 'bytes' digest, None if the file can't be read
+    """
+    digest = _digest()
+    buffer = bytearray(READ_SIZE)
+    view = memoryview(buffer)
+    try:
+        with open(str(path), 'rb') as stream:
+            while True:
+                count = stream.readinto(buffer)
+                if not count:
+                    break
+                digest.update(view[:count])
+    except OSError:
+        return None
+    return digest.digest()
+
+
+class DigestCache(object):
+    COMMIT_INTERVAL = 500
+
+    def __init__(self, path=None):
+        """Persistent store of file digests in SQLite, keyed by the file
+         path and only returned while the file's size and mtime match the
+         stored ones, so repeated searches only read new or changed files.
+
+        :param path: 'str' database file, defaults to the user cache directory
+        """
+        if path is None:
+            path = os.path.join(paths.cacheDir(), 'digests.db')
+        self.var_path = path
+        self._lock = threading.RLock()
+        self._pending = 0
+        # the cache is shared by the hashing threads, access is serialized by
+        # the lock
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.execute('PRAGMA journal_mode=WAL')
+        self._connection.execute('PRAGMA synchronous=NORMAL')
+        self._connection.execute(
+            'CREATE TABLE IF NOT EXISTS digests '
+            '(path TEXT PRIMARY KEY, size INTEGER, mtime REAL, partial BLOB, '
+            'full BLOB)')
+        self._connection.commit()
+
+    def close(self):
+        """Commit any pending digests and close the database"""
+        with self._lock:
+            self._connection.commit()
+            self._connection.close()
+
+    def commit(self):
+        """Write the pending digests to the database"""
+        with self._lock:
+            self._connection.commit()
+            self._pending = 0
+
+    def get(self, path, size, mtime):
+        """Stored digests of the file, if it didn't change since
+
+        :param path: 'str' file path
+        :param size: 'int' current size of the file
+        :param mtime: 'float' current mtime of the file
+        :return: 'list' partial and full digests, None for the ones that
+            aren't stored
+        """
+        with self._lock:
+            row = self._connection.execute(
+                'SELECT size, mtime, partial, full FROM digests '
+                'WHERE path = ?', (str(path),)).fetchone()
+        if row is None or row[0] != size or row[1] != mtime:
+            return None, None
+        return row[2], row[3]
+
+    def put(self, path, size, mtime, partial=None, full=None):
+        """Store the digests of the file, keeping the stored ones that aren't
+         given while the file is unchanged
+
+        :param path: 'str' file path
+        :param size: 'int' size of the file the digests were read from
+        :param mtime: 'float' mtime of the file the digests were read from
+        :param partial: 'bytes' digest of the start and end of the file
+        :param full: 'bytes' digest of the whole file
+        """
+        with self._lock:
+            stored = self.get(path, size, mtime)
+            partial = partial or stored[0]
+            full = full or stored[1]
+            self._connection.execute(
+                'INSERT OR REPLACE INTO digests VALUES (?, ?, ?, ?, ?)',
+                (str(path), size, mtime,
+                 None if partial is None else sqlite3.Binary(partial),
+                 None if full is None else sqlite3.Binary(full)))
+            self._pending += 1
+            if self._pending >= self.COMMIT_INTERVAL:
+                self.commit()
+
+
+def find(files, threads=8, cache=None, minimum=1, cancel=None):
+    """Groups of files with identical contents. Files are bucketed by size
+     first, then files sharing a size are told apart by hashing their first
+     and last EDGE_SIZE bytes, and only the files still colliding are hashed
+     completely.
+
+    :param files: 'list' file paths to search, such as the results of
+        paths.getPaths
+    :param threads: 'int' Max number of concurrent threads reading the files
+    :param cache: 'DigestCache' persistent digests of previous searches
+    :param minimum: 'int' smallest size of the files compared, empty files
+        are left out by default
+    :param cancel: 'list' Cancel the files left to be read
+        * Must be a mutable value so we can pass it by reference
+    :return: 'list' groups of at least two duplicate file paths, in the order
+        of the files, None if cancelled
+    """
+    cancel = [False] if cancel is None else cancel
+    files = list(files)
+
+    def stat(path):
+        if cancel[0]:
+            return None
+        try:
+            return os.stat(str(path))
+        except OSError:
+            return None
+
+    def partial(entry):
+        path, stats = entry
+        if cancel[0]:
+            return None
+        if cache is not None:
+            stored = cache.get(path, stats.st_size, stats.st_mtime)[0]
+            if stored:
+                return stored
+        digest = partialDigest(path, stats.st_size)
+        if digest is not None and cache is not None:
+            cache.put(path, stats.st_size, stats.st_mtime, partial=digest)
+        return digest
+
+    def full(entry):
+        path, stats = entry
+        if cancel[0]:
+            return None
+        if stats.st_size <= EDGE_SIZE * 2:
+            # the partial digest already covers the whole file
+            return b''
+        if cache is not None:
+            stored = cache.get(path, stats.st_size, stats.st_mtime)[1]
+            if stored:
+                return stored
+        digest = fullDigest(path)
+        if digest is not None and cache is not None:
+            cache.put(path, stats.st_size, stats.st_mtime, full=digest)
+        return digest
+
+    def split(groups, function, executor):
+        """Split the groups of entries by the function's digest of each"""
+        entries = [e for group in groups for e in group]
+        digests = paths.mapBounded(executor, function, entries, threads * 4)
+        buckets = collections.defaultdict(list)
+        for key, group in enumerate(groups):
+            for entry in group:
+                digest = next(digests)
+                if digest is not None:
+                    buckets[(key, digest)].append(entry)
+        return [g for g in buckets.values() if len(g) > 1]
+
+    try:
+        with concurrent.futures.ThreadPoolExecutor(threads) as executor:
+            # file sizes, stats are slow over network storage too
+            sizes = collections.defaultdict(list)
+            for path, stats in zip(files, paths.mapBounded(
+                    executor, stat, files, threads * 4)):
+                if stats is not None and stats.st_size >= minimum:
+                    sizes[stats.st_size].append((path, stats))
+            groups = [g for g in sizes.values() if len(g) > 1]
+            groups = split(groups, partial, executor)
+            groups = split(groups, full, executor)
+    finally:
+        if cache is not None:
+            cache.commit()
+    if cancel[0]:
+        return None
+    order = dict((str(f), i) for i, f in enumerate(files))
+    results = [sorted((path for path, stats in group),
+                      key=lambda p: order[str(p)]) for group in groups]
+    results.sort(key=lambda g: order[str(g[0])])
+    return results
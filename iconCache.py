@@ -0,0 +1,141 @@
+import collections
+
+
+class IconCache(object):
+    BUDGET = 256 * 1024 ** 2
+
+    def __init__(self, budget=BUDGET, cost=None, evicted=None):
+        """Dictionary of icons bounded by the bytes they use. Once over the
+         budget, the least recently used icons are evicted, skipping the
+         pinned ones, such as the icons currently visible.
+        Hits, misses and evictions are counted for 'get' lookups.
+
+        :param budget: 'int' maximum number of bytes used by the icons
+        :param cost: 'function' given an icon, returns the bytes it uses,
+            defaults to the icon's 'nbytes' method
+        :param evicted: 'function' called with the key and icon of each
+            evicted icon
+        """
+        self.var_budget = budget
+        self.var_cost = cost or (lambda value: value.nbytes())
+        self.var_evicted = evicted
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = collections.OrderedDict()
+        self._pinned = set()
+        self._bytes = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __iter__(self):
+        return iter(list(self._entries))
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def __getitem__(self, key):
+        value = self.get(key)
+        if value is None:
+            raise KeyError(key)
+        return value
+
+    def __setitem__(self, key, value):
+        self.pop(key)
+        size = self.var_cost(value)
+        self._entries[key] = (value, size)
+        self._bytes += size
+        self.evict()
+
+    def get(self, key, default=None):
+        """Icon stored for the key, marking it as recently used
+
+        :param key: 'str' key of the icon
+        :param default: value returned if no icon is stored
+        :return: 'object' icon stored for the key
+        """
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return default
+        self.hits += 1
+        self._entries.move_to_end(key)
+        return entry[0]
+
+    def peek(self, key, default=None):
+        """Icon stored for the key, without marking it as recently used or
+         counting the lookup
+
+        :param key: 'str' key of the icon
+        :param default: value returned if no icon is stored
+        :return: 'object' icon stored for the key
+        """
+        entry = self._entries.get(key)
+        if entry is None:
+            return default
+        return entry[0]
+
+    def pop(self, key, default=None):
+        """Remove the icon stored for the key
+
+        :param key: 'str' key of the icon
+        :param default: value returned if no icon is stored
+        :return: 'object' icon that was stored for the key
+        """
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return default
+        self._bytes -= entry[1]
+        return entry[0]
+
+    def pin(self, keys):
+        """Keep the icons of the keys from being evicted, replacing the
+         previously pinned keys. Pinned icons are marked as recently used.
+
+        :param keys: 'list' keys of the icons to keep
+        """
+        self._pinned = set(keys)
+        for key in self._pinned:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+        self.evict()
+
+    def evict(self):
+        """Evict the least recently used icons that aren't pinned until the
+         icons fit the budget
+
+        :return: 'int' number of icons evicted
+        """
+        count = 0
+        if self._bytes <= self.var_budget:
+            return count
+        for key in list(self._entries):
+            if self._bytes <= self.var_budget:
+                break
+            if key in self._pinned:
+                continue
+            value = self.pop(key)
+            self.evictions += 1
+            count += 1
+            if self.var_evicted is not None:
+                self.var_evicted(key, value)
+        return count
+
+    def nbytes(self):
+        """Number of bytes used by the stored icons
+
+        :return: 'int' bytes used
+        """
+        return self._bytes
+
+    def statistics(self):
+        """Counters of the cache
+
+        :return: 'dict' hits, misses, evictions, number of icons and bytes
+        """
+        return {'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'icons': len(self._entries),
+                'bytes': self._bytes}
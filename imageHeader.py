@@ -0,0 +1,198 @@
+import io
+import struct
+
+PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+TIFF_SIGNATURES = (b'II*\x00', b'MM\x00*')
+# start of frame markers holding the image size, the others in the range are
+# huffman and arithmetic coding tables
+SOF_MARKERS = set(range(0xC0, 0xD0)) - {0xC4, 0xC8, 0xCC}
+# maximum number of bytes of a JPEG read looking for its frame header
+SCAN_LIMIT = 1024 ** 2
+# maximum size of an embedded preview, larger ones are decoded instead
+PREVIEW_LIMIT = 1024 ** 2
+# maximum number of entries of a TIFF directory, larger ones are corrupt
+IFD_LIMIT = 1024
+# size of the OS/2 bitmap core header, which stores the image size in 16 bit
+# fields rather than the 32 bit ones of the later headers
+BMP_CORE_HEADER = 12
+# TIFF tags of the kind of image a directory holds, of the image size and of
+# the embedded JPEG preview
+TAG_SUBFILE_TYPE = 0x00FE
+TAG_WIDTH = 0x0100
+TAG_HEIGHT = 0x0101
+TAG_PREVIEW_OFFSET = 0x0201
+TAG_PREVIEW_LENGTH = 0x0202
+# TIFF field types holding a SHORT or a LONG value
+TYPE_SHORT = 3
+TYPE_LONG = 4
+
+
+class Header(object):
+    __slots__ = ('format', 'width', 'height', 'preview')
+
+    def __init__(self, format=None, width=0, height=0, preview=None):
+        """Information read from the header of an image file, without
+         decoding the image.
+
+        :param format: 'str' image format, 'jpeg', 'png', 'gif', 'bmp' or
+            'tiff', None if unknown
+        :param width: 'int' full resolution width, 0 if unknown
+        :param height: 'int' full resolution height, 0 if unknown
+        :param preview: 'bytes' embedded JPEG preview, None if there is none
+        """
+        self.format = format
+        self.width = width
+        self.height = height
+        self.preview = preview
+
+    def __repr__(self):
+        return '<Header: {} {}x{}{}>'.format(
+            self.format, self.width, self.height,
+            ' preview' if self.preview else '')
+
+
+def read(path):
+    """Read the header of the image file, only reading the few kilobytes
+     holding the size and embedded preview rather than the whole file.
+
+    :param path: 'str' file path of the image
+    :return: 'Header' header of the image, empty if it can't be read
+    """
+    try:
+        with open(str(path), 'rb') as stream:
+            return parse(stream)
+    except (OSError, struct.error, ValueError):
+        return Header()
+
+
+def parse(stream):
+    """Read the header of the image from the start of a seekable stream
+
+    :param stream: 'io.BufferedIOBase' binary stream of the image file
+    :return: 'Header' header of the image, empty if the format isn't known
+    """
+    start = stream.read(32)
+    if start[:2] == b'\xff\xd8':
+        stream.seek(2)
+        return _jpeg(stream)
+    if start[:8] == PNG_SIGNATURE and start[12:16] == b'IHDR':
+        width, height = struct.unpack('>II', start[16:24])
+        return Header('png', width, height)
+    if start[:6] in (b'GIF87a', b'GIF89a'):
+        width, height = struct.unpack('<HH', start[6:10])
+        return Header('gif', width, height)
+    if start[:2] == b'BM':
+        if struct.unpack('<I', start[14:18])[0] == BMP_CORE_HEADER:
+            width, height = struct.unpack('<HH', start[18:22])
+            return Header('bmp', width, height)
+        width, height = struct.unpack('<ii', start[18:26])
+        # bottom up bitmaps have a negative height
+        return Header('bmp', width, abs(height))
+    if start[:4] in TIFF_SIGNATURES:
+        header = Header('tiff')
+        _tiff(stream, 0, header)
+        return header
+    return Header()
+
+
+def _jpeg(stream):
+    """Read the segments of a JPEG up to its frame header, keeping the EXIF
+     thumbnail found on the way."""
+    header = Header('jpeg')
+    while stream.tell() < SCAN_LIMIT:
+        byte = stream.read(1)
+        if not byte:
+            break
+        if byte != b'\xff':
+            # resynchronize on the next marker
+            continue
+        marker = stream.read(1)
+        while marker == b'\xff':
+            # markers may be preceded by fill bytes
+            marker = stream.read(1)
+        if not marker:
+            break
+        marker = ord(marker)
+        if marker in (0x01, 0xD8) or 0xD0 <= marker <= 0xD7:
+            # markers without a segment
+            continue
+        if marker in (0xD9, 0xDA):
+            # the image data starts without a frame header
+            break
+        length = struct.unpack('>H', stream.read(2))[0]
+        if length < 2:
+            break
+        if marker == 0xE1 and header.preview is None:
+            data = stream.read(length - 2)
+            if data[:6] == b'Exif\x00\x00':
+                exif = Header()
+                try:
+                    _tiff(io.BytesIO(data), 6, exif)
+                except (struct.error, ValueError):
+                    # a corrupt thumbnail doesn't lose the frame size
+                    pass
+                header.preview = exif.preview
+            continue
+        if marker in SOF_MARKERS:
+            height, width = struct.unpack('>xHH', stream.read(5))
+            header.width, header.height = width, height
+            break
+        stream.seek(length - 2, io.SEEK_CUR)
+    return header
+
+
+def _tiff(stream, base, header):
+    """Read the size and embedded JPEG preview of the first two directories
+     of a TIFF structure, as used by EXIF and most camera raw formats. The
+     size is only taken from the first directory when it holds the full
+     resolution image.
+
+    :param stream: 'io.BufferedIOBase' binary stream holding the structure
+    :param base: 'int' position of the TIFF header in the stream
+    :param header: 'Header' header updated with what was found
+    """
+    stream.seek(base)
+    order = stream.read(4)
+    if order not in TIFF_SIGNATURES:
+        return
+    endian = '<' if order[:2] == b'II' else '>'
+    offset = struct.unpack(endian + 'I', stream.read(4))[0]
+    for n in range(2):
+        if not offset:
+            break
+        tags, offset = _ifd(stream, base + offset, endian)
+        # a first directory holding a reduced resolution image isn't the
+        # size of the full image
+        if n == 0 and TAG_WIDTH in tags and TAG_HEIGHT in tags and \
+                not tags.get(TAG_SUBFILE_TYPE):
+            header.width, header.height = tags[TAG_WIDTH], tags[TAG_HEIGHT]
+        start = tags.get(TAG_PREVIEW_OFFSET)
+        length = tags.get(TAG_PREVIEW_LENGTH)
+        if start and length and length <= PREVIEW_LIMIT:
+            stream.seek(base + start)
+            preview = stream.read(length)
+            if preview[:2] == b'\xff\xd8':
+                header.preview = preview
+                return
+
+
+def _ifd(stream, position, endian):
+    """Read the SHORT and LONG values of a TIFF directory
+
+    :return: 'list' dict of the values by tag, and the offset of the next
+        directory
+    """
+    stream.seek(position)
+    count = struct.unpack(endian + 'H', stream.read(2))[0]
+    if count > IFD_LIMIT:
+        raise ValueError('Invalid TIFF directory')
+    data = stream.read(count * 12 + 4)
+    tags = {}
+    for i in range(count):
+        entry = data[i * 12:i * 12 + 12]
+        tag, kind = struct.unpack(endian + 'HH', entry[:4])
+        if kind == TYPE_SHORT:
+            tags[tag] = struct.unpack(endian + 'H', entry[8:10])[0]
+        elif kind == TYPE_LONG:
+            tags[tag] = struct.unpack(endian + 'I', entry[8:12])[0]
+    return tags, struct.unpack(endian + 'I', data[count * 12:count * 12 + 4])[0]
@@ -1,5 +1,10 @@
+import array
+import bisect
+import collections
+import os
 import re
 
+import pathCatalog
 import regex
 
 
@@ -156,6 +161,8 @@ def filter(items=[], includes=[], excludes=[], required=[], starts=[],
 
 
 class FilterList(object):
+    CACHE_SIZE = 32
+
     def __init__(self, items=[], includes=[], excludes=[], required=[],
                  starts=[], ends=[], unified_excludes=False, case_sensitive=False):
         """All items that fit the different criteria of matching and excluding
@@ -186,13 +193,21 @@ class FilterList(object):
         self._ends = ends
         self._unified_excludes = unified_excludes
         self._case_sensitive = case_sensitive
-        self._indices = {}
+        self._indices = array.array('I')
+        # results of recent queries, keyed by the items version and query
+        self._cache = collections.OrderedDict()
+        self._cacheItems = None
+        self._cacheKey = None
+        self._version = 0
+        self._index = None
+        self._backend = None
 
         self._includesREGs = []
         self._excludesREGs = []
         self._requiredREGs = []
         self._startsREGs = []
         self._endsREGs = []
+        self._matcher = regex.Matcher()
 
         self._data = []
         # precompile the regexpression if any terms were passed in
@@ -238,7 +253,11 @@ class FilterList(object):
                 setattr(self, '_{}'.format(term), var)
             else:
                 # term not given, pull from class
-                exec('{0} = self._{0}'.format(term))
+                mapping[term] = getattr(self, '_{}'.format(term))
+        includes, excludes, required, starts, ends = [
+            mapping[t] for t in 'includes excludes required starts ends'.split()]
+        unified_excludes = mapping['unified_excludes']
+        case_sensitive = mapping['case_sensitive']
         # compare all the terms and make sure they're of similar types
         is_regexpression = None
         for term in includes + excludes + required + starts + ends:
@@ -254,10 +273,9 @@ class FilterList(object):
 
         includesREGs, excludesREGs, requiredREGs, startsREGs, endsREGs = [], [], [], [], []
         if is_regexpression is True:
-            # store the vars onto class
-            varTerms = 'includes excludes required starts ends'
-            for var in varTerms.split():
-                exec('{0}REGs = {0}'.format(var))
+            # the terms are already regExpressions
+            includesREGs, excludesREGs, requiredREGs, startsREGs, endsREGs = (
+                includes, excludes, required, starts, ends)
         else:
             # precompile reg expressions to speed up operations
             regs = regex.precompile(includes=includes, excludes=excludes,
@@ -275,11 +293,18 @@ class FilterList(object):
                    'ends': endsREGs}
         for term, regs in mapping.items():
             setattr(self, '_{}REGs'.format(term), regs)
+        # compile the matcher used to evaluate the items
+        self._matcher = regex.Matcher(includes=includes, excludes=excludes,
+                                      required=required, starts=starts,
+                                      ends=ends,
+                                      unified_excludes=unified_excludes,
+                                      case_sensitive=case_sensitive,
+                                      format_terms=format_terms)
         return [includesREGs, excludesREGs, requiredREGs, startsREGs, endsREGs]
 
     # --------------------------------------------------------------------------
     def run(self, items=None, includes=None, excludes=None, required=None, starts=None,
-            ends=None, unified_excludes=None, case_sensitive=None):
+            ends=None, unified_excludes=None, case_sensitive=None, cancel=None):
         """All items that fit the different criteria of matching and excluding
          the different terms.
 
@@ -298,58 +323,411 @@ class FilterList(object):
             must be valid for a match to be detected
         :param case_sensitive: 'bool' Casesensitvity will be respected in determining
             if item is valid
-        :return: 'list' The terms matching the filter parameters
+        :param cancel: 'list' Cancel an evaluation running in the backend
+            * Must be a mutable value so we can pass it by reference
+        :return: 'list' The terms matching the filter parameters, None if
+            cancelled
         """
-        # gather the regExpressions from the class
-        includesREGs = self._includesREGs
-        excludesREGs = self._excludesREGs
-        requiredREGs = self._requiredREGs
-        startsREGs = self._startsREGs
-        endsREGs = self._endsREGs
+        cancel = [False] if cancel is None else cancel
         givenTerms = [includes, excludes, required, starts, ends]
         storedTerms = [self._includes, self._excludes, self._required, self._starts, self._ends]
         termsCheck = [x for x in givenTerms if x is not None]
-        # check if given terms are valid and regex need to be recollected
+        # check if given terms are valid and the matcher needs to be recompiled
         if termsCheck and givenTerms != storedTerms:
-            varTerms = 'includes excludes required starts ends'
-            for var in varTerms.split():
-                exec('if {0} is None: {0} = []'.format(var))
-            filters = self.regFilters(includes, excludes, required, starts,
-                                      ends, unified_excludes, case_sensitive)
-            includesREGs, excludesREGs, requiredREGs, startsREGs, endsREGs = filters
-        # check if regExpressions are valid
-        if None in [includesREGs, excludesREGs, requiredREGs, startsREGs, endsREGs]:
-            t = 'search:\t{}\nexclude:\t{}\nrequired:\t{}\nstarts:\t{}\nends:\t{}'.format(*givenTerms)
-            print('Cannot handle regExpressions as None:'+t)
+            givenTerms = [[] if x is None else x for x in givenTerms]
+            self.regFilters(*givenTerms, unified_excludes=unified_excludes,
+                            case_sensitive=case_sensitive)
+        matcher = self._matcher
         # collect items to evalate
         if items is None:
             items = self._items
-        # filter the search, exclusion, required terms from the search list
-        self._data = []
-        self._indices = {}
-        for i, item in enumerate(items):
-            itemString = str(item)
-            valid = True
-            # required, starts, ends
-            for r in requiredREGs + startsREGs + endsREGs:
-                if not r.search(itemString):
-                    valid = False
-                    break
-            if not valid:
+        # reuse the results of the same query, or narrow down the results of
+        # a broader one instead of evaluating every item
+        version = self._itemsVersion(items)
+        key = (version, self._query())
+        indices = None if version is None else self._cache.get(key)
+        if indices is None:
+            candidates = None if version is None else self._candidates(key)
+            if candidates is None and self._index is not None and \
+                    self._index.var_items is items:
+                candidates = self._index.candidates(
+                    required=self._required, includes=self._includes)
+            if candidates is None and self._backend is not None and \
+                    self._backend.accepts(items, matcher):
+                indices = self._backend.run(items, key[1],
+                                            enumerate=_enumerate,
+                                            cancel=cancel)
+                if indices is None:
+                    return None
+            elif candidates is None:
+                candidates = _enumerate(items)
+            else:
+                candidates = ((i, items[i]) for i in candidates)
+            if indices is None:
+                indices = array.array('I', [i for i, item in candidates
+                                            if matcher.match(str(item))])
+            if version is not None:
+                self._cache[key] = indices
+                while len(self._cache) > self.CACHE_SIZE:
+                    self._cache.popitem(last=False)
+        else:
+            self._cache.move_to_end(key)
+        self._indices = indices
+        self._data = [items[i] for i in indices]
+        return self._data
+
+    # --------------------------------------------------------------------------
+    def setIndex(self, index=None):
+        """Use a TrigramIndex to only evaluate the items that can contain the
+         include and required terms. The index is only used when running the
+         same items it was built over.
+
+        :param index: 'TrigramIndex' index built over the items, None to
+            evaluate every item
+        """
+        self._index = index
+
+    # --------------------------------------------------------------------------
+    def setBackend(self, backend=None):
+        """Evaluate large item sets with a parallel backend, such as a
+         multiProcess.ProcessFilter. The backend is only used when no cached
+         result or index narrows the items down and it accepts the query.
+
+        :param backend: 'object' backend with 'accepts' and 'run' methods,
+            None to evaluate the items in the calling thread
+        """
+        self._backend = backend
+
+    # --------------------------------------------------------------------------
+    def indices(self):
+        """Indices into the items of the last run's matching items
+
+        :return: 'array' indices of the matching items
+        """
+        return self._indices
+
+    # --------------------------------------------------------------------------
+    def runIndices(self, *args, **kwargs):
+        """Same as run, returning the indices into the items of the matching
+         items instead of a copied list of them.
+
+        :return: 'array' indices of the matching items
+        """
+        self.run(*args, **kwargs)
+        return self._indices
+
+    # --------------------------------------------------------------------------
+    def _itemsVersion(self, items):
+        """Version of the item set, updated whenever a different or changed
+         set of items is given. Cached results of other versions are dropped.
+        Only containers counting their changes in a 'version' attribute, such
+         as a pathCatalog.PathCatalog, are cached, a list changed in place
+         can't be told apart from the one the results were cached for.
+
+        :param items: 'list' items being evaluated
+        :return: 'int' version of the items, None if they can't be cached
+        """
+        itemsVersion = getattr(items, 'version', None)
+        # holding onto the items keeps their id from being reused
+        if items is not self._cacheItems or itemsVersion != self._cacheKey:
+            self._cacheItems = items
+            self._cacheKey = itemsVersion
+            self._version += 1
+            self._cache.clear()
+        if itemsVersion is None:
+            return None
+        return self._version
+
+    def _query(self):
+        """Hashable version of the current terms and options
+
+        :return: 'tuple' terms and options
+        """
+        return (tuple(self._includes), tuple(self._excludes),
+                tuple(self._required), tuple(self._starts), tuple(self._ends),
+                bool(self._unified_excludes), bool(self._case_sensitive))
+
+    def _candidates(self, key):
+        """Find the smallest cached result of a broader query on the same
+         items, whose matching items are the only ones that can match.
+
+        :param key: 'tuple' items version and query to evaluate
+        :return: 'array' indices of the candidate items, None if all items
+            need to be evaluated
+        """
+        version, query = key
+        results = None
+        for (cacheVersion, cacheQuery), indices in self._cache.items():
+            if cacheVersion != version or not narrows(cacheQuery, query):
                 continue
-            # exclusions
-            for r in excludesREGs:
-                if r.search(itemString):
-                    valid = False
+            if results is None or len(indices) < len(results):
+                results = indices
+        return results
+
+
+class TrigramIndex(object):
+    MINIMUM_ITEMS = 20000
+
+    def __init__(self, items=[]):
+        """Inverted index from each three character sequence to the items
+         containing it, giving the candidates that can contain a term without
+         evaluating every item. Directories are indexed once for all of their
+         items and base names for each item, as a term without a separator
+         can only be found in one or the other.
+        Posting lists are sorted integer arrays of item indices, matching the
+         indices used by FilterList.
+
+        :param items: 'list' items to index
+        """
+        self.var_items = items
+        self._names = {}
+        self._directoryIds = {}
+        self._directoryItems = []
+        self._directories = {}
+        self._removed = set()
+        for i, item in _enumerate(items):
+            self.add(i, item)
+
+    def add(self, index, item):
+        """Index the item
+
+        :param index: 'int' index of the item in the items
+        :param item: 'str' item to index
+        """
+        if isinstance(item, pathCatalog.PathHandle):
+            # avoid joining the path only to split it again
+            directory, name = item.parent.lower(), item.name.lower()
+        else:
+            directory, name = os.path.split(str(item).lower())
+        directoryId = self._directoryIds.get(directory)
+        if directoryId is None:
+            directoryId = len(self._directoryItems)
+            self._directoryIds[directory] = directoryId
+            self._directoryItems.append(array.array('I'))
+            for trigram in _trigrams(directory):
+                _insert(self._directories, trigram, directoryId)
+        postings = self._directoryItems[directoryId]
+        if postings and postings[-1] >= index:
+            bisect.insort(postings, index)
+        else:
+            postings.append(index)
+        names = self._names
+        for trigram in _trigrams(name):
+            values = names.get(trigram)
+            # items are mostly added in order, appending to the postings
+            if values is not None and values[-1] < index:
+                values.append(index)
+            else:
+                _insert(names, trigram, index)
+        self._removed.discard(index)
+
+    def remove(self, index):
+        """Stop returning the item as a candidate
+
+        :param index: 'int' index of the item in the items
+        """
+        self._removed.add(index)
+
+    def candidates(self, required=[], includes=[], format_terms=True):
+        """Indices of the items that can match the required and include terms,
+         which still need to be evaluated.
+
+        :param required: 'list' terms that must all be found
+        :param includes: 'list' terms of which any must be found
+        :param format_terms: 'bool' terms will be formatted, so '*' is the only
+            wildcard
+        :return: 'array' sorted candidate indices, None if the terms can't
+            narrow down the items
+        """
+        results = None
+        for term in required:
+            candidates = self._termCandidates(term, format_terms)
+            if candidates is not None:
+                results = candidates if results is None else \
+                    _intersect(results, candidates)
+        if includes:
+            union = set()
+            for term in includes:
+                candidates = self._termCandidates(term, format_terms)
+                if candidates is None:
+                    union = None
                     break
-            if not valid:
+                union.update(candidates)
+            if union is not None:
+                union = array.array('I', sorted(union))
+                results = union if results is None else \
+                    _intersect(results, union)
+        if results is not None and self._removed:
+            results = array.array('I', [i for i in results
+                                        if i not in self._removed])
+        return results
+
+    def _termCandidates(self, term, format_terms=True):
+        """Indices of the items that can contain the term
+
+        :param term: 'str' filter term
+        :param format_terms: 'bool' term will be formatted
+        :return: 'array' sorted indices, None if the term is too short or not
+            a plain string
+        """
+        if not isinstance(term, str) or not format_terms:
+            return None
+        if not regex.isLiteral(term.replace('*', '')):
+            return None
+        # every fragment between wildcards and separators has to be found in
+        # either the directory or the name
+        fragments = re.split(r'[*/\\]', term.lower())
+        results = None
+        for fragment in fragments:
+            if len(fragment) < 3:
                 continue
-            # includes
-            for c, r in enumerate(includesREGs):
-                if not r.search(itemString):
-                    valid = False
-                    break
-            if valid:
-                self._indices[i] = item
-                self._data.append(item)
-        return self._data
\ No newline at end of file
+            candidates = self._fragmentCandidates(fragment)
+            results = candidates if results is None else \
+                _intersect(results, candidates)
+        return results
+
+    def _fragmentCandidates(self, fragment):
+        """Indices of the items whose directory or name contains all of the
+         fragment's trigrams
+
+        :param fragment: 'str' lowered fragment without separators
+        :return: 'array' sorted indices
+        """
+        trigrams = _trigrams(fragment)
+        names = _postings(self._names, trigrams)
+        directories = _postings(self._directories, trigrams)
+        results = set(names)
+        for directoryId in directories:
+            results.update(self._directoryItems[directoryId])
+        return array.array('I', sorted(results))
+
+
+def _trigrams(string):
+    """Unique three character sequences of the string"""
+    return set(string[i:i + 3] for i in range(len(string) - 2))
+
+
+def _insert(postings, key, value):
+    """Add the value to the sorted posting list of the key"""
+    values = postings.get(key)
+    if values is None:
+        postings[key] = array.array('I', [value])
+    elif values[-1] < value:
+        values.append(value)
+    else:
+        i = bisect.bisect_left(values, value)
+        if values[i] != value:
+            values.insert(i, value)
+
+
+def _postings(postings, trigrams):
+    """Intersect the posting lists of all the trigrams
+
+    :return: 'array' sorted values found in every posting list
+    """
+    lists = []
+    for trigram in trigrams:
+        values = postings.get(trigram)
+        if not values:
+            return array.array('I')
+        lists.append(values)
+    # intersect from the shortest list to keep the intermediate results small
+    lists.sort(key=len)
+    results = lists[0]
+    for values in lists[1:]:
+        results = _intersect(results, values)
+    return results
+
+
+def _intersect(first, second):
+    """Intersect two sorted integer arrays
+
+    :return: 'array' sorted values found in both
+    """
+    if len(first) > len(second):
+        first, second = second, first
+    if len(first) * 16 < len(second):
+        # look up the few values of the short list in the long one
+        results = []
+        size = len(second)
+        for value in first:
+            i = bisect.bisect_left(second, value)
+            if i < size and second[i] == value:
+                results.append(value)
+    else:
+        lookup = set(first)
+        results = [value for value in second if value in lookup]
+    return array.array('I', results)
+
+
+def _enumerate(items):
+    """Pair each item with the index used to get it back from the items
+
+    :param items: 'list' items to enumerate
+    :return: 'generator' index and item pairs
+    """
+    if isinstance(items, pathCatalog.PathCatalog):
+        # catalogs keep the indices of removed paths
+        return ((handle.index, handle) for handle in items)
+    return enumerate(items)
+
+
+def narrows(previous, query):
+    """Check if the query can only match items that the previous query
+     matched, as when typing 'tac' then 'taco', so only the previous results
+     need to be evaluated.
+
+    :param previous: 'tuple' includes, excludes, required, starts and ends
+        terms and the unified_excludes and case_sensitive options
+    :param query: 'tuple' terms and options in the same layout
+    :return: 'bool' query is a refinement of the previous query
+    """
+    if previous[5:] != query[5:]:
+        return False
+    case_sensitive = query[6]
+    includes, excludes, required, starts, ends = [
+        [_comparable(t, case_sensitive) for t in terms]
+        for terms in query[:5]]
+    oldIncludes, oldExcludes, oldRequired, oldStarts, oldEnds = [
+        [_comparable(t, case_sensitive) for t in terms]
+        for terms in previous[:5]]
+    contains = lambda term, other: term == other or (
+        isinstance(term, str) and isinstance(other, str) and other in term)
+    # every previously required term is still required
+    for old in oldRequired:
+        if not any(contains(t, old) for t in required):
+            return False
+    # every previous exclusion is still excluded
+    for old in oldExcludes:
+        if not any(contains(old, t) for t in excludes):
+            return False
+    # each of the terms can only match items the previous terms matched
+    checks = [(includes, oldIncludes, contains),
+              (starts, oldStarts, lambda term, other: term == other or (
+                  isinstance(term, str) and isinstance(other, str) and
+                  term.startswith(other))),
+              (ends, oldEnds, lambda term, other: term == other or (
+                  isinstance(term, str) and isinstance(other, str) and
+                  term.endswith(other)))]
+    for terms, oldTerms, implies in checks:
+        if not oldTerms:
+            continue
+        if not terms:
+            return False
+        for term in terms:
+            if not any(implies(term, old) for old in oldTerms):
+                return False
+    return True
+
+
+def _comparable(term, case_sensitive):
+    """Literal terms are compared as lowered strings when case insensitive,
+     any other term is only comparable to an identical term.
+
+    :param term: 'str' filter term
+    :param case_sensitive: 'bool' Case sensitivity will be respected
+    :return: 'str' comparable literal, or a tuple wrapping any other term
+    """
+    if isinstance(term, str) and regex.isLiteral(term):
+        return term if case_sensitive else term.lower()
+    return (term,)
@@ -0,0 +1,343 @@
+import array
+import concurrent.futures
+import os
+import threading
+import time
+
+try:
+    import numpy
+except ImportError:
+    # the columns are stored in arrays instead, sorting and selecting go
+    # over them item by item
+    numpy = None
+
+try:
+    from PySide2 import QtGui
+except ImportError:
+    # only the sizes of the formats parsed by imageHeader are read
+    QtGui = None
+
+import imageHeader
+import query
+
+FORMATS = (None, 'jpeg', 'png', 'gif', 'bmp', 'tiff')
+# name, numpy type and array typecode of each column
+COLUMNS = (('state', 'u1', 'B'),
+           ('format', 'u1', 'B'),
+           ('width', 'u4', 'I'),
+           ('height', 'u4', 'I'),
+           ('size', 'u8', 'Q'),
+           ('mtime', 'f8', 'd'))
+DTYPE = [(name, kind) for name, kind, code in COLUMNS]
+# fields that can be compared and sorted over the columns, 'pixels' being the
+# resolution of the image
+FIELDS = ('size', 'mtime', 'width', 'height', 'pixels')
+# states of a row
+STATE_MISSING = 0
+STATE_READ = 1
+STATE_REMOVED = 2
+
+
+class MetadataCatalog(object):
+    CHUNK_SIZE = 1000
+
+    def __init__(self, paths=None):
+        """Metadata of the images read from their file headers, stored in
+         columns sitting alongside a path list. Row i holds the metadata of
+         the path at index i, so a pathCatalog.PathCatalog's handles map
+         straight to their rows.
+        Columns are a NumPy structured array when NumPy is installed, so
+         sorting and selecting over a million rows are vectorized, and arrays
+         otherwise.
+
+        :param paths: 'list' paths the rows are aligned with, such as a
+            pathCatalog.PathCatalog
+        """
+        self.var_paths = [] if paths is None else paths
+        self._rows = None
+        self._count = 0
+        self._lock = threading.RLock()
+        self.resize()
+
+    def __len__(self):
+        return self._count
+
+    def resize(self):
+        """Add the rows of the paths added since, they're read by 'extract'
+         or 'update'"""
+        paths = self.var_paths
+        count = paths.slots() if hasattr(paths, 'slots') else len(paths)
+        with self._lock:
+            if count <= self._count:
+                return
+            if numpy is not None:
+                rows = self._rows
+                if rows is None or count > len(rows):
+                    # grow ahead of the paths, so adding a few files doesn't
+                    # copy every row
+                    capacity = count if rows is None else max(count,
+                                                              len(rows) * 2)
+                    rows = numpy.zeros(capacity, dtype=DTYPE)
+                    if self._rows is not None:
+                        rows[:self._count] = self._rows[:self._count]
+                    self._rows = rows
+            else:
+                if self._rows is None:
+                    self._rows = dict((name, array.array(code))
+                                      for name, kind, code in COLUMNS)
+                for name, kind, code in COLUMNS:
+                    self._rows[name].extend(
+                        array.array(code, [0]) * (count - self._count))
+            self._count = count
+
+    def column(self, name):
+        """Values of a column for every row
+
+        :param name: 'str' column name, one of COLUMNS or 'pixels'
+        :return: 'numpy.ndarray' values, an 'array.array' without NumPy
+        """
+        if name == 'pixels':
+            width, height = self.column('width'), self.column('height')
+            if numpy is not None:
+                return width.astype('u8') * height
+            return array.array('Q', [w * h for w, h in zip(width, height)])
+        if numpy is not None:
+            return self._rows[name][:self._count]
+        return self._rows[name]
+
+    def extract(self, indices=None, threads=16, cancel=None):
+        """Read the headers of the rows on a pool of threads, the reads are
+         bound by the file system rather than the interpreter.
+
+        :param indices: 'list' rows to read, defaults to the rows that
+            weren't read yet
+        :param threads: 'int' Max number of concurrent threads
+        :param cancel: 'list' Cancel the rows left to be read
+            * Must be a mutable value so we can pass it by reference
+        :return: 'int' number of rows read, None if cancelled
+        """
+        cancel = [False] if cancel is None else cancel
+        self.resize()
+        if indices is None:
+            state = self.column('state')
+            if numpy is not None:
+                indices = numpy.flatnonzero(state == STATE_MISSING).tolist()
+            else:
+                indices = [i for i, s in enumerate(state)
+                           if s == STATE_MISSING]
+        chunks = [indices[i:i + self.CHUNK_SIZE]
+                  for i in range(0, len(indices), self.CHUNK_SIZE)]
+        count = 0
+        with concurrent.futures.ThreadPoolExecutor(threads) as executor:
+            for read in executor.map(lambda c: self._read(c, cancel), chunks):
+                count += read
+        if cancel[0]:
+            return None
+        return count
+
+    def update(self, items):
+        """Read the headers of the given paths again, such as files that were
+         added or modified since the catalog was extracted.
+
+        :param items: 'list' handles or indices of the paths
+        :return: 'int' number of rows read
+        """
+        self.resize()
+        return self._read([getattr(i, 'index', i) for i in items])
+
+    def invalidate(self, items):
+        """Mark the rows of the given paths to be read again by 'extract',
+         such as files that were added or modified since the catalog was
+         extracted.
+
+        :param items: 'list' handles or indices of the paths
+        """
+        self.resize()
+        with self._lock:
+            state = self.column('state')
+            for item in items:
+                index = getattr(item, 'index', item)
+                if index < self._count:
+                    state[index] = STATE_MISSING
+
+    def remove(self, indices):
+        """Mark the rows of removed paths, they're left out of 'select' and
+         'sort'
+
+        :param indices: 'list' indices of the removed paths
+        """
+        with self._lock:
+            state = self.column('state')
+            for i in indices:
+                if i < self._count:
+                    state[i] = STATE_REMOVED
+
+    def metadata(self, item):
+        """Metadata of a path for the query predicates, see
+         query.statMetadata
+
+        :param item: 'pathCatalog.PathHandle' handle or index of the path
+        :return: 'dict' size, mtime, width and height of the file, empty if
+            it wasn't read
+        """
+        index = getattr(item, 'index', item)
+        if index >= self._count or \
+                self.column('state')[index] != STATE_READ:
+            return {}
+        data = {'size': int(self.column('size')[index]),
+                'mtime': float(self.column('mtime')[index]),
+                'format': FORMATS[self.column('format')[index]]}
+        if self.column('width')[index]:
+            data['width'] = int(self.column('width')[index])
+            data['height'] = int(self.column('height')[index])
+        return data
+
+    def select(self, predicates, now=None):
+        """Rows passing the query predicates that can be compared over the
+         columns, the others are returned to be checked per item.
+
+        :param predicates: 'list' query.Predicate to check
+        :param now: 'float' time the mtime ages are measured from
+        :return: 'list' indices of the passing rows in order, and the
+            predicates that weren't checked
+        """
+        now = time.time() if now is None else now
+        remaining = [p for p in predicates if p.var_field not in FIELDS]
+        compared = [p for p in predicates if p.var_field in FIELDS]
+        with self._lock:
+            state = self.column('state')
+            if numpy is not None:
+                mask = state == STATE_READ
+                for predicate in compared:
+                    mask &= self._mask(predicate, now)
+                return numpy.flatnonzero(mask), remaining
+            checks = [self._check(p, now) for p in compared]
+            indices = [i for i, s in enumerate(state) if s == STATE_READ and
+                       all(check(i) for check in checks)]
+        return array.array('I', indices), remaining
+
+    def sort(self, field, reverse=False):
+        """Rows in order of a field, leaving out the removed and unread rows
+
+        :param field: 'str' field to sort by, one of FIELDS
+        :param reverse: 'bool' largest values first
+        :return: 'list' indices of the rows in order
+        """
+        if field not in FIELDS:
+            raise ValueError('Can not sort by {}'.format(field))
+        with self._lock:
+            values = self.column(field)
+            state = self.column('state')
+            if numpy is not None:
+                indices = numpy.flatnonzero(state == STATE_READ)
+                keys = values[indices]
+                if reverse:
+                    # negated rather than flipped, so equal values stay in
+                    # path order
+                    keys = -keys.astype('f8')
+                order = numpy.argsort(keys, kind='stable')
+                return indices[order]
+            indices = [i for i, s in enumerate(state) if s == STATE_READ]
+            indices.sort(key=values.__getitem__, reverse=reverse)
+        return array.array('I', indices)
+
+    def maximum(self, field):
+        """Largest value of a field over the read rows
+
+        :param field: 'str' field, one of FIELDS
+        :return: 'float' largest value, 0 if no row was read
+        """
+        with self._lock:
+            values = self.column(field)
+            state = self.column('state')
+            if numpy is not None:
+                values = values[state == STATE_READ]
+                return values.max() if len(values) else 0
+            return max((v for v, s in zip(values, state)
+                        if s == STATE_READ), default=0)
+
+    def nbytes(self):
+        """Number of bytes used by the columns
+
+        :return: 'int' bytes used
+        """
+        if self._rows is None:
+            return 0
+        if numpy is not None:
+            return self._rows.nbytes
+        return sum(c.itemsize * len(c) for c in self._rows.values())
+
+    def _mask(self, predicate, now):
+        """Rows passing a predicate, compared over the NumPy columns"""
+        values = self.column(predicate.var_field)
+        if predicate.var_field == 'mtime':
+            values = now - values
+        result = query.OPERATORS[predicate.var_operator](values,
+                                                        predicate.var_value)
+        if predicate.var_negate:
+            result = ~result
+        if predicate.var_field in ('width', 'height', 'pixels'):
+            # the size of formats that weren't parsed is unknown
+            result &= self.column('width') > 0
+        return result
+
+    def _check(self, predicate, now):
+        """Function checking a row against a predicate, over the array
+         columns"""
+        values = self.column(predicate.var_field)
+        widths = self.column('width')
+        compare = query.OPERATORS[predicate.var_operator]
+        value = predicate.var_value
+        negate = predicate.var_negate
+        sized = predicate.var_field in ('width', 'height', 'pixels')
+        age = predicate.var_field == 'mtime'
+
+        def check(index):
+            if sized and not widths[index]:
+                return False
+            data = now - values[index] if age else values[index]
+            return compare(data, value) != negate
+        return check
+
+    def _read(self, indices, cancel=None):
+        """Read the headers of the rows, writing them all at once
+
+        :return: 'int' number of rows read
+        """
+        cancel = [False] if cancel is None else cancel
+        if cancel[0]:
+            return 0
+        paths = self.var_paths
+        results = []
+        for index in indices:
+            path = str(paths[index])
+            try:
+                stat = os.stat(path)
+            except OSError:
+                results.append((index, STATE_REMOVED, 0, 0, 0, 0, 0))
+                continue
+            header = imageHeader.read(path)
+            width, height = header.width, header.height
+            if not width and QtGui is not None:
+                # the other formats are left to the image readers, the same
+                # as the metadata read per file
+                size = QtGui.QImageReader(path).size()
+                if size.isValid():
+                    width, height = size.width(), size.height()
+            results.append((index, STATE_READ, FORMATS.index(header.format),
+                            width, height, stat.st_size, stat.st_mtime))
+        self._write(results)
+        return len(results)
+
+    def _write(self, results):
+        """Store rows of (index, state, format, width, height, size, mtime)"""
+        with self._lock:
+            if numpy is not None:
+                rows = self._rows
+                for result in results:
+                    rows[result[0]] = result[1:]
+            else:
+                columns = [self._rows[name] for name, kind, code in COLUMNS]
+                for result in results:
+                    for column, value in zip(columns, result[1:]):
+                        column[result[0]] = value
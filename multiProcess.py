@@ -0,0 +1,384 @@
+import array
+import concurrent.futures
+import mmap
+import multiprocessing
+import os
+import queue
+import tempfile
+
+try:
+    from multiprocessing import shared_memory
+except ImportError:
+    # added in python 3.8, older versions share a memory mapped file instead
+    shared_memory = None
+
+import regex
+
+SEPARATOR = b'\0'
+
+
+class SharedBlob(object):
+    def __init__(self, data=b'', name=None, size=None, writable=False):
+        """Block of bytes shared between processes without being pickled,
+         using shared memory when available and a memory mapped temporary
+         file otherwise. The creating process owns the blob and must close
+         it; other processes attach to it by name.
+
+        :param data: 'bytes' data to share when creating the blob
+        :param name: 'str' name of an existing blob to attach to
+        :param size: 'int' number of bytes to allocate when creating the blob,
+            defaults to the size of the data
+        :param writable: 'bool' attach to the blob for writing
+        """
+        self.var_owner = name is None
+        self._memory = None
+        self._file = None
+        self._map = None
+        if size is None:
+            size = len(data)
+        if name is None:
+            if shared_memory:
+                self._memory = shared_memory.SharedMemory(create=True,
+                                                          size=max(1, size))
+                self._memory.buf[:len(data)] = data
+                name = self._memory.name
+            else:
+                handle, name = tempfile.mkstemp(prefix='imageBrowser_')
+                with os.fdopen(handle, 'wb') as f:
+                    f.write(data)
+                    f.truncate(max(1, size))
+            writable = True
+        else:
+            if shared_memory and not os.path.isfile(name):
+                self._memory = shared_memory.SharedMemory(name=name)
+        if self._memory is None:
+            self._file = open(name, 'r+b' if writable else 'rb')
+            access = mmap.ACCESS_WRITE if writable else mmap.ACCESS_READ
+            self._map = mmap.mmap(self._file.fileno(), 0, access=access)
+        self.var_name = name
+        self.var_size = size
+
+    @property
+    def buffer(self):
+        """Memory view of the shared bytes"""
+        if self._memory is not None:
+            return self._memory.buf
+        return memoryview(self._map)
+
+    def close(self):
+        """Detach from the blob, removing it if this process created it"""
+        if self._memory is not None:
+            self._memory.close()
+            if self.var_owner:
+                self._memory.unlink()
+            self._memory = None
+        if self._map is not None:
+            self._map.close()
+            self._file.close()
+            if self.var_owner:
+                os.remove(self.var_name)
+            self._map = None
+
+
+_blobs = {}
+_matchers = {}
+_cancel = None
+
+
+def _initialize(cancel):
+    """Store the cancel event shared with the worker process"""
+    global _cancel
+    _cancel = cancel
+
+
+def _filterChunk(name, start, end, first, query):
+    """Evaluate a chunk of the encoded items in a worker process
+
+    :param name: 'str' name of the shared blob of encoded items
+    :param start: 'int' byte offset of the first item of the chunk
+    :param end: 'int' byte offset after the last item of the chunk
+    :param first: 'int' position of the first item of the chunk
+    :param query: 'tuple' includes, excludes, required, starts and ends terms
+        and the unified_excludes and case_sensitive options
+    :return: 'bytes' positions of the matching items, None if cancelled
+    """
+    blob = _blobs.get(name)
+    if blob is None:
+        # only the latest items are kept attached
+        for old in _blobs.values():
+            old.close()
+        _blobs.clear()
+        blob = _blobs[name] = SharedBlob(name=name)
+    matcher = _matchers.get(query)
+    if matcher is None:
+        includes, excludes, required, starts, ends = [list(t) for t in query[:5]]
+        matcher = regex.Matcher(includes=includes, excludes=excludes,
+                                required=required, starts=starts, ends=ends,
+                                unified_excludes=query[5],
+                                case_sensitive=query[6])
+        _matchers.clear()
+        _matchers[query] = matcher
+    data = bytes(blob.buffer[start:end]).decode('utf-8', 'surrogateescape')
+    match = matcher.match
+    results = array.array('I')
+    for i, item in enumerate(data.split('\0')):
+        if i % 10000 == 0 and _cancel is not None and _cancel.is_set():
+            return None
+        if match(item):
+            results.append(first + i)
+    return results.tobytes()
+
+
+class ProcessFilter(object):
+    THRESHOLD = 200000
+    CHUNK_SIZE = 50000
+
+    def __init__(self, processes=None, threshold=THRESHOLD,
+                 chunk_size=CHUNK_SIZE):
+        """Filter backend evaluating chunks of the items in a pool of worker
+         processes, for queries too heavy for a single thread. The items are
+         encoded once into a shared blob that all queries on the same items
+         reuse, so only chunk offsets and the terms are sent to the workers.
+
+        :param processes: 'int' number of worker processes, defaults to the
+            number of cores
+        :param threshold: 'int' minimum number of items worth sending to the
+            worker processes
+        :param chunk_size: 'int' number of items evaluated in each task
+        """
+        self.var_processes = processes or os.cpu_count() or 1
+        self.var_threshold = threshold
+        self.var_chunk_size = chunk_size
+        self._executor = None
+        self._cancel = None
+        self._blob = None
+        self._items = None
+        self._itemsKey = None
+        self._chunks = []
+        self._indices = None
+
+    def accepts(self, items, matcher):
+        """Check if the backend should evaluate the items, which is only worth
+         it for many items and queries that fall back to regExpressions.
+
+        :param items: 'list' items to evaluate
+        :param matcher: 'regex.Matcher' compiled terms
+        :return: 'bool' backend should be used
+        """
+        return len(items) >= self.var_threshold and not matcher.isLiteral()
+
+    def close(self):
+        """Shut down the worker processes and remove the shared blob"""
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+        if self._blob is not None:
+            self._blob.close()
+            self._blob = None
+        self._items = None
+
+    def _encode(self, items, enumerate=enumerate):
+        """Encode the items into a shared blob, split into chunks of item
+         positions and byte offsets.
+
+        :param items: 'list' items to encode
+        :param enumerate: 'function' pairs each item with its index
+        """
+        itemsKey = (len(items), getattr(items, 'version', None))
+        if items is self._items and itemsKey == self._itemsKey:
+            return
+        if self._blob is not None:
+            self._blob.close()
+        indices = array.array('I')
+        strings = []
+        for i, item in enumerate(items):
+            indices.append(i)
+            strings.append(str(item))
+        chunks = []
+        data = bytearray()
+        for first in range(0, len(strings), self.var_chunk_size):
+            chunk = strings[first:first + self.var_chunk_size]
+            start = len(data)
+            data.extend('\0'.join(chunk).encode('utf-8', 'surrogateescape'))
+            chunks.append((start, len(data), first))
+            data.extend(SEPARATOR)
+        self._blob = SharedBlob(bytes(data))
+        self._chunks = chunks
+        self._indices = indices
+        self._items = items
+        self._itemsKey = itemsKey
+
+    def run(self, items, query, enumerate=enumerate, cancel=None):
+        """Evaluate the items in the worker processes
+
+        :param items: 'list' items to evaluate
+        :param query: 'tuple' includes, excludes, required, starts and ends
+            terms and the unified_excludes and case_sensitive options
+        :param enumerate: 'function' pairs each item with its index
+        :param cancel: 'list' Cancel the evaluation
+            * Must be a mutable value so we can pass it by reference
+        :return: 'array' indices of the matching items in order, None if
+            cancelled
+        """
+        cancel = [False] if cancel is None else cancel
+        self._encode(items, enumerate)
+        if self._executor is None:
+            context = multiprocessing.get_context('spawn')
+            self._cancel = context.Event()
+            self._executor = concurrent.futures.ProcessPoolExecutor(
+                max_workers=self.var_processes, mp_context=context,
+                initializer=_initialize, initargs=(self._cancel,))
+        self._cancel.clear()
+        futures = [self._executor.submit(_filterChunk, self._blob.var_name,
+                                         start, end, first, query)
+                   for start, end, first in self._chunks]
+        pending = set(futures)
+        while pending:
+            if cancel[0]:
+                self._cancel.set()
+                for future in pending:
+                    future.cancel()
+                return None
+            done, pending = concurrent.futures.wait(pending, timeout=0.05)
+        results = array.array('I')
+        for future in futures:
+            positions = array.array('I')
+            data = future.result()
+            if data is None:
+                return None
+            positions.frombytes(data)
+            results.extend(self._indices[p] for p in positions)
+        return results
+
+
+def _decodeImage(name, offset, path, size):
+    """Decode the image scaled down to fit the size and write its RGBA pixels
+     into the shared blob, in a worker process.
+
+    :param name: 'str' name of the shared blob of slots
+    :param offset: 'int' byte offset of the slot to write to
+    :param path: 'str' file path of the image
+    :param size: 'int' maximum width and height of the decoded image
+    :return: 'tuple' width, height and bytes per line of the written image
+        and the width and height of the full image, None if it can't be read
+    """
+    # only the decoding processes need Qt
+    from PySide2 import QtCore, QtGui
+    blob = _blobs.get(name)
+    if blob is None:
+        blob = _blobs[name] = SharedBlob(name=name, writable=True)
+    reader = QtGui.QImageReader(path)
+    native = reader.size()
+    if native.isValid() and (native.width() > size or native.height() > size):
+        reader.setScaledSize(native.scaled(size, size,
+                                           QtCore.Qt.KeepAspectRatio))
+    image = reader.read()
+    if image.isNull():
+        return None
+    if image.width() > size or image.height() > size:
+        image = image.scaled(size, size, QtCore.Qt.KeepAspectRatio,
+                             QtCore.Qt.SmoothTransformation)
+    image = image.convertToFormat(QtGui.QImage.Format_RGBA8888)
+    count = image.bytesPerLine() * image.height()
+    blob.buffer[offset:offset + count] = bytes(image.constBits())[:count]
+    if not native.isValid():
+        native = image.size()
+    return (image.width(), image.height(), image.bytesPerLine(),
+            native.width(), native.height())
+
+
+class Thumbnail(object):
+    __slots__ = ('slot', 'width', 'height', 'bytesPerLine', 'nativeWidth',
+                 'nativeHeight')
+
+    def __init__(self, slot, width, height, bytesPerLine, nativeWidth,
+                 nativeHeight):
+        """Descriptor of a decoded image written into a slot of the shared
+         blob of a ProcessDecoder."""
+        self.slot = slot
+        self.width = width
+        self.height = height
+        self.bytesPerLine = bytesPerLine
+        self.nativeWidth = nativeWidth
+        self.nativeHeight = nativeHeight
+
+
+class ProcessDecoder(object):
+    SIZE = 256
+
+    def __init__(self, processes=None, size=SIZE, slots=None):
+        """Image decoding backend running in a pool of worker processes, which
+         aren't limited by the GIL. The workers decode and scale the images
+         into fixed size slots of RGBA pixels in a shared blob, only the small
+         Thumbnail descriptors are sent back. The slots are reused once the
+         thumbnail is released, so the number of slots bounds the number of
+         images in flight.
+
+        :param processes: 'int' number of worker processes, defaults to the
+            number of cores
+        :param size: 'int' maximum width and height of the decoded images
+        :param slots: 'int' number of images that can be decoded and waiting
+            at once, defaults to four per process
+        """
+        self.var_processes = processes or os.cpu_count() or 1
+        self.var_size = size
+        self.var_slots = slots or self.var_processes * 4
+        self.var_slot_bytes = size * size * 4
+        self._blob = SharedBlob(size=self.var_slot_bytes * self.var_slots)
+        self._free = queue.Queue()
+        for slot in range(self.var_slots):
+            self._free.put(slot)
+        self._executor = concurrent.futures.ProcessPoolExecutor(
+            max_workers=self.var_processes,
+            mp_context=multiprocessing.get_context('spawn'))
+
+    def close(self):
+        """Shut down the worker processes and remove the shared blob"""
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+        if self._blob is not None:
+            self._blob.close()
+            self._blob = None
+
+    def decode(self, path):
+        """Decode the image in a worker process, waiting for a free slot.
+        The thumbnail has to be released once its image is used.
+
+        :param path: 'str' file path of the image
+        :return: 'Thumbnail' descriptor of the decoded image, None if it can't
+            be read
+        """
+        slot = self._free.get()
+        try:
+            result = self._executor.submit(
+                _decodeImage, self._blob.var_name,
+                slot * self.var_slot_bytes, str(path), self.var_size).result()
+        except Exception:
+            self._free.put(slot)
+            raise
+        if result is None:
+            self._free.put(slot)
+            return None
+        return Thumbnail(slot, *result)
+
+    def image(self, thumbnail):
+        """Wrap the pixels of the thumbnail in a QImage without copying them.
+        The image is only valid until the thumbnail is released.
+
+        :param thumbnail: 'Thumbnail' descriptor of the decoded image
+        :return: 'QtGui.QImage' image of the thumbnail
+        """
+        from PySide2 import QtGui
+        offset = thumbnail.slot * self.var_slot_bytes
+        count = thumbnail.bytesPerLine * thumbnail.height
+        data = self._blob.buffer[offset:offset + count]
+        return QtGui.QImage(data, thumbnail.width, thumbnail.height,
+                            thumbnail.bytesPerLine, QtGui.QImage.Format_RGBA8888)
+
+    def release(self, thumbnail):
+        """Free the slot of the thumbnail for the next image
+
+        :param thumbnail: 'Thumbnail' descriptor of the decoded image
+        """
+        self._free.put(thumbnail.slot)
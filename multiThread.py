@@ -1,26 +1,41 @@
-import datetime
+import collections
+import concurrent.futures
+import heapq
+import itertools
+import threading
+import time
 
 from PySide2 import QtCore
 
 
-class ThreadPool(object):
-    def __init__(self, functionArgs=[], functionKwargs=[], function=None,
-                 results=[], name='', pause=False, cancel=[False],
+class ThreadPool(QtCore.QObject):
+    signal_progress = QtCore.Signal(str, int, int)
+    signal_complete = QtCore.Signal(object)
+
+    PROGRESS_INTERVAL = 0.1
+
+    def __init__(self, functionArgs=None, functionKwargs=None, function=None,
+                 results=None, name='', pause=False, cancel=None,
                  maxThreadCount=30, mainThread=False, classObj=None,
-                 parent=None):
+                 parent=None, queueSize=None):
         """This class can be used to reduce the amount of time it takes to
          run an repetitive operation by running a function on separate
          concurrent threads.
+        Only a bounded number of calls are queued at once, so large argument
+         lists or generators don't create a task for every call up front.
+        Use 'submit' for single futures, 'map' for the results in order of the
+         arguments, or 'run' to collect the results into 'results'.
 
         :param functionArgs: 'list', Arguments to be passed into each
-            function call
+            function call, can be any iterable
         :param functionKwargs: 'list' Keyword args to be passed into each
-            function call
+            function call, can be any iterable
         :param function: 'function' Function to be called in each separate thread
         :param results: 'list' Returns collected from each function call
         :param name: 'string' Name of multiThreaded operation
         :param pause: 'bool' Lock process until ThreadPool is finished
-        :param cancel: 'list' Cancel all remaining threads left to be processed
+        :param cancel: 'list' Cancel all remaining threads left to be processed,
+            each pool gets its own if not given
             * Must be a mutable value so we can pass it by reference
         :param maxThreadCount: 'int' Max number of concurrent threads
         :param mainThread: bool, run batch operation on the mainThread, instead
@@ -29,128 +44,337 @@ class ThreadPool(object):
              are done
         :param parent: 'QtCore.QObject' threads can be associated to a
             QtCore.QObject
+        :param queueSize: 'int' Max number of calls queued or running at once,
+            defaults to four times the maxThreadCount
         """
-
-        # self.startEvent = events.Event()
-        # self.cancelEvent = events.Event()
-        # self.completeEvent = events.Event()
-        # self.processEvent = events.Event()
-        # self.processEvent.connect(self.incrementCounter)
-
+        super(ThreadPool, self).__init__(parent)
         self.totalThreads = None
         self.completedThreads = 0
 
         self.name = name
-        self.functionArgs = functionArgs
-        self.functionKwargs = functionKwargs
+        self.functionArgs = [] if functionArgs is None else functionArgs
+        self.functionKwargs = [] if functionKwargs is None else functionKwargs
         self.function = function
         self.mainThread = mainThread
-        self.results = results
+        self.results = [] if results is None else results
         self.pause = pause
-        self.cancel = cancel # Must be a mutable value so we can pass it by reference
+        self.cancel = [False] if cancel is None else cancel # Must be a mutable value so we can pass it by reference
         self.maxThreadCount = maxThreadCount
         self.classObj = classObj
-        self.parent = parent
+        self.queueSize = queueSize or maxThreadCount * 4
+
+        self._executor = None
+        self._lock = threading.Lock()
+        self._queue = threading.BoundedSemaphore(self.queueSize)
+        self._progressTime = 0
 
     def incrementCounter(self, *args, **kwargs):
-        """Counts up on the number of completed threads in the pool and
-         emits a signal when complete."""
-        self.completedThreads += 1
-        print('{}\t{} / {}'.format(self.name, self.completedThreads,
-                                   self.totalThreads))
-        if self.completedThreads == self.totalThreads:
-            # self.completeEvent(self.classObj)
-            print(self.name, 'thread',
-                  datetime.datetime.now().strftime("%y-%m-%d_%H_%M_%S"))
+        """Counts up on the number of completed threads in the pool, emitting
+         the progress at a throttled rate and a signal when complete."""
+        with self._lock:
+            self.completedThreads += 1
+            completed = self.completedThreads
+            now = time.time()
+            complete = completed == self.totalThreads
+            if not complete and now - self._progressTime < self.PROGRESS_INTERVAL:
+                return
+            self._progressTime = now
+        total = -1 if self.totalThreads is None else self.totalThreads
+        self.signal_progress.emit(self.name, completed, total)
+        if complete:
+            self.signal_complete.emit(self.classObj)
+
+    def cancelAll(self):
+        """Cancel the calls that haven't started yet, running calls finish
+         but their results are dropped."""
+        self.cancel[0] = True
+
+    def shutdown(self, wait=True):
+        """Stop the threads of the pool once their calls are done
+
+        :param wait: 'bool' Lock process until the running calls are done
+        """
+        if self._executor is not None:
+            self._executor.shutdown(wait=wait)
+            self._executor = None
+
+    def submit(self, *args, **kwargs):
+        """Queue a single call of the function, waiting for a free slot when
+         the queue is full.
+
+        :param args: Arguments to be passed into the function call
+        :param kwargs: Keyword args to be passed into the function call
+        :return: 'concurrent.futures.Future' result of the call
+        """
+        if self._executor is None:
+            self._executor = concurrent.futures.ThreadPoolExecutor(
+                max_workers=self.maxThreadCount,
+                thread_name_prefix=self.name or 'ThreadPool')
+        self._queue.acquire()
+        try:
+            future = self._executor.submit(self._call, args, kwargs)
+        except Exception:
+            self._queue.release()
+            raise
+        future.add_done_callback(self._release)
+        return future
+
+    def map(self, functionArgs=None, functionKwargs=None):
+        """Run the function over the arguments, keeping at most 'queueSize'
+         calls in flight.
+
+        :param functionArgs: 'list' Arguments to be passed into each function
+            call, defaults to the pool's
+        :param functionKwargs: 'list' Keyword args to be passed into each
+            function call, defaults to the pool's
+        :return: 'generator' results in the order of the arguments, stops
+            early when cancelled
+        """
+        if functionArgs is None:
+            functionArgs = self.functionArgs
+        if functionKwargs is None:
+            functionKwargs = self.functionKwargs
+        calls = self._calls(functionArgs, functionKwargs)
+        pending = collections.deque()
+        try:
+            for args, kwargs in calls:
+                if self.cancel[0]:
+                    return
+                if self.mainThread:
+                    # debug on the main thead to catch errors in the debugger
+                    yield self._call(args, kwargs)
+                    continue
+                # collect finished results before the queue blocks
+                while len(pending) >= self.queueSize:
+                    yield pending.popleft().result()
+                pending.append(self.submit(*args, **kwargs))
+            while pending:
+                if self.cancel[0]:
+                    return
+                yield pending.popleft().result()
+        finally:
+            for future in pending:
+                future.cancel()
 
     def run(self):
-        """Run the threadpool with the given class parameters"""
-        # balance the argument inputs by filling in any mismatches
-        argsList = list(self.functionArgs)
-        kwargsList = list(self.functionKwargs)
-        argCount = len(self.functionArgs)
-        kwargCount = len(self.functionKwargs)
-        for i in range(min([argCount, kwargCount]), max([argCount, kwargCount])):
-            if argCount < kwargCount:
-                argsList.extend([[] for i in range(kwargCount-argCount)])
-            elif kwargCount < argCount:
-                kwargsList.extend([{} for i in range(argCount-kwargCount)])
-
-        self.totalThreads = len(argsList)
+        """Run the threadpool with the given class parameters, collecting the
+         non empty results into 'results'.
+
+        :return: 'list' results collected so far, all of them if paused
+        """
         self.completedThreads = 0
+        if self.pause or self.mainThread:
+            self._collect()
+        else:
+            thread = threading.Thread(target=self._collect,
+                                      name='{}Collect'.format(self.name))
+            thread.daemon = True
+            thread.start()
+        return self.results
+
+    def _calls(self, functionArgs, functionKwargs):
+        """Pair up the args and kwargs of each call, filling in any mismatches
+
+        :return: 'generator' args and kwargs of each call
+        """
+        try:
+            self.totalThreads = max(len(functionArgs), len(functionKwargs))
+        except TypeError:
+            # generators don't know their length
+            self.totalThreads = None
+        for args, kwargs in itertools.zip_longest(functionArgs, functionKwargs):
+            yield args or [], kwargs or {}
+
+    def _call(self, args, kwargs):
+        """Run a single function call, skipped once the pool is cancelled"""
+        if self.cancel[0]:
+            return None
+        try:
+            return self.function(*args, **kwargs)
+        finally:
+            self.incrementCounter()
 
-        threadpool = QtCore.QThreadPool.globalInstance()
-        threadpool.setMaxThreadCount(self.maxThreadCount)
-        for args, kwargs in zip(argsList, kwargsList):
-            if self.mainThread:
-                # debug on the main thead to catch errors in the debugger
-                result = self.function(*args, **kwargs)
-                if result:
+    def _collect(self):
+        """Store the results of all the calls in order"""
+        try:
+            for result in self.map():
+                if not result:
+                    continue
+                with self._lock:
                     if isinstance(self.results, list):
                         self.results.append(result)
                     else:
                         self.results.update(result)
-                continue
-            # initialize a thread
-            runnable = ThreadPoolRunnable(args=args,
-                                          kwargs=kwargs,
-                                          function=self.function,
-                                          results=self.results,
-                                          cancel=self.cancel,
-                                          parent=self.parent)
-            # runnable.startEvent.connect(self.startEvent)
-            # runnable.cancelEvent.connect(self.cancelEvent)
-            # runnable.completeEvent.connect(self.processEvent)
-            # runnable.cancelEvent.connect(self.cancelEvent)
-            threadpool.start(runnable)
-        if self.pause:
-            threadpool.waitForDone()
-
-
-class ThreadPoolRunnable(QtCore.QObject, QtCore.QRunnable):
-    def __init__(self, args=[], kwargs={}, function=None, results=[],
-                 cancel=[False], parent=None):
-        """This class is used to hook into a thread for one of the concurrent
-        operations.
-
-        :param args: 'list', Arguments to be passed into the function call
-        :param kwargs: 'list' Keyword args to be passed into the function call
-        :param function: 'function' Function to be executed
-        :param results: 'list' Returns collected from each function call
-        :param cancel: 'list' Cancel all remaining threads left to be processed
-            * Must be a mutable value so we can pass it by reference
-        :param parent: 'QtCore.QObject' threads can be associated to a
-            QtCore.QObject
-        """
-        # Be sure to run the __init__ of both parent classes, or else you
-        # will get crashes.
-        QtCore.QObject.__init__(self, parent)
-        QtCore.QRunnable.__init__(self)
+        finally:
+            if not self.mainThread:
+                self.shutdown(wait=False)
 
-        # self.startEvent = events.Event()
-        # self.completeEvent = events.Event()
-        # self.cancelEvent = events.Event()
+    def _release(self, future):
+        """Free the queue slot of a finished call"""
+        self._queue.release()
 
-        self.args = args
-        self.kwargs = kwargs
+
+class PriorityPool(object):
+    def __init__(self, function=None, maxThreadCount=8, name=''):
+        """Pool of threads running the queued calls with the lowest priority
+         first. Calls are queued by a key, so their priority can be changed
+         or they can be cancelled while they wait, such as thumbnails of
+         cells that scrolled out of view.
+
+        :param function: 'function' Function called by default for each call
+        :param maxThreadCount: 'int' Max number of concurrent threads
+        :param name: 'string' Name of multiThreaded operation
+        """
+        self.name = name
         self.function = function
-        self.results = results
-        self.cancel = cancel
+        self.maxThreadCount = maxThreadCount
+        self._heap = []
+        self._entries = {}
+        self._counter = itertools.count()
+        self._condition = threading.Condition()
+        self._threads = []
+        self._running = 0
+        self._shutdown = False
 
-    def run(self):
-        """Runs the function operation in a seprate thread"""
-        if self.cancel[0]:
-            # self.cancelEvent.emit()
-            print('cancel')
-            return
-        self.startEvent.emit(self.args)
-        result = self.function(*self.args, **self.kwargs)
-        if result:
-            if isinstance(self.results, list):
-                self.results.append(result)
-            else:
-                self.results.update(result)
-        if self.cancel[0]:
-            # self.cancelEvent.emit()
-            return
-        # self.completeEvent.emit(result)
\ No newline at end of file
+    def submit(self, key, args=(), kwargs=None, priority=0, function=None):
+        """Queue a call, or change the priority of the call already queued
+         with the same key.
+
+        :param key: 'object' hashable key identifying the call
+        :param args: 'list' Arguments to be passed into the function call
+        :param kwargs: 'dict' Keyword args to be passed into the function call
+        :param priority: 'float' calls with lower priorities run first
+        :param function: 'function' Function to call, defaults to the pool's
+        :return: 'concurrent.futures.Future' result of the call
+        """
+        with self._condition:
+            if self._shutdown:
+                raise RuntimeError('cannot submit to a pool after shutdown')
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._push(key, priority, entry[3])
+                return entry[3][3]
+            future = concurrent.futures.Future()
+            call = (function or self.function, args, kwargs or {}, future)
+            self._push(key, priority, call)
+            if len(self._threads) < self.maxThreadCount:
+                thread = threading.Thread(
+                    target=self._work,
+                    name='{}{}'.format(self.name or 'PriorityPool',
+                                       len(self._threads)))
+                thread.daemon = True
+                thread.start()
+                self._threads.append(thread)
+            self._condition.notify()
+        return future
+
+    def prioritize(self, key, priority):
+        """Change the priority of a queued call
+
+        :param key: 'object' key of the call
+        :param priority: 'float' calls with lower priorities run first
+        :return: 'bool' call was still queued
+        """
+        with self._condition:
+            entry = self._entries.get(key)
+            if entry is None:
+                return False
+            self._push(key, priority, entry[3])
+            return True
+
+    def cancel(self, key):
+        """Remove a queued call, running calls aren't interrupted
+
+        :param key: 'object' key of the call
+        :return: 'bool' call was still queued
+        """
+        with self._condition:
+            entry = self._entries.pop(key, None)
+            if entry is None:
+                return False
+            # entries are dropped from the heap lazily as they come up
+            entry[2] = None
+        entry[3][3].cancel()
+        return True
+
+    def retain(self, keys):
+        """Cancel the queued calls whose key isn't given
+
+        :param keys: 'list' keys of the calls to keep
+        :return: 'int' number of calls cancelled
+        """
+        keys = set(keys)
+        with self._condition:
+            removals = [k for k in self._entries if k not in keys]
+        for key in removals:
+            self.cancel(key)
+        return len(removals)
+
+    def cancelAll(self):
+        """Cancel all the queued calls"""
+        return self.retain([])
+
+    def pending(self):
+        """Number of queued calls
+
+        :return: 'int' calls waiting to run
+        """
+        return len(self._entries)
+
+    def idle(self):
+        """Check if no call is queued or running
+
+        :return: 'bool' pool is idle
+        """
+        with self._condition:
+            return not self._entries and not self._running
+
+    def shutdown(self, wait=True):
+        """Cancel the queued calls and stop the threads
+
+        :param wait: 'bool' Lock process until the running calls are done
+        """
+        self.cancelAll()
+        with self._condition:
+            self._shutdown = True
+            self._condition.notify_all()
+        if wait:
+            for thread in self._threads:
+                thread.join()
+
+    def _push(self, key, priority, call):
+        """Queue the call, replacing the key's previous entry, with the lock
+         held"""
+        previous = self._entries.get(key)
+        if previous is not None:
+            previous[2] = None
+        entry = [priority, next(self._counter), key, call]
+        self._entries[key] = entry
+        heapq.heappush(self._heap, entry)
+
+    def _work(self):
+        """Run the queued calls in order of priority until shut down"""
+        while True:
+            with self._condition:
+                while True:
+                    if self._heap:
+                        entry = heapq.heappop(self._heap)
+                        if entry[2] is None:
+                            # replaced or cancelled
+                            continue
+                        del self._entries[entry[2]]
+                        self._running += 1
+                        break
+                    if self._shutdown:
+                        return
+                    self._condition.wait()
+            function, args, kwargs, future = entry[3]
+            try:
+                if future.set_running_or_notify_cancel():
+                    try:
+                        future.set_result(function(*args, **kwargs))
+                    except Exception as e:
+                        future.set_exception(e)
+            finally:
+                with self._condition:
+                    self._running -= 1
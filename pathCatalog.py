@@ -0,0 +1,259 @@
+import array
+import os
+
+
+def sortKey(path):
+    """Sort key matching the order of pathlib.WindowsPath, comparing the
+     case-folded parts of the path.
+
+    :param path: 'str' file path
+    :return: 'list' case-folded path parts
+    """
+    return os.path.normcase(path).replace('\\', '/').lower().split('/')
+
+
+class PathHandle(object):
+    __slots__ = ('catalog', 'index')
+
+    def __init__(self, catalog, index):
+        """Lightweight reference to a path stored in a PathCatalog, standing
+         in for a pathlib.Path. The path string is only built when asked for.
+
+        :param catalog: 'PathCatalog' catalog storing the path
+        :param index: 'int' index of the path in the catalog
+        """
+        self.catalog = catalog
+        self.index = index
+
+    def __str__(self):
+        return self.catalog.path(self.index)
+
+    def __fspath__(self):
+        return self.catalog.path(self.index)
+
+    def __repr__(self):
+        return '<PathHandle: {}>'.format(self.catalog.path(self.index))
+
+    def __eq__(self, other):
+        if isinstance(other, PathHandle) and other.catalog is self.catalog:
+            return other.index == self.index
+        return str(self) == str(other)
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __lt__(self, other):
+        return sortKey(str(self)) < sortKey(str(other))
+
+    def __hash__(self):
+        return hash(str(self))
+
+    @property
+    def name(self):
+        return self.catalog.name(self.index)
+
+    @property
+    def suffix(self):
+        return os.path.splitext(self.catalog.name(self.index))[1]
+
+    @property
+    def stem(self):
+        return os.path.splitext(self.catalog.name(self.index))[0]
+
+    @property
+    def parent(self):
+        return self.catalog.directory(self.index)
+
+
+class PathCatalog(object):
+    # fraction of the stored paths added at once above which the lookup order
+    # is sorted again on the next lookup, rather than inserted into
+    REORDER_RATIO = 0.125
+
+    def __init__(self, paths=[]):
+        """Compact storage for large lists of paths. Directory prefixes are
+         interned once and base names are stored in a single encoded buffer
+         with offset arrays, costing a few bytes per path instead of a
+         pathlib.Path object each. Paths are handed out as PathHandle.
+        Removed paths are only marked, so handles given out stay valid;
+         'sorted' returns a new catalog without them.
+
+        :param paths: 'list' paths, strings or handles to store
+        """
+        self._directories = []
+        self._directoryIds = {}
+        self._names = bytearray()
+        self._offsets = array.array('Q', [0])
+        self._parents = array.array('I')
+        self._removed = set()
+        self._order = None
+        # counts every change to the stored paths, so cached results can
+        # tell when they're out of date
+        self.version = 0
+        # number of paths stored in sorted order by 'sorted', the paths
+        # appended after them aren't
+        self.ordered = 0
+        self.extend(paths)
+
+    def __len__(self):
+        return len(self._parents) - len(self._removed)
+
+    def __iter__(self):
+        removed = self._removed
+        for i in range(len(self._parents)):
+            if i not in removed:
+                yield PathHandle(self, i)
+
+    def __getitem__(self, index):
+        """Handle of the path stored at the given index, indices are kept
+         when paths are removed."""
+        if index < 0:
+            index += len(self._parents)
+        if not 0 <= index < len(self._parents):
+            raise IndexError('PathCatalog index out of range')
+        return PathHandle(self, index)
+
+    def __contains__(self, path):
+        return self.find(path) is not None
+
+    def append(self, path):
+        """Store the path
+
+        :param path: 'str' path to store
+        :return: 'PathHandle' handle of the stored path
+        """
+        directory, name = os.path.split(str(path))
+        directoryId = self._directoryIds.get(directory)
+        if directoryId is None:
+            directoryId = len(self._directories)
+            self._directories.append(directory)
+            self._directoryIds[directory] = directoryId
+        self._names.extend(name.encode('utf-8', 'surrogateescape'))
+        self._offsets.append(len(self._names))
+        self._parents.append(directoryId)
+        index = len(self._parents) - 1
+        if self._order is not None:
+            # keep the lookup order sorted rather than sorting all the paths
+            # again on the next lookup
+            self._order.insert(self._search(self.path(index)), index)
+        self.version += 1
+        return PathHandle(self, index)
+
+    def extend(self, paths):
+        """Store all the paths
+
+        :param paths: 'list' paths to store
+        :return: 'list' handles of the stored paths
+        """
+        if self._order is not None:
+            paths = list(paths)
+            if len(paths) > len(self._order) * self.REORDER_RATIO:
+                # sorting once is cheaper than inserting each of the paths
+                self._order = None
+        return [self.append(p) for p in paths]
+
+    def remove(self, paths):
+        """Mark the paths as removed
+
+        :param paths: 'list' paths to remove
+        :return: 'list' indices of the removed paths
+        """
+        results = []
+        for path in paths:
+            index = self.find(path)
+            if index is not None:
+                self._removed.add(index)
+                self.version += 1
+                results.append(index)
+        return results
+
+    def slots(self):
+        """Number of paths stored including the removed ones, indices of the
+         paths are within this range
+
+        :return: 'int' number of indices
+        """
+        return len(self._parents)
+
+    def name(self, index):
+        """Base name of the path at the index"""
+        data = self._names[self._offsets[index]:self._offsets[index + 1]]
+        return data.decode('utf-8', 'surrogateescape')
+
+    def directory(self, index):
+        """Directory of the path at the index"""
+        return self._directories[self._parents[index]]
+
+    def path(self, index):
+        """Full path string at the index"""
+        return os.path.join(self._directories[self._parents[index]],
+                            self.name(index))
+
+    def strings(self):
+        """Iterate over the path strings
+
+        :return: 'generator' full path strings
+        """
+        for handle in self:
+            yield self.path(handle.index)
+
+    def find(self, path):
+        """Look up the index of the path, using a binary search over a sorted
+         index order built on the first lookup, and kept sorted as paths are
+         added.
+
+        :param path: 'str' path to look up
+        :return: 'int' index of the path or None if not stored
+        """
+        path = str(path)
+        if self._order is None:
+            order = sorted(range(len(self._parents)), key=self.path)
+            self._order = array.array('I', order)
+        order = self._order
+        # a path removed and stored again is kept under both indices
+        for position in range(self._search(path), len(order)):
+            index = order[position]
+            if self.path(index) != path:
+                break
+            if index not in self._removed:
+                return index
+        return None
+
+    def _search(self, path):
+        """Position of the first path not sorting before the path in the
+         lookup order, with a binary search.
+
+        :param path: 'str' path to look up
+        :return: 'int' position in the lookup order
+        """
+        order = self._order
+        low, high = 0, len(order)
+        while low < high:
+            middle = (low + high) // 2
+            if self.path(order[middle]) < path:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    def sorted(self, key=sortKey):
+        """New catalog of the stored paths in sorted order, leaving out
+         removed paths.
+
+        :param key: 'function' sort key given each path string
+        :return: 'PathCatalog' sorted catalog
+        """
+        catalog = PathCatalog(sorted(self.strings(), key=key))
+        catalog.ordered = len(catalog)
+        return catalog
+
+    def nbytes(self):
+        """Approximate number of bytes used by the stored paths
+
+        :return: 'int' bytes used
+        """
+        size = len(self._names)
+        size += self._offsets.itemsize * len(self._offsets)
+        size += self._parents.itemsize * len(self._parents)
+        size += sum(len(d) for d in self._directories)
+        return size
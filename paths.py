@@ -1,15 +1,26 @@
+import collections
+import concurrent.futures
 import os
 import pathlib
+import re
+import shutil
 import subprocess
+import time
 
 import scandir
 
+import pathCatalog
 import regex
 
+IGNORE_FILE = '.imagebrowserignore'
+# directories listed ahead of the concurrent walk, per thread
+LOOKAHEAD = 4
+
 
 def getPaths(paths=[], includes=[], excludes=[], required=[], prefixes=[],
              extensions=[], unified_excludes=False, subfolders=True,
              case_sensitive=False, find_files=True, find_dirs=True, files=[],
+             ignore_file=IGNORE_FILE, threads=1, index=None, compact=False,
              signal=None):
     """Find file/directory path under the root path that matching the terms given
 
@@ -33,8 +44,207 @@ def getPaths(paths=[], includes=[], excludes=[], required=[], prefixes=[],
     :param find_dirs: 'bool' gather all valid directory paths
     :param files: 'list' Use this given list, instead of searching them
         from the given paths
+    :param ignore_file: 'str' name of gitignore-style files whose rules
+        prune matching entries from the search
+    :param threads: 'int' number of directories listed concurrently, which
+        speeds up searches on network filesystems
+    :param index: 'scanIndex.ScanIndex' answers directory listings from its
+        stored entries instead of listing the filesystem
+    :param compact: 'bool' Return the paths in a pathCatalog.PathCatalog
+        instead of creating a pathlib.Path for each one
     :param signal: 'Signal' Emits all valid file paths as they are evaluated
-    :return: 'list' matching file list
+    :return: 'list' matching file list, or a 'PathCatalog' if compact
+    """
+    paths = _validatePaths(paths, files)
+    if not paths and not files:
+        return []
+
+    # compile the terms to speed up operations
+    matcher = regex.Matcher(includes=includes, excludes=excludes,
+                            required=required, starts=prefixes, ends=extensions,
+                            unified_excludes=unified_excludes,
+                            case_sensitive=case_sensitive)
+
+    searchList = []
+    if files:
+        # filter the given list of files
+        for f in files:
+            if matcher.matchName(f.name) and matcher.matchPath(str(f)):
+                searchList.append(str(f))
+    else:
+        # find all the files, filtering each entry as it's found so only the
+        # matching paths are created
+        pruneREGs = _pruneRegs(excludes, matcher)
+        for path in paths:
+            for root, dirs, files in walk(path, subfolders=subfolders,
+                                          excludes=pruneREGs,
+                                          ignore_file=ignore_file,
+                                          case_sensitive=case_sensitive,
+                                          threads=threads, index=index):
+                entries = []
+                if find_dirs:
+                    entries.extend(dirs)
+                if find_files:
+                    entries.extend(files)
+                for entry in entries:
+                    if not matcher.matchName(entry.name):
+                        continue
+                    if not matcher.matchPath(entry.path):
+                        continue
+                    searchList.append(entry.path)
+    if compact:
+        searchList = pathCatalog.PathCatalog(searchList).sorted()
+    else:
+        searchList = [pathlib.WindowsPath(p) for p in searchList]
+        searchList.sort()
+
+    if signal:
+        for f in searchList:
+            signal.emit(f)
+    return searchList
+
+
+def iterPaths(paths=[], includes=[], excludes=[], required=[], prefixes=[],
+              extensions=[], unified_excludes=False, subfolders=True,
+              case_sensitive=False, find_files=True, find_dirs=True,
+              ignore_file=IGNORE_FILE, threads=1, index=None, compact=False,
+              batch_size=256, batch_interval=0.05, signal=None):
+    """Find file/directory paths under the root path that match the terms
+     given, yielding valid paths in batches as soon as they are found instead
+     of waiting for the whole search to finish.
+    Entries are sorted per directory, so the order is stable but not globally
+     sorted like getPaths.
+
+    :param paths: 'list' directories to search for files
+    :param includes: 'list' item will be valid if they contain any terms
+        from this list
+    :param excludes: 'list' item will not be valid if they contain any terms
+        from this list
+    :param required: 'list' item will only be valid if they all terms from
+        this list
+    :param prefixes: 'list' item will be valid if they start with any terms
+        from this list
+    :param extensions: 'list' item will be valid if they end with any terms
+        from this list
+    :param unified_excludes: 'bool' combines all exclude terms so that all
+        must be valid for a match to be detected
+    :param subfolders: 'bool' search will include all child directories
+    :param case_sensitive: 'bool' Case sensitvity will be respected in
+        determining if item is valid
+    :param find_files: 'bool' gathers all valid file paths
+    :param find_dirs: 'bool' gather all valid directory paths
+    :param ignore_file: 'str' name of gitignore-style files whose rules
+        prune matching entries from the search
+    :param threads: 'int' number of directories listed concurrently, which
+        speeds up searches on network filesystems
+    :param index: 'scanIndex.ScanIndex' answers directory listings from its
+        stored entries instead of listing the filesystem
+    :param compact: 'bool' Return the paths in a pathCatalog.PathCatalog
+        instead of creating a pathlib.Path for each one
+    :param batch_size: 'int' max number of paths in each batch
+    :param batch_interval: 'float' seconds after which a partial batch is
+        yielded, so sparse matches still show up quickly
+    :param signal: 'Signal' Emits each batch of valid paths as it is yielded
+    :return: 'generator' lists of matching paths, or a 'PathCatalog' for
+        each batch if compact
+    """
+    paths = _validatePaths(paths)
+    if not paths:
+        return
+    matcher = regex.Matcher(includes=includes, excludes=excludes,
+                            required=required, starts=prefixes, ends=extensions,
+                            unified_excludes=unified_excludes,
+                            case_sensitive=case_sensitive)
+    pruneREGs = _pruneRegs(excludes, matcher)
+    batchType = pathCatalog.PathCatalog if compact else list
+    pathType = str if compact else pathlib.WindowsPath
+    batch = batchType()
+    batchTime = time.time()
+    for path in paths:
+        for root, dirs, files in walk(path, subfolders=subfolders,
+                                      excludes=pruneREGs,
+                                      ignore_file=ignore_file,
+                                      case_sensitive=case_sensitive,
+                                      threads=threads, index=index):
+            entries = []
+            if find_dirs:
+                entries.extend(dirs)
+            if find_files:
+                entries.extend(files)
+            entries.sort(key=lambda e: e.name)
+            for entry in entries:
+                if not matcher.matchName(entry.name):
+                    continue
+                if not matcher.matchPath(entry.path):
+                    continue
+                batch.append(pathType(entry.path))
+                if len(batch) >= batch_size:
+                    if signal:
+                        signal.emit(batch)
+                    yield batch
+                    batch = batchType()
+                    batchTime = time.time()
+            # flush partial batches so the first results are not held back
+            # while walking large directories with few matches
+            if batch and time.time() - batchTime >= batch_interval:
+                if signal:
+                    signal.emit(batch)
+                yield batch
+                batch = batchType()
+                batchTime = time.time()
+    if batch:
+        if signal:
+            signal.emit(batch)
+        yield batch
+
+
+def cacheDir(*names):
+    """Directory for caches that persist between sessions, created if it
+     doesn't exist yet.
+
+    :param names: 'str' sub directories under the cache directory
+    :return: 'str' cache directory path
+    """
+    root = os.environ.get('LOCALAPPDATA') or os.environ.get('XDG_CACHE_HOME')
+    if not root:
+        root = os.path.join(os.path.expanduser('~'), '.cache')
+    path = os.path.join(root, 'imageBrowser', *names)
+    if not os.path.isdir(path):
+        os.makedirs(path)
+    return path
+
+
+def mapBounded(executor, function, items, window):
+    """Results of the function over the items in order, keeping at most the
+     window of calls queued on the executor, so millions of items don't
+     queue a call and hold a result each. Calls still queued are cancelled
+     when the results stop being consumed.
+
+    :param executor: 'concurrent.futures.Executor' executor running the calls
+    :param function: 'function' function given each item
+    :param items: 'list' items to call the function with, can be any iterable
+    :param window: 'int' max number of calls queued at once
+    :return: 'generator' results of each call
+    """
+    pending = collections.deque()
+    try:
+        for item in items:
+            if len(pending) >= window:
+                yield pending.popleft().result()
+            pending.append(executor.submit(function, item))
+        while pending:
+            yield pending.popleft().result()
+    finally:
+        for future in pending:
+            future.cancel()
+
+
+def _validatePaths(paths=[], files=[]):
+    """Normalize the given root paths, returning no paths if any are invalid
+
+    :param paths: 'list' directories to search for files
+    :param files: 'list' files given instead of searching the paths
+    :return: 'list' normalized directory paths
     """
     if isinstance(paths, str):
         paths = [paths]
@@ -49,79 +259,277 @@ def getPaths(paths=[], includes=[], excludes=[], required=[], prefixes=[],
                 message = '{}\n\t{}'.format(message, path)
     if message:
         return []
-    paths = [os.path.normpath(p) for p in paths]
+    return [os.path.normpath(p) for p in paths]
 
-    fileList = []
-    pathList = []
-    if files:
-        fileList = files
 
-    # find all the files
-    if not fileList:
-        for path in paths:
-            for root, dirs, files in scandir.walk(path):
-                fileList.extend([pathlib.WindowsPath(os.path.join(root, f)) for f in files])
-                pathList.extend([pathlib.WindowsPath(os.path.join(root, d)) for d in dirs])
-                if not subfolders:
+def walk(path, subfolders=True, excludes=[], ignore_file=IGNORE_FILE,
+         case_sensitive=False, threads=1, index=None):
+    """Walk the directory tree top-down, listing each directory's entries as
+     scandir.DirEntry objects. Directories matching an exclude regExpression
+     and entries matching the rules of ignore files are pruned before they
+     are ever listed.
+
+    :param path: 'str' root directory to walk
+    :param subfolders: 'bool' walk will include all child directories
+    :param excludes: 'list' precompiled regExpressions, any directory whose
+        path matches will not be walked
+    :param ignore_file: 'str' name of gitignore-style files whose rules apply
+        to the directory they're in and all of its children
+    :param case_sensitive: 'bool' Case sensitivity will be respected when
+        matching ignore rules
+    :param threads: 'int' number of directories listed concurrently. Useful
+        on network filesystems where each listing waits on a round-trip; the
+        results are yielded in the same order as a serial walk, and 'dirs'
+        can be pruned in place the same way.
+    :param index: 'scanIndex.ScanIndex' answers directory listings from its
+        stored entries, only listing directories it hasn't stored yet
+    :return: 'generator' (root, dirs, files) with lists of DirEntry sorted
+        by name
+    """
+    try:
+        if threads > 1 and subfolders:
+            for result in _walkConcurrent(path, excludes, ignore_file,
+                                          case_sensitive, threads, index):
+                yield result
+            return
+        stack = [(path, [])]
+        while stack:
+            root, rules = stack.pop()
+            dirs, files, rules = scanDirectory(root, rules, excludes,
+                                               ignore_file, case_sensitive,
+                                               index)
+            yield root, dirs, files
+            if not subfolders:
+                break
+            # push in reverse so the children are walked in sorted order
+            for entry in reversed(dirs):
+                if not entry.is_symlink():
+                    stack.append((entry.path, rules))
+    finally:
+        if index is not None:
+            index.commit()
+
+
+def _walkConcurrent(path, excludes=[], ignore_file=IGNORE_FILE,
+                    case_sensitive=False, threads=8, index=None):
+    """Walk the directory tree listing directories on a pool of threads.
+    The directories next in the order of the serial walk are listed ahead on
+     the pool, at most LOOKAHEAD times the threads at once, so the listings
+     held in memory stay bounded on large trees. Children are only queued
+     once their parent is consumed, so removing entries from 'dirs' prunes
+     them the same as with the serial walk.
+
+    :param path: 'str' root directory to walk
+    :param excludes: 'list' precompiled regExpressions of directories to prune
+    :param ignore_file: 'str' name of gitignore-style files to read rules from
+    :param case_sensitive: 'bool' Case sensitivity will be respected when
+        matching ignore rules
+    :param threads: 'int' max number of directories listed concurrently
+    :param index: 'scanIndex.ScanIndex' answers directory listings from its
+        stored entries
+    :return: 'generator' (root, dirs, files) with lists of DirEntry sorted
+        by name
+    """
+    executor = concurrent.futures.ThreadPoolExecutor(max_workers=threads)
+    window = threads * LOOKAHEAD
+    # directories left to walk as [root, rules, future], the last one is
+    # walked next and the future is set once its listing is queued
+    stack = [[path, [], None]]
+    queued = 0
+    try:
+        while stack:
+            # queue the listings of the directories walked next
+            for entry in reversed(stack):
+                if queued >= window:
                     break
+                if entry[2] is None:
+                    entry[2] = executor.submit(scanDirectory, entry[0],
+                                               entry[1], excludes, ignore_file,
+                                               case_sensitive, index)
+                    queued += 1
+            root, rules, future = stack.pop()
+            queued -= 1
+            dirs, files, rules = future.result()
+            yield root, dirs, files
+            # push in reverse so the children are walked in sorted order
+            for entry in reversed(dirs):
+                if not entry.is_symlink():
+                    stack.append([entry.path, rules, None])
+    finally:
+        # drop the listings queued ahead if the walk was abandoned early
+        for entry in stack:
+            if entry[2] is not None:
+                entry[2].cancel()
+        executor.shutdown(wait=True)
 
-    # collect search list
-    searchList = []
-    if find_dirs:
-        searchList.extend(pathList)
-    if find_files:
-        searchList.extend(fileList)
-    searchList.sort()
-
-    # precompile reg expressions to speed up operations
-    regs = regex.precompile(includes=includes, excludes=excludes,
-                            required=required, starts=prefixes, ends=extensions,
-                            unified_excludes=unified_excludes,
-                            case_sensitive=case_sensitive)
-    includesREGs, excludesREGs, requiredREGs, prefixREGs, extensionREGs = regs
 
-    # filter the search, exclusion, required and extension terms from the list
-    results = []
-    for f in searchList:
-        valid = True
-        # required
-        for r in requiredREGs:
-            if not r.search(f):
-                valid = False
-                break
-        if not valid:
+def readIgnoreFile(path, case_sensitive=False):
+    """Parse the gitignore-style rules of an ignore file. Blank lines and
+     lines starting with '#' are skipped, '!' negates a rule, a trailing '/'
+     only matches directories and any other '/' anchors the rule to the
+     directory of the ignore file.
+
+    :param path: 'str' ignore file path
+    :param case_sensitive: 'bool' Case sensitivity will be respected when
+        matching the rules
+    :return: 'list' (base directory prefix, regExpression, negate,
+        directory only)
+    """
+    caseFlag = 0 if case_sensitive else re.IGNORECASE
+    # the paths of the entries are matched relative to the directory of the
+    # ignore file, by slicing off its path
+    base = os.path.join(os.path.dirname(path), '')
+    rules = []
+    try:
+        with open(path) as f:
+            lines = f.read().splitlines()
+    except (OSError, UnicodeDecodeError):
+        return rules
+    for line in lines:
+        line = line.rstrip()
+        if not line or line.startswith('#'):
             continue
-        # extensions
-        for r in extensionREGs:
-            if not r.search(f):
-                valid = False
-                break
-        if not valid:
+        negate = line.startswith('!')
+        if negate:
+            line = line[1:]
+        dirOnly = line.endswith('/')
+        line = line.strip('/') if dirOnly else line
+        anchored = '/' in line
+        line = line.lstrip('/')
+        if not line:
             continue
-        # excludes
-        for r in excludesREGs:
-            if r.search(f):
-                valid = False
-                break
-        if not valid:
+        pattern = _translateGlob(line)
+        if not anchored:
+            pattern = '(?:.*/)?' + pattern
+        rules.append((base, re.compile(pattern + '$', caseFlag), negate, dirOnly))
+    return rules
+
+
+def _translateGlob(pattern):
+    """Convert a gitignore glob into a regExpression pattern
+
+    :param pattern: 'str' glob pattern using '/' separators
+    :return: 'str' regExpression pattern
+    """
+    result = ''
+    i = 0
+    while i < len(pattern):
+        if pattern.startswith('**/', i):
+            result += '(?:.*/)?'
+            i += 3
+        elif pattern.startswith('**', i):
+            result += '.*'
+            i += 2
+        elif pattern[i] == '*':
+            result += '[^/]*'
+            i += 1
+        elif pattern[i] == '?':
+            result += '[^/]'
+            i += 1
+        elif pattern[i] == '[' and ']' in pattern[i + 1:]:
+            end = pattern.index(']', i + 1)
+            result += '[{}]'.format(pattern[i + 1:end].replace('!', '^', 1))
+            i = end + 1
+        else:
+            result += re.escape(pattern[i])
+            i += 1
+    return result
+
+
+def _isIgnored(path, isDir, rules):
+    """Check the path against the ignore rules, the last matching rule wins
+
+    :param path: 'str' full path of the entry
+    :param isDir: 'bool' entry is a directory
+    :param rules: 'list' rules collected from readIgnoreFile
+    :return: 'bool' entry should be ignored
+    """
+    ignored = False
+    prefix = None
+    relative = None
+    for base, r, negate, dirOnly in rules:
+        if dirOnly and not isDir:
             continue
-        # prefix
-        for r in prefixREGs:
-            if not r.search(f.name):
-                valid = False
-                break
-        if not valid:
+        if base != prefix:
+            # rules of the same ignore file share the relative path
+            if not path.startswith(base):
+                continue
+            prefix = base
+            relative = path[len(base):].replace(os.sep, '/')
+        if r.match(relative):
+            ignored = not negate
+    return ignored
+
+
+def listDirectory(path):
+    """List the entries of a single directory
+
+    :param path: 'str' directory to list
+    :return: 'list' scandir.DirEntry sorted by name
+    """
+    try:
+        return sorted(scandir.scandir(path), key=lambda e: e.name)
+    except OSError:
+        return []
+
+
+def scanDirectory(path, rules=[], excludes=[], ignore_file=IGNORE_FILE,
+                  case_sensitive=False, index=None):
+    """List a single directory, splitting its entries into directories and
+     files while pruning excluded directories and ignored entries.
+
+    :param path: 'str' directory to list
+    :param rules: 'list' ignore rules inherited from parent directories
+    :param excludes: 'list' precompiled regExpressions of directories to prune
+    :param ignore_file: 'str' name of gitignore-style files to read rules from
+    :param case_sensitive: 'bool' Case sensitivity will be respected when
+        matching ignore rules
+    :param index: 'scanIndex.ScanIndex' answers the listing from its stored
+        entries instead of the filesystem
+    :return: 'list' directory entries, file entries and the rules that apply
+        to the children of this directory
+    """
+    if index is not None:
+        entries = index.listing(path)
+    else:
+        entries = listDirectory(path)
+    if ignore_file and any(e.name == ignore_file for e in entries):
+        ignorePath = os.path.join(path, ignore_file)
+        rules = rules + readIgnoreFile(ignorePath, case_sensitive)
+    dirs = []
+    files = []
+    for entry in entries:
+        try:
+            isDir = entry.is_dir()
+        except OSError:
+            continue
+        if rules and _isIgnored(entry.path, isDir, rules):
             continue
-        # includes
-        for r in includesREGs:
-            if not r.search(f):
-                valid = False
+        if not isDir:
+            files.append(entry)
+            continue
+        excluded = False
+        for r in excludes:
+            if r.search(entry.path):
+                excluded = True
                 break
-        if valid:
-            if signal:
-                signal.emit(f)
-            results.append(f)
-    return results
+        if not excluded:
+            dirs.append(entry)
+    return dirs, files, rules
+
+
+def _pruneRegs(excludes, matcher):
+    """Collect the exclude terms that are safe to prune directories with. Any
+     descendant of a directory matching a plain string term will match the
+     same term, but a given regExpression could be anchored.
+
+    :param excludes: 'list' exclude terms given to the search
+    :param matcher: 'regex.Matcher' compiled terms of the search
+    :return: 'list' exclude terms for pruning directories
+    """
+    if matcher.excludes and all(isinstance(t, str) for t in excludes):
+        return [matcher.excludes]
+    return []
 
 
 # ------------------------------------------------------------------------------
@@ -153,7 +561,8 @@ def duplicate(source='', target='', force=False):
 
     results = []
     if os.path.isdir(source):
-        sourceFiles = getPaths(source)
+        sourceFiles = [str(f) for f in getPaths(source, find_dirs=False,
+                                                compact=True)]
         targetFiles = [f.replace(source, target) for f in sourceFiles]
     else:
         sourceFiles = [source]
@@ -183,7 +592,8 @@ def move(source='', target='', force=False):
 
     results = []
     if os.path.isdir(source):
-        sourceFiles = paths.getPaths(source)
+        sourceFiles = [str(f) for f in getPaths(source, find_dirs=False,
+                                                compact=True)]
         targetFiles = [f.replace(source, target) for f in sourceFiles]
     else:
         sourceFiles = [source]
@@ -0,0 +1,161 @@
+import functools
+import itertools
+import traceback
+
+from PySide2 import QtCore
+
+import multiThread
+
+
+class Pipeline(QtCore.QObject):
+    signal_result = QtCore.Signal(str, int, object)
+    signal_error = QtCore.Signal(str, int, object)
+
+    def __init__(self, parent=None):
+        """Runs the stages of the browser, such as scanning and filtering, on
+         background threads. Requests are debounced, and each request of a
+         stage starts a new generation that cancels the work of the previous
+         one, so only the results of the latest request are applied.
+        Stage functions are generators given a cancel flag, each value they
+         yield is emitted on the main thread through 'signal_result' along
+         with the stage name and generation, exceptions they raise are
+         printed and emitted through 'signal_error'.
+
+        :param parent: 'QtCore.QObject' parent of the pipeline
+        """
+        super(Pipeline, self).__init__(parent)
+        self._generations = {}
+        self._counter = itertools.count(1)
+        self._cancels = {}
+        self._requests = {}
+        self._timers = {}
+        self._pools = {}
+        self._futures = {}
+        self.signal_error.connect(self.on_error)
+
+    def on_request(self, stage, function, args=(), delay=0):
+        """Run the stage function once no other request of the stage comes in
+         for the delay, replacing any pending request of the stage.
+
+        :param stage: 'str' name of the stage
+        :param function: 'function' generator function given the args and a
+            'cancel' keyword argument
+        :param args: 'list' Arguments to be passed into the function call
+        :param delay: 'int' milliseconds to wait for further requests
+        """
+        self._requests[stage] = (function, args)
+        timer = self._timers.get(stage)
+        if timer is None:
+            timer = QtCore.QTimer(self)
+            timer.setSingleShot(True)
+            timer.timeout.connect(lambda: self.on_start(stage))
+            self._timers[stage] = timer
+        if delay:
+            timer.start(delay)
+        else:
+            timer.stop()
+            self.on_start(stage)
+
+    def on_start(self, stage):
+        """Start the pending request of the stage as a new generation,
+         cancelling the previous one.
+
+        :param stage: 'str' name of the stage
+        """
+        request = self._requests.pop(stage, None)
+        if request is None:
+            return
+        function, args = request
+        self.on_cancel(stage)
+        pool = self._pools.get(stage)
+        if pool is None:
+            pool = multiThread.PriorityPool(name=stage, maxThreadCount=1)
+            self._pools[stage] = pool
+        previous = self._generations.get(stage)
+        if previous is not None:
+            # drop the previous request if it's still waiting on the one
+            # before it
+            pool.cancel(previous)
+        generation = next(self._counter)
+        cancel = [False]
+        self._generations[stage] = generation
+        self._cancels[stage] = cancel
+        future = pool.submit(
+            generation, args=(stage, generation, function, args, cancel),
+            function=self._run)
+        future.add_done_callback(functools.partial(self._done, stage,
+                                                   generation))
+        self._futures[stage] = future
+
+    def on_cancel(self, stage):
+        """Cancel the running generation of the stage
+
+        :param stage: 'str' name of the stage
+        """
+        cancel = self._cancels.pop(stage, None)
+        if cancel is not None:
+            cancel[0] = True
+
+    def on_error(self, stage, generation, error):
+        """Forget the generation of the stage that failed, it's no longer
+         running.
+        Called by 'signal_error' signal.
+
+        :param stage: 'str' name of the stage
+        :param generation: 'int' generation that failed
+        :param error: 'Exception' exception raised by the stage function
+        """
+        if self.current(stage, generation):
+            self._cancels.pop(stage, None)
+            self._futures.pop(stage, None)
+
+    def current(self, stage, generation):
+        """Check if the generation is the latest of the stage
+
+        :param stage: 'str' name of the stage
+        :param generation: 'int' generation of a result
+        :return: 'bool' result is still current
+        """
+        return self._generations.get(stage) == generation
+
+    def running(self, stage):
+        """Check if the latest generation of the stage is queued or running
+
+        :param stage: 'str' name of the stage
+        :return: 'bool' stage is busy
+        """
+        future = self._futures.get(stage)
+        return future is not None and not future.done()
+
+    def shutdown(self):
+        """Cancel all the stages and stop their threads, pending requests are
+         dropped"""
+        for timer in self._timers.values():
+            timer.stop()
+        self._requests.clear()
+        for stage in list(self._cancels):
+            self.on_cancel(stage)
+        for pool in self._pools.values():
+            pool.shutdown(wait=False)
+
+    def _done(self, stage, generation, future):
+        """Report the exception a stage function raised, which would
+         otherwise be left in its future"""
+        if future.cancelled():
+            return
+        error = future.exception()
+        if error is None:
+            return
+        print('{0} failed:'.format(stage))
+        traceback.print_exception(type(error), error, error.__traceback__)
+        self.signal_error.emit(stage, generation, error)
+
+    def _run(self, stage, generation, function, args, cancel):
+        """Run a stage function on the stage's thread, emitting its results
+         until it's done or cancelled"""
+        if cancel[0]:
+            return
+        for result in function(*args, cancel=cancel):
+            if cancel[0]:
+                return
+            self.signal_result.emit(stage, generation, result)
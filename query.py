@@ -0,0 +1,364 @@
+import functools
+import os
+import re
+import time
+
+import lists
+import regex
+
+FIELDS = {'size': 'size',
+          'w': 'width',
+          'width': 'width',
+          'h': 'height',
+          'height': 'height',
+          'mtime': 'mtime',
+          'ext': 'ext'}
+SIZE_UNITS = {'': 1, 'b': 1,
+              'k': 1024, 'kb': 1024,
+              'm': 1024 ** 2, 'mb': 1024 ** 2,
+              'g': 1024 ** 3, 'gb': 1024 ** 3}
+AGE_UNITS = {'': 1, 's': 1, 'm': 60, 'h': 3600, 'd': 86400, 'w': 604800}
+PREDICATE = re.compile(r'^(-?)({})(>=|<=|!=|:|=|>|<)(.+)$'.format(
+    '|'.join(sorted(FIELDS, key=len, reverse=True))), re.IGNORECASE)
+# similar:name finds the images similar to the named file, similar:* groups
+# the near duplicates, with an optional ~distance
+SIMILAR = re.compile(r'^similar:(.+?)(?:~(\d+))?$', re.IGNORECASE)
+# duplicates:* keeps the files with identical contents, grouped together
+DUPLICATES = re.compile(r'^duplicates:\*$', re.IGNORECASE)
+NUMBER = re.compile(r'^(\d+(?:\.\d+)?)([a-z]*)$', re.IGNORECASE)
+OPERATORS = {'>': lambda a, b: a > b,
+             '>=': lambda a, b: a >= b,
+             '<': lambda a, b: a < b,
+             '<=': lambda a, b: a <= b,
+             '=': lambda a, b: a == b,
+             ':': lambda a, b: a == b,
+             '!=': lambda a, b: a != b}
+# costs of evaluating a check, cheaper checks are run first
+COST_NAME = 0
+COST_INDEXED = 1
+COST_TERMS = 2
+COST_STAT = 3
+# number of items evaluated between checks for cancellation
+CANCEL_INTERVAL = 1000
+# fraction of items expected to pass a check before it has been measured
+SELECTIVITY = {'ext': 0.2, 'mtime': 0.3, 'size': 0.5, 'width': 0.5,
+               'height': 0.5, 'terms': 0.5}
+
+
+def statMetadata(path):
+    """Metadata of the file read from the file system, without the image
+     dimensions which need the file header.
+
+    :param path: 'str' file path
+    :return: 'dict' size and mtime of the file, empty if it can't be read
+    """
+    try:
+        stat = os.stat(str(path))
+    except OSError:
+        return {}
+    return {'size': stat.st_size, 'mtime': stat.st_mtime}
+
+
+class Predicate(object):
+    def __init__(self, field, operator, value, negate=False):
+        """Condition on a metadata field of the file, such as 'size>2MB',
+         'w>=4096', 'mtime<7d' or 'ext:png'.
+        Sizes take B/KB/MB/GB units, mtime takes an age in s/m/h/d/w units
+         so 'mtime<7d' matches files modified within the last week, and ext
+         takes alternatives separated by '|'.
+
+        :param field: 'str' metadata field, one of the FIELDS values
+        :param operator: 'str' comparison operator, one of OPERATORS
+        :param value: 'str' value to compare against, with units
+        :param negate: 'bool' match the items failing the condition instead
+        """
+        self.var_field = field
+        self.var_operator = operator
+        self.var_negate = negate
+        if field == 'ext':
+            if operator not in (':', '=', '!='):
+                raise ValueError('Extensions can only be compared for equality')
+            self.var_value = tuple('.' + v.lower().lstrip('.')
+                                   for v in value.split('|') if v)
+            if not self.var_value:
+                raise ValueError('No extension given')
+        else:
+            match = NUMBER.match(value)
+            units = AGE_UNITS if field == 'mtime' else SIZE_UNITS
+            if field in ('width', 'height'):
+                units = {'': 1, 'px': 1}
+            if not match or match.group(2).lower() not in units:
+                raise ValueError('Invalid {} value: {}'.format(field, value))
+            self.var_value = float(match.group(1)) * units[match.group(2).lower()]
+
+    def __repr__(self):
+        return '<Predicate: {}{}{}{}>'.format('-' if self.var_negate else '',
+                                              self.var_field,
+                                              self.var_operator,
+                                              self.var_value)
+
+    @property
+    def key(self):
+        """Hashable identity of the predicate used for its statistics"""
+        return (self.var_field, self.var_operator, self.var_value,
+                self.var_negate)
+
+    def cost(self, indexed=False):
+        """Relative cost of evaluating the predicate
+
+        :param indexed: 'bool' metadata is answered from an index rather than
+            read from the file system
+        :return: 'int' one of the COST values
+        """
+        if self.var_field == 'ext':
+            return COST_NAME
+        return COST_INDEXED if indexed else COST_STAT
+
+    def compile(self, metadata=statMetadata, now=None):
+        """Build the function checking an item against the predicate
+
+        :param metadata: 'function' given an item, returns its metadata dict
+        :param now: 'float' time the mtime ages are measured from
+        :return: 'function' given an item, returns if it matches
+        """
+        negate = self.var_negate
+        field = self.var_field
+        value = self.var_value
+        if field == 'ext':
+            equal = self.var_operator != '!='
+            if negate:
+                equal = not equal
+
+            def check(item):
+                return str(item).lower().endswith(value) == equal
+            return check
+        compare = OPERATORS[self.var_operator]
+        if field == 'mtime':
+            # compare ages so 'mtime<7d' reads as 'modified less than 7 days ago'
+            now = time.time() if now is None else now
+
+            def check(item):
+                mtime = metadata(item).get('mtime')
+                if mtime is None:
+                    return False
+                return compare(now - mtime, value) != negate
+            return check
+
+        def check(item):
+            data = metadata(item).get(field)
+            if data is None:
+                return False
+            return compare(data, value) != negate
+        return check
+
+
+class Statistics(object):
+    def __init__(self):
+        """Fraction of items passing each check in previous queries, used to
+         run the most selective checks first."""
+        self._counts = {}
+
+    def selectivity(self, key, default=0.5):
+        """Estimated fraction of items passing the check
+
+        :param key: 'tuple' identity of the check
+        :param default: 'float' estimate for checks that weren't measured yet
+        :return: 'float' fraction of passing items
+        """
+        counts = self._counts.get(key)
+        if not counts or not counts[0]:
+            return default
+        return counts[1] / float(counts[0])
+
+    def record(self, key, evaluated, passed):
+        """Store the number of items evaluated by a check and passing it
+
+        :param key: 'tuple' identity of the check
+        :param evaluated: 'int' number of items evaluated
+        :param passed: 'int' number of items passing
+        """
+        counts = self._counts.setdefault(key, [0, 0])
+        counts[0] += evaluated
+        counts[1] += passed
+
+
+STATISTICS = Statistics()
+
+
+class Query(object):
+    def __init__(self, text=''):
+        """Compiled filter text. Terms use the '+ - ! < >' syntax and are
+         matched with a regex.Matcher, metadata predicates like 'size>2MB' are
+         pulled out of the terms and checked in the same pass. A
+         'similar:name' or 'similar:*' term narrows the items down to similar
+         images first, and a 'duplicates:*' term to identical files.
+        Use 'parse' to reuse the compiled query of the same text.
+
+        :param text: 'str' filter text
+        """
+        self.var_text = text
+        self.var_predicates = []
+        self.var_similar = None
+        self.var_duplicates = False
+        terms = []
+        for term in lists.fragment(terms=text, splits=list(' ,'), clean=True):
+            if DUPLICATES.match(term.strip()):
+                self.var_duplicates = True
+                continue
+            match = SIMILAR.match(term.strip())
+            if match:
+                target, distance = match.groups()
+                self.var_similar = (target,
+                                    None if distance is None else int(distance))
+                continue
+            match = PREDICATE.match(term.strip())
+            if match:
+                negate, field, operator, value = match.groups()
+                try:
+                    self.var_predicates.append(Predicate(
+                        FIELDS[field.lower()], operator, value, bool(negate)))
+                    continue
+                except ValueError:
+                    # not a valid predicate, handled as a term instead
+                    pass
+            terms.append(term)
+        # group up common terms based on their starting character. We should
+        # get 5 groups: includes, excludes, required, starts, ends
+        groupings = lists.grouping(items=terms,
+                                   searchTerms=[[t] for t in '+-!<>'])
+        # if we have an extra group, it means there was no matching
+        # character and we can assume those to include terms
+        if len(groupings) == 6:
+            groupings[0].extend(groupings.pop())
+        self.var_terms = groupings
+        includes, excludes, required, starts, ends = groupings
+        self.matcher = regex.Matcher(includes=includes, excludes=excludes,
+                                     required=required, starts=starts,
+                                     ends=ends)
+
+    def __repr__(self):
+        return '<Query: {}>'.format(self.var_text)
+
+    def __bool__(self):
+        return bool(self.matcher or self.var_predicates or self.var_similar or
+                    self.var_duplicates)
+
+    def checks(self, metadata=statMetadata, indexed=False,
+               statistics=STATISTICS, predicates=None):
+        """Functions checking an item against each part of the query, ordered
+         by cost and then by how selective they were in previous queries.
+
+        :param metadata: 'function' given an item, returns its metadata dict
+        :param indexed: 'bool' metadata is answered from an index rather than
+            read from the file system
+        :param statistics: 'Statistics' selectivity of previous checks
+        :param predicates: 'list' predicates to check, defaults to all the
+            predicates of the query
+        :return: 'list' (key, function) of each check
+        """
+        if predicates is None:
+            predicates = self.var_predicates
+        now = time.time()
+        ranked = []
+        for predicate in predicates:
+            key = predicate.key
+            default = SELECTIVITY[predicate.var_field]
+            ranked.append((predicate.cost(indexed),
+                           statistics.selectivity(key, default), key,
+                           predicate.compile(metadata, now)))
+        if self.matcher:
+            key = ('terms',) + tuple(tuple(t) for t in self.var_terms)
+            match = self.matcher.match
+            ranked.append((COST_TERMS,
+                           statistics.selectivity(key, SELECTIVITY['terms']),
+                           key, lambda item: match(str(item))))
+        ranked.sort(key=lambda r: r[:2])
+        return [(key, check) for cost, selectivity, key, check in ranked]
+
+    def filter(self, items, filterList=None, metadata=statMetadata,
+               indexed=False, statistics=STATISTICS, cancel=None,
+               catalog=None, similarity=None, duplicates=None):
+        """Items matching the query. Queries with only terms are run by the
+         filterList, reusing its cached results and index. Queries with
+         predicates evaluate every check in a single pass over the items.
+        Given a catalog of the items' metadata, the predicates it can compare
+         are evaluated over its columns first, leaving the single pass to the
+         rest of the query.
+
+        :param items: 'list' items to evaluate
+        :param filterList: 'lists.FilterList' filter keeping the results of
+            previous terms to reuse
+        :param metadata: 'function' given an item, returns its metadata dict
+        :param indexed: 'bool' metadata is answered from an index rather than
+            read from the file system
+        :param statistics: 'Statistics' selectivity of previous checks,
+            updated with the results of this pass
+        :param cancel: 'list' Cancel the evaluation, such as when the query
+            was replaced by a newer one
+        :param catalog: 'metadataCatalog.MetadataCatalog' metadata of the
+            items, only used if its rows are aligned with the items
+        :param similarity: 'function' given the items, the 'similar' target
+            and distance and the cancel flag, returns the similar items in
+            order, the 'similar' term is ignored without it
+        :param duplicates: 'function' given the items and the cancel flag,
+            returns the items with identical contents grouped together, the
+            'duplicates' term is ignored without it
+        :return: 'list' items matching the query, None if cancelled
+        """
+        cancel = [False] if cancel is None else cancel
+        if self.var_duplicates and duplicates is not None:
+            items = duplicates(items, cancel)
+            if items is None:
+                return None
+        if self.var_similar is not None and similarity is not None:
+            target, distance = self.var_similar
+            items = similarity(items, target, distance, cancel)
+            if items is None:
+                return None
+        if (self.var_duplicates or self.var_similar) and \
+                not (self.matcher or self.var_predicates):
+            return list(items)
+        if not self.var_predicates:
+            if filterList is None:
+                filterList = lists.FilterList()
+            includes, excludes, required, starts, ends = self.var_terms
+            return filterList.run(items=items, includes=includes,
+                                  excludes=excludes, required=required,
+                                  starts=starts, ends=ends, cancel=cancel)
+        predicates = None
+        if catalog is not None and catalog.var_paths is items:
+            indices, predicates = catalog.select(self.var_predicates)
+            items = [items[i] for i in indices.tolist()]
+        checks = self.checks(metadata, indexed, statistics, predicates)
+        if not checks:
+            return items
+        functions = [check for key, check in checks]
+        passed = [0] * len(functions)
+        results = []
+        count = 0
+        for item in items:
+            count += 1
+            if not count % CANCEL_INTERVAL and cancel[0]:
+                return None
+            for n, check in enumerate(functions):
+                if not check(item):
+                    break
+                passed[n] += 1
+            else:
+                results.append(item)
+        evaluated = count
+        for (key, check), passes in zip(checks, passed):
+            statistics.record(key, evaluated, passes)
+            evaluated = passes
+        return results
+
+
+@functools.lru_cache(maxsize=64)
+def parse(text):
+    """Compiled query of the filter text, cached so retyping or deleting
+     characters doesn't parse and compile the same text again.
+
+    :param text: 'str' filter text
+    :return: 'Query' compiled query
+    """
+    return Query(text)
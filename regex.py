@@ -1,5 +1,12 @@
 import re
 
+# characters that keep a term from being matched as a plain string, the
+# formatter escapes the rest of the regExpression characters
+LITERAL_SPECIAL = frozenset('*+?^{}|\\')
+REGEX_SPECIAL = frozenset('.^$*+?{}[]\\|()')
+# number of literal terms before they're matched with a single alternation
+ALTERNATION_THRESHOLD = 16
+
 
 def formatter(terms=[]):
     """Format the terms to avoid possible issues when compiling the regExpression
@@ -26,6 +33,39 @@ def formatter(terms=[]):
     return results
 
 
+def isRegex(terms=[]):
+    """Compare all the terms and make sure they're of similar types
+
+    :param terms: 'list' string terms or precompiled regExpressions
+    :return: 'bool' terms are precompiled regExpressions, None if no terms
+    """
+    is_regex = None
+    for term in terms:
+        # store type of first entry
+        string_check = isinstance(term, str)
+        if is_regex is None:
+            is_regex = not string_check
+            continue
+        # there should not be a mixture of strings and regExpresions
+        if string_check == is_regex:
+            msg = 'Mix of regExpressions and str, cannot reliably declare terms'
+            raise ValueError(msg)
+    return is_regex
+
+
+def isLiteral(term, format_terms=True):
+    """Check if the term only matches itself, so it can be found with string
+     operations instead of a regExpression.
+
+    :param term: 'str' term to check
+    :param format_terms: 'bool' term will be formatted, escaping the
+        characters handled by the formatter
+    :return: 'bool' term is a plain string
+    """
+    special = LITERAL_SPECIAL if format_terms else REGEX_SPECIAL
+    return not special.intersection(term)
+
+
 def precompile(includes=[], excludes=[], required=[], starts=[], ends=[],
                unified_excludes=False, case_sensitive=False, format_terms=True):
     """Compile the regExpression for the terms
@@ -47,18 +87,7 @@ def precompile(includes=[], excludes=[], required=[], starts=[], ends=[],
     :param format_terms: 'bool' Format the terms to avoid possible issues
         when compiling the regExpression
     :return: 'list' precompiled regExpressions"""
-    # compare all the terms and make sure they're of similar types
-    is_regex = None
-    for term in includes + excludes + required + starts + ends:
-        # store type of first entry
-        string_check = isinstance(term, str)
-        if is_regex is None:
-            is_regex = not string_check
-            continue
-        # there should not be a mixture of strings and regExpresions
-        if string_check == is_regex:
-            msg = 'Mix of regExpressions and str, cannot reliably declare terms'
-            raise ValueError(msg)
+    is_regex = isRegex(includes + excludes + required + starts + ends)
 
     includesREGs, excludesREGs, requiredREGs, startsREGs, endsREGs = [], [], [], [], []
     if is_regex is True:
@@ -106,3 +135,245 @@ def precompile(includes=[], excludes=[], required=[], starts=[], ends=[],
             endsREGs.append(re.compile(term, caseFlag))
     results = [includesREGs, excludesREGs, requiredREGs, startsREGs, endsREGs]
     return results
+
+
+class TermSet(object):
+    SEARCH = 'search'
+    START = 'start'
+    END = 'end'
+
+    def __init__(self, terms=[], anchor=SEARCH, case_sensitive=False,
+                 format_terms=True, is_regex=False):
+        """Set of terms of a single filter type. Literal terms are matched
+         with string operations against a lowered string, the rest fall back
+         to a regExpression.
+
+        :param terms: 'list' string terms or precompiled regExpressions
+        :param anchor: 'str' terms are searched for anywhere, at the start or
+            at the end of the string
+        :param case_sensitive: 'bool' Case sensitivity will be respected
+        :param format_terms: 'bool' Format the terms to avoid possible issues
+            when compiling the regExpression
+        :param is_regex: 'bool' terms are precompiled regExpressions
+        """
+        self.var_terms = list(terms)
+        self.var_anchor = anchor
+        self.var_case_sensitive = case_sensitive
+        self._literals = ()
+        self._regs = []
+        if is_regex:
+            self._regs = list(terms)
+        else:
+            literals = []
+            patterns = []
+            for term in terms:
+                if isLiteral(term, format_terms):
+                    literals.append(term if case_sensitive else term.lower())
+                else:
+                    patterns.append(term)
+            self._literals = tuple(literals)
+            if format_terms:
+                patterns = formatter(patterns)
+            caseFlag = 0 if case_sensitive else re.IGNORECASE
+            template = {self.SEARCH: '{}',
+                        self.START: '^({})',
+                        self.END: '({})$'}[anchor]
+            self._regs = [re.compile(template.format(t), caseFlag)
+                          for t in patterns]
+        self._search = self._compileSearch()
+        self._searchAll = self._compileSearchAll()
+
+    def __bool__(self):
+        return bool(self.var_terms)
+
+    def __len__(self):
+        return len(self.var_terms)
+
+    def isLiteral(self):
+        """Check if all the terms are matched with string operations
+
+        :return: 'bool' no term needs a regExpression
+        """
+        return not self._regs
+
+    def _compileSearch(self):
+        """Build the function checking if any term matches, given the string
+         and its lowered version.
+
+        :return: 'function' search function
+        """
+        literals = self._literals
+        regs = self._regs
+        if not literals:
+            literal = None
+        elif self.var_anchor == self.START:
+            literal = lambda lowered: lowered.startswith(literals)
+        elif self.var_anchor == self.END:
+            literal = lambda lowered: lowered.endswith(literals)
+        elif len(literals) == 1:
+            term = literals[0]
+            literal = lambda lowered: term in lowered
+        elif len(literals) > ALTERNATION_THRESHOLD:
+            # matching the lowered string avoids the cost of IGNORECASE
+            r = re.compile('|'.join(re.escape(t) for t in literals))
+            literal = lambda lowered: r.search(lowered) is not None
+        else:
+            literal = lambda lowered: any(t in lowered for t in literals)
+        if not regs:
+            return lambda string, lowered: literal(lowered)
+        if literal is None:
+            return lambda string, lowered: any(r.search(string) for r in regs)
+        return lambda string, lowered: (literal(lowered) or
+                                        any(r.search(string) for r in regs))
+
+    def _compileSearchAll(self):
+        """Build the function checking if all the terms match, given the
+         string and its lowered version.
+
+        :return: 'function' search function
+        """
+        literals = self._literals
+        regs = self._regs
+        if self.var_anchor == self.SEARCH and len(literals) == 1:
+            term = literals[0]
+            literal = lambda lowered: term in lowered
+        elif self.var_anchor == self.START:
+            literal = lambda lowered: all(lowered.startswith(t) for t in literals)
+        elif self.var_anchor == self.END:
+            literal = lambda lowered: all(lowered.endswith(t) for t in literals)
+        else:
+            literal = lambda lowered: all(t in lowered for t in literals)
+        if not regs:
+            return lambda string, lowered: literal(lowered)
+        return lambda string, lowered: (literal(lowered) and
+                                        all(r.search(string) for r in regs))
+
+    def search(self, string, lowered=None):
+        """Check if any of the terms match the string
+
+        :param string: 'str' string to search
+        :param lowered: 'str' string already lowered for case insensitive
+            matching
+        :return: 'bool' a term matched
+        """
+        if lowered is None:
+            lowered = string if self.var_case_sensitive else string.lower()
+        return bool(self._search(string, lowered))
+
+    def searchAll(self, string, lowered=None):
+        """Check if all of the terms match the string
+
+        :param string: 'str' string to search
+        :param lowered: 'str' string already lowered for case insensitive
+            matching
+        :return: 'bool' all terms matched
+        """
+        if lowered is None:
+            lowered = string if self.var_case_sensitive else string.lower()
+        return bool(self._searchAll(string, lowered))
+
+
+class Matcher(object):
+    def __init__(self, includes=[], excludes=[], required=[], starts=[],
+                 ends=[], unified_excludes=False, case_sensitive=False,
+                 format_terms=True):
+        """Compiled matcher for the filter terms, matching literal terms with
+         string operations and only using regExpressions for wildcards.
+        Matches the same items as the regExpressions from precompile.
+        'match' checks a string against all the terms, 'matchName' only
+         against the starts and ends terms and 'matchPath' against the rest.
+
+        :param includes: 'list' item will be valid if they contain any terms
+            from this list
+        :param excludes: 'list' item will not be valid if they contain any
+            terms from this list
+        :param required: 'list' item will only be valid if they all terms from
+            this list
+        :param starts: 'list' item will be valid if they start with any terms
+            from this list
+        :param ends: 'list' item will be valid if they end with any terms
+            from this list
+        :param unified_excludes: 'bool' combines all exclude terms so that all
+            must be valid for a match to be detected
+        :param case_sensitive: 'bool' Case sensitvity will be respected in
+            determining if item is valid
+        :param format_terms: 'bool' Format the terms to avoid possible issues
+            when compiling the regExpression
+        """
+        is_regex = bool(isRegex(includes + excludes + required + starts + ends))
+        kwargs = {'case_sensitive': case_sensitive,
+                  'format_terms': format_terms,
+                  'is_regex': is_regex}
+        self.var_case_sensitive = case_sensitive
+        self.var_unified_excludes = unified_excludes
+        self.includes = TermSet(includes, TermSet.SEARCH, **kwargs)
+        self.excludes = TermSet(excludes, TermSet.SEARCH, **kwargs)
+        self.required = TermSet(required, TermSet.SEARCH, **kwargs)
+        self.starts = TermSet(starts, TermSet.START, **kwargs)
+        self.ends = TermSet(ends, TermSet.END, **kwargs)
+        # checks are ordered from the cheapest and most selective terms
+        nameChecks = self._checks(self.ends, self.starts)
+        pathChecks = self._checks(required=self.required,
+                                  excludes=self.excludes,
+                                  includes=self.includes)
+        allChecks = self._checks(self.ends, self.starts, self.required,
+                                 self.excludes, self.includes)
+        self.matchName = self._compile(nameChecks)
+        self.matchPath = self._compile(pathChecks)
+        self.match = self._compile(allChecks)
+
+    def __bool__(self):
+        return bool(self.includes or self.excludes or self.required or
+                    self.starts or self.ends)
+
+    def isLiteral(self):
+        """Check if all the terms are matched with string operations, which
+         is cheap enough to not be worth spreading over processes.
+
+        :return: 'bool' no term needs a regExpression
+        """
+        return all(t.isLiteral() for t in (self.includes, self.excludes,
+                                           self.required, self.starts,
+                                           self.ends))
+
+    def _checks(self, ends=None, starts=None, required=None, excludes=None,
+                includes=None):
+        """Collect the check functions of the given term sets that have terms
+
+        :return: 'list' functions given the string and its lowered version
+        """
+        checks = []
+        for termSet in (ends, starts, includes):
+            if termSet:
+                checks.append(termSet._search)
+        if required:
+            checks.insert(0, required._searchAll)
+        if excludes:
+            search = excludes._search
+            checks.append(lambda string, lowered: not search(string, lowered))
+        return checks
+
+    def _compile(self, checks):
+        """Build a single function running all the checks, lowering the
+         string only once for the case insensitive literal terms.
+
+        :param checks: 'list' functions given the string and its lowered
+            version
+        :return: 'function' given a string, returns if it matches
+        """
+        case_sensitive = self.var_case_sensitive
+        if not checks:
+            return lambda string: True
+        if len(checks) == 1:
+            check = checks[0]
+            if case_sensitive:
+                return lambda string: bool(check(string, string))
+            return lambda string: bool(check(string, string.lower()))
+
+        def match(string):
+            lowered = string if case_sensitive else string.lower()
+            for check in checks:
+                if not check(string, lowered):
+                    return False
+            return True
+        return match
@@ -0,0 +1,183 @@
+import concurrent.futures
+import os
+import sqlite3
+import threading
+
+import paths
+
+
+class IndexEntry(object):
+    __slots__ = ('name', 'path', '_is_dir', '_is_symlink')
+
+    def __init__(self, directory, name, is_dir=False, is_symlink=False):
+        """Stored directory entry that stands in for a scandir.DirEntry when
+         walking from the index.
+
+        :param directory: 'str' directory path containing the entry
+        :param name: 'str' base name of the entry
+        :param is_dir: 'bool' entry is a directory
+        :param is_symlink: 'bool' entry is a symbolic link
+        """
+        self.name = name
+        self.path = os.path.join(directory, name)
+        self._is_dir = bool(is_dir)
+        self._is_symlink = bool(is_symlink)
+
+    def __repr__(self):
+        return '<IndexEntry: {}>'.format(self.name)
+
+    def is_dir(self):
+        return self._is_dir
+
+    def is_file(self):
+        return not self._is_dir
+
+    def is_symlink(self):
+        return self._is_symlink
+
+
+class ScanIndex(object):
+    COMMIT_INTERVAL = 500
+
+    def __init__(self, path=None):
+        """Persistent index of directory listings stored in SQLite along with
+         each directory's mtime. Walks are answered from the stored rows, and
+         refresh only lists the directories whose mtime has changed since
+         they were stored.
+
+        :param path: 'str' database file, defaults to the user cache directory
+        """
+        if path is None:
+            path = os.path.join(paths.cacheDir(), 'scanIndex.db')
+        self.var_path = path
+        self._lock = threading.RLock()
+        self._pending = 0
+        # the index is shared by the threads of a concurrent walk, access is
+        # serialized by the lock
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.execute('PRAGMA journal_mode=WAL')
+        self._connection.execute('PRAGMA synchronous=NORMAL')
+        self._connection.execute(
+            'CREATE TABLE IF NOT EXISTS directories '
+            '(path TEXT PRIMARY KEY, mtime REAL)')
+        self._connection.execute(
+            'CREATE TABLE IF NOT EXISTS entries '
+            '(directory TEXT, name TEXT, is_dir INTEGER, is_symlink INTEGER, '
+            'PRIMARY KEY (directory, name)) WITHOUT ROWID')
+        self._connection.commit()
+
+    def close(self):
+        """Commit any pending listings and close the database"""
+        with self._lock:
+            self._connection.commit()
+            self._connection.close()
+
+    def commit(self):
+        """Write the pending listings to the database"""
+        with self._lock:
+            self._connection.commit()
+            self._pending = 0
+
+    def listing(self, path):
+        """Entries of the directory, answered from the stored rows when
+         available, otherwise the directory is listed and stored.
+
+        :param path: 'str' directory path
+        :return: 'list' IndexEntry or scandir.DirEntry sorted by name
+        """
+        with self._lock:
+            stored = self._connection.execute(
+                'SELECT 1 FROM directories WHERE path = ?', (path,)).fetchone()
+            if stored:
+                rows = self._connection.execute(
+                    'SELECT name, is_dir, is_symlink FROM entries '
+                    'WHERE directory = ? ORDER BY name', (path,)).fetchall()
+                return [IndexEntry(path, *row) for row in rows]
+        return self.store(path)
+
+    def store(self, path):
+        """List the directory and replace its stored entries
+
+        :param path: 'str' directory path
+        :return: 'list' scandir.DirEntry sorted by name
+        """
+        # the mtime is read before listing so any change made during the
+        # listing is caught by the next refresh
+        try:
+            mtime = os.stat(path).st_mtime
+        except OSError:
+            self.remove(path)
+            return []
+        entries = paths.listDirectory(path)
+        rows = []
+        for entry in entries:
+            try:
+                rows.append((path, entry.name, entry.is_dir(),
+                             entry.is_symlink()))
+            except OSError:
+                continue
+        with self._lock:
+            self._connection.execute(
+                'DELETE FROM entries WHERE directory = ?', (path,))
+            self._connection.executemany(
+                'INSERT INTO entries VALUES (?, ?, ?, ?)', rows)
+            self._connection.execute(
+                'INSERT OR REPLACE INTO directories VALUES (?, ?)',
+                (path, mtime))
+            self._pending += 1
+            if self._pending >= self.COMMIT_INTERVAL:
+                self.commit()
+        return entries
+
+    def remove(self, path):
+        """Remove the stored listings of the directory and its children
+
+        :param path: 'str' directory path
+        """
+        prefix = os.path.join(path, '')
+        with self._lock:
+            for table, column in (('directories', 'path'),
+                                  ('entries', 'directory')):
+                self._connection.execute(
+                    'DELETE FROM {0} WHERE {1} = ? OR substr({1}, 1, ?) = ?'
+                    ''.format(table, column), (path, len(prefix), prefix))
+
+    def directories(self, path):
+        """Stored directories at or under the given path
+
+        :param path: 'str' root directory path
+        :return: 'list' (path, mtime) of each stored directory
+        """
+        prefix = os.path.join(path, '')
+        with self._lock:
+            return self._connection.execute(
+                'SELECT path, mtime FROM directories '
+                'WHERE path = ? OR substr(path, 1, ?) = ?',
+                (path, len(prefix), prefix)).fetchall()
+
+    def refresh(self, path, threads=8):
+        """Validate the stored directories under the path, listing again only
+         those whose mtime has changed and removing those that are gone.
+
+        :param path: 'str' root directory path
+        :param threads: 'int' number of directories checked concurrently
+        :return: 'list' paths of the directories that changed
+        """
+        path = os.path.normpath(path)
+
+        def check(directory, mtime):
+            try:
+                changed = os.stat(directory).st_mtime != mtime
+            except OSError:
+                self.remove(directory)
+                return directory
+            if changed:
+                self.store(directory)
+                return directory
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers=threads) as executor:
+            futures = [executor.submit(check, d, m)
+                       for d, m in self.directories(path)]
+            results = [f.result() for f in futures]
+        self.commit()
+        return sorted(r for r in results if r)
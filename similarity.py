@@ -0,0 +1,363 @@
+import concurrent.futures
+import math
+import threading
+
+try:
+    import numpy
+except ImportError:
+    # the hashes are computed in python instead
+    numpy = None
+
+# the hashing functions take 'paths' arguments
+from paths import mapBounded
+
+# hamming distance between hashes of images considered near duplicates
+DISTANCE = 6
+# width and height the image is reduced to for each hash, the difference hash
+# compares 9 columns to get 8 bits per row
+DHASH_SIZE = (9, 8)
+PHASH_SIZE = (32, 32)
+# number of the lowest frequencies kept in each direction by the pHash
+PHASH_FREQUENCIES = 8
+# maximum width and height images are decoded at to be hashed
+HASH_RESOLUTION = 64
+KINDS = ('dhash', 'phash')
+
+
+def hamming(a, b):
+    """Number of bits differing between two hashes
+
+    :param a: 'int' hash
+    :param b: 'int' hash
+    :return: 'int' hamming distance
+    """
+    return bin(a ^ b).count('1')
+
+
+def _pack(bits):
+    """Pack an iterable of booleans into an integer, first bit highest"""
+    value = 0
+    for bit in bits:
+        value = (value << 1) | bool(bit)
+    return value
+
+
+def dhash(pixels):
+    """Difference hash, a bit per horizontally adjacent pair of pixels set
+     when the brightness increases. Robust to scaling and re-encoding.
+
+    :param pixels: 'list' 8 rows of 9 grayscale values, see DHASH_SIZE
+    :return: 'int' 64 bit hash
+    """
+    if numpy is not None:
+        values = numpy.asarray(pixels, dtype='i2')
+        return _pack((values[:, 1:] > values[:, :-1]).ravel().tolist())
+    return _pack(row[x + 1] > row[x]
+                 for row in pixels for x in range(len(row) - 1))
+
+
+_COSINES = {}
+
+
+def _cosines(size):
+    """Rows of the DCT-II basis for the lowest frequencies"""
+    cosines = _COSINES.get(size)
+    if cosines is None:
+        cosines = [[math.cos(math.pi * (2 * n + 1) * k / (2.0 * size))
+                    for n in range(size)]
+                   for k in range(PHASH_FREQUENCIES)]
+        if numpy is not None:
+            cosines = numpy.array(cosines)
+        _COSINES[size] = cosines
+    return cosines
+
+
+def phash(pixels):
+    """Perceptual hash, a bit per low frequency of the image's discrete
+     cosine transform set when above the median. Robust to scaling, small
+     edits and color or gamma changes.
+
+    :param pixels: 'list' 32 rows of 32 grayscale values, see PHASH_SIZE
+    :return: 'int' 64 bit hash
+    """
+    size = len(pixels)
+    cosines = _cosines(size)
+    if numpy is not None:
+        values = numpy.asarray(pixels, dtype='f8')
+        frequencies = (cosines.dot(values).dot(cosines.T)).ravel()
+        # the first coefficient is the average brightness, left out of the
+        # median so it doesn't skew it
+        median = numpy.median(frequencies[1:])
+        return _pack((frequencies > median).tolist())
+    # transform the rows, then the columns, only for the lowest frequencies
+    rows = [[sum(v * c for v, c in zip(row, cosine)) for cosine in cosines]
+            for row in pixels]
+    frequencies = [sum(cosine[n] * rows[n][l] for n in range(size))
+                   for cosine in cosines for l in range(PHASH_FREQUENCIES)]
+    # 63 coefficients, the median is the middle one as with numpy.median
+    ordered = sorted(frequencies[1:])
+    median = ordered[len(ordered) // 2]
+    return _pack(f > median for f in frequencies)
+
+
+def imageHashes(image):
+    """Hashes of a decoded image, such as a thumbnail
+
+    :param image: 'QtGui.QImage' image to hash
+    :return: 'dict' 'dhash' and 'phash' of the image
+    """
+    # imported here so the hashes and index can be used without Qt
+    from PySide2 import QtCore, QtGui
+
+    gray = image.convertToFormat(QtGui.QImage.Format_Grayscale8)
+
+    def pixels(width, height):
+        scaled = gray.scaled(width, height, QtCore.Qt.IgnoreAspectRatio,
+                             QtCore.Qt.SmoothTransformation)
+        stride = scaled.bytesPerLine()
+        data = bytes(scaled.constBits())[:stride * height]
+        return [list(data[y * stride:y * stride + width])
+                for y in range(height)]
+    return {'dhash': dhash(pixels(*DHASH_SIZE)),
+            'phash': phash(pixels(*PHASH_SIZE))}
+
+
+def readHashes(path, cache=None, resolution=None):
+    """Hashes of an image file, stored in the cache. Thumbnails decoded
+     before are hashed rather than the image, otherwise the image is decoded
+     at a reduced size.
+
+    :param path: 'str' file path of the image
+    :param cache: 'thumbnailCache.ThumbnailCache' persistent cache storing
+        the hashes and thumbnails
+    :param resolution: 'int' resolution of the thumbnails in the cache
+    :return: 'dict' 'dhash' and 'phash' of the image, None if it can't be
+        read
+    """
+    from PySide2 import QtCore, QtGui
+
+    if cache is not None:
+        stored = cache.getHashes(path)
+        if stored:
+            return stored
+    image = None
+    if cache is not None and resolution:
+        stored = cache.get(path, resolution)
+        if stored:
+            image = QtGui.QImage.fromData(stored[0])
+    if image is None or image.isNull():
+        reader = QtGui.QImageReader(str(path))
+        native = reader.size()
+        if native.isValid() and max(native.width(),
+                                    native.height()) > HASH_RESOLUTION:
+            reader.setScaledSize(native.scaled(
+                HASH_RESOLUTION, HASH_RESOLUTION, QtCore.Qt.KeepAspectRatio))
+        image = reader.read()
+    if image.isNull():
+        return None
+    hashes = imageHashes(image)
+    if cache is not None:
+        cache.putHashes(path, hashes['dhash'], hashes['phash'])
+    return hashes
+
+
+class BKTree(object):
+    def __init__(self, distance=hamming):
+        """Burkhard-Keller tree of hashes, finding the hashes within a
+         distance of a hash without comparing it to every hash. Children of
+         a node are keyed by their distance to it, so the triangle
+         inequality rules out most of the branches.
+
+        :param distance: 'function' metric between two hashes
+        """
+        self.var_distance = distance
+        self._root = None
+        self._count = 0
+
+    def __len__(self):
+        return self._count
+
+    def add(self, value, item):
+        """Store an item under its hash
+
+        :param value: 'int' hash of the item
+        :param item: 'object' item stored, such as a file path
+        """
+        self._count += 1
+        node = self._root
+        if node is None:
+            self._root = [value, [item], {}]
+            return
+        while True:
+            distance = self.var_distance(value, node[0])
+            if distance == 0:
+                node[1].append(item)
+                return
+            child = node[2].get(distance)
+            if child is None:
+                node[2][distance] = [value, [item], {}]
+                return
+            node = child
+
+    def search(self, value, distance=DISTANCE):
+        """Items whose hashes are within the distance of the hash
+
+        :param value: 'int' hash to search around
+        :param distance: 'int' maximum distance of the items
+        :return: 'list' (distance, item) of the items found, closest first
+        """
+        results = []
+        if self._root is None:
+            return results
+        nodes = [self._root]
+        while nodes:
+            node = nodes.pop()
+            d = self.var_distance(value, node[0])
+            if d <= distance:
+                results.extend((d, item) for item in node[1])
+            for key, child in node[2].items():
+                if d - distance <= key <= d + distance:
+                    nodes.append(child)
+        results.sort(key=lambda r: r[0])
+        return results
+
+
+class SimilarityIndex(object):
+    def __init__(self, kind='phash', cache=None, resolution=None):
+        """Index of the perceptual hashes of images, finding the images
+         similar to an image and grouping near duplicates without comparing
+         every pair of images.
+        Hashes are read with 'readHashes', so they persist in the cache.
+
+        :param kind: 'str' hash the images are compared by, one of KINDS
+        :param cache: 'thumbnailCache.ThumbnailCache' persistent cache storing
+            the hashes and thumbnails
+        :param resolution: 'int' resolution of the thumbnails in the cache
+        """
+        if kind not in KINDS:
+            raise ValueError('Unknown hash: {}'.format(kind))
+        self.var_kind = kind
+        self.var_cache = cache
+        self.var_resolution = resolution
+        self._hashes = {}
+        self._order = {}
+        # files that couldn't be read, not hashed again
+        self._failed = set()
+        self._tree = BKTree()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._hashes)
+
+    def __contains__(self, path):
+        return str(path) in self._hashes
+
+    def add(self, path, hashes):
+        """Index the hashes of an image
+
+        :param path: 'str' file path of the image
+        :param hashes: 'dict' 'dhash' and 'phash' of the image
+        """
+        key = str(path)
+        with self._lock:
+            if key in self._hashes:
+                return
+            self._hashes[key] = hashes
+            self._order[key] = len(self._order)
+            self._tree.add(hashes[self.var_kind], key)
+
+    def hashes(self, path):
+        """Indexed hashes of an image
+
+        :param path: 'str' file path of the image
+        :return: 'dict' 'dhash' and 'phash' of the image, None if not indexed
+        """
+        return self._hashes.get(str(path))
+
+    def update(self, paths, threads=8, cancel=None, hasher=None):
+        """Index the images that aren't indexed yet, reading their hashes on
+         a pool of threads.
+
+        :param paths: 'list' file paths of the images
+        :param threads: 'int' Max number of concurrent threads
+        :param cancel: 'list' Cancel the images left to be hashed
+            * Must be a mutable value so we can pass it by reference
+        :param hasher: 'function' given a path, returns its hashes, defaults
+            to 'readHashes' with the index's cache
+        :return: 'int' number of images indexed, None if cancelled
+        """
+        cancel = [False] if cancel is None else cancel
+        if hasher is None:
+            def hasher(path):
+                return readHashes(path, self.var_cache, self.var_resolution)
+        missing = [p for p in paths if str(p) not in self._hashes and
+                   str(p) not in self._failed]
+
+        def index(path):
+            if cancel[0]:
+                return False
+            hashes = hasher(path)
+            if hashes:
+                self.add(path, hashes)
+            else:
+                self._failed.add(str(path))
+            return bool(hashes)
+        count = 0
+        with concurrent.futures.ThreadPoolExecutor(threads) as executor:
+            # only a few calls are queued at once, so large folders don't
+            # hold a future and result for every image
+            for indexed in mapBounded(executor, index, missing, threads * 4):
+                if cancel[0]:
+                    break
+                count += indexed
+        if cancel[0]:
+            return None
+        return count
+
+    def similar(self, path, distance=DISTANCE):
+        """Images similar to an image
+
+        :param path: 'str' file path of an indexed image, or its hash
+        :param distance: 'int' maximum hamming distance of the hashes
+        :return: 'list' (distance, path) of the similar images including the
+            image itself, closest first
+        """
+        if isinstance(path, int):
+            value = path
+        else:
+            hashes = self.hashes(path)
+            if hashes is None:
+                return []
+            value = hashes[self.var_kind]
+        return self._tree.search(value, distance)
+
+    def groups(self, distance=DISTANCE):
+        """Groups of near duplicate images, images are in the same group when
+         they're similar to any image of the group.
+
+        :param distance: 'int' maximum hamming distance of the hashes
+        :return: 'list' groups of at least two paths, in the order the images
+            were indexed
+        """
+        parents = {}
+
+        def find(key):
+            root = key
+            while parents.get(root, root) != root:
+                root = parents[root]
+            while key != root:
+                parents[key], key = root, parents[key]
+            return root
+        order = self._order
+        for key, hashes in list(self._hashes.items()):
+            for d, other in self._tree.search(hashes[self.var_kind], distance):
+                a, b = find(key), find(other)
+                if a != b:
+                    # keep the earliest indexed image as the root
+                    if order[b] < order[a]:
+                        a, b = b, a
+                    parents[b] = a
+        groups = {}
+        for key in sorted(self._hashes, key=order.__getitem__):
+            groups.setdefault(find(key), []).append(key)
+        return [g for g in groups.values() if len(g) > 1]
@@ -0,0 +1,12 @@
+import os
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def pytest_collect_directory(path, parent):
+    """Collect the repository root as a plain directory rather than a
+     package, importing its __init__.py would start the application."""
+    if str(path) == ROOT:
+        return pytest.Dir.from_parent(parent, path=path)
@@ -0,0 +1,93 @@
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.append(os.path.join(ROOT, 'external'))
+
+import duplicates
+
+
+class FindTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        edge = duplicates.EDGE_SIZE
+        large = os.urandom(edge * 3)
+        # same size, start and end as large, only the middle differs
+        middle = large[:edge] + os.urandom(edge) + large[-edge:]
+        self.files = {'a.png': b'taco',
+                      'b.png': b'taco',
+                      'c.png': b'nacho',
+                      'd.png': b'tacp',
+                      'empty1.png': b'',
+                      'empty2.png': b'',
+                      'large1.png': large,
+                      'large2.png': middle,
+                      'large3.png': large}
+        for name, data in self.files.items():
+            with open(self.path(name), 'wb') as stream:
+                stream.write(data)
+
+    def path(self, name):
+        return os.path.join(self.directory, name)
+
+    def paths(self, *names):
+        return [self.path(n) for n in names]
+
+    def test_find(self):
+        files = self.paths(*sorted(self.files))
+        self.assertEqual(duplicates.find(files),
+                         [self.paths('a.png', 'b.png'),
+                          self.paths('large1.png', 'large3.png')])
+        self.assertEqual(duplicates.find(files, minimum=0),
+                         [self.paths('a.png', 'b.png'),
+                          self.paths('empty1.png', 'empty2.png'),
+                          self.paths('large1.png', 'large3.png')])
+
+    def test_order(self):
+        files = self.paths('large3.png', 'b.png', 'large1.png', 'a.png')
+        self.assertEqual(duplicates.find(files),
+                         [self.paths('large3.png', 'large1.png'),
+                          self.paths('b.png', 'a.png')])
+
+    def test_missing(self):
+        files = self.paths('a.png', 'missing.png', 'b.png')
+        self.assertEqual(duplicates.find(files),
+                         [self.paths('a.png', 'b.png')])
+
+    def test_cancel(self):
+        self.assertIsNone(duplicates.find(self.paths(*self.files),
+                                          cancel=[True]))
+
+    def test_cache(self):
+        cache = duplicates.DigestCache(os.path.join(self.directory,
+                                                    'digests.db'))
+        self.addCleanup(cache.close)
+        files = self.paths(*sorted(self.files))
+        expected = duplicates.find(files)
+        self.assertEqual(duplicates.find(files, cache=cache), expected)
+        stats = os.stat(self.path('large1.png'))
+        partial, full = cache.get(self.path('large1.png'), stats.st_size,
+                                  stats.st_mtime)
+        self.assertEqual(partial, duplicates.partialDigest(
+            self.path('large1.png'), stats.st_size))
+        self.assertEqual(full, duplicates.fullDigest(self.path('large1.png')))
+        self.assertEqual(duplicates.find(files, cache=cache), expected)
+
+    def test_digests(self):
+        edge = duplicates.EDGE_SIZE
+        size = len(self.files['large1.png'])
+        self.assertEqual(duplicates.partialDigest(self.path('large1.png'), size),
+                         duplicates.partialDigest(self.path('large2.png'), size))
+        self.assertNotEqual(duplicates.fullDigest(self.path('large1.png')),
+                            duplicates.fullDigest(self.path('large2.png')))
+        self.assertIsNone(duplicates.partialDigest(self.path('missing'), edge))
+        self.assertIsNone(duplicates.fullDigest(self.path('missing')))
+
+
+if __name__ == '__main__':
+    unittest.main()
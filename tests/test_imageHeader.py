@@ -0,0 +1,137 @@
+import io
+import os
+import struct
+import sys
+import unittest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import imageHeader
+
+PREVIEW = b'\xff\xd8\xff\xd9'
+
+
+def segment(marker, data):
+    return struct.pack('>BBH', 0xFF, marker, len(data) + 2) + data
+
+
+def tiff(directories, endian='<'):
+    """TIFF structure with the given directories of (tag, type, value),
+     followed by the preview"""
+    data = (b'II*\x00' if endian == '<' else b'MM\x00*') + \
+        struct.pack(endian + 'I', 8)
+    offset = 8
+    for n, entries in enumerate(directories):
+        data += struct.pack(endian + 'H', len(entries))
+        for tag, kind, value in entries:
+            if kind == imageHeader.TYPE_SHORT:
+                data += struct.pack(endian + 'HHIHxx', tag, kind, 1, value)
+            else:
+                data += struct.pack(endian + 'HHII', tag, kind, 1, value)
+        offset += 2 + len(entries) * 12 + 4
+        last = n == len(directories) - 1
+        data += struct.pack(endian + 'I', 0 if last else offset)
+    return data
+
+
+def previewTags(offset):
+    return [(imageHeader.TAG_PREVIEW_OFFSET, imageHeader.TYPE_LONG, offset),
+            (imageHeader.TAG_PREVIEW_LENGTH, imageHeader.TYPE_LONG,
+             len(PREVIEW))]
+
+
+def jpeg(width, height, exif=None):
+    data = b'\xff\xd8' + segment(0xE0, b'JFIF\x00' + b'\x00' * 9)
+    if exif is not None:
+        data += segment(0xE1, b'Exif\x00\x00' + exif)
+    data += segment(0xDB, b'\x00' * 65)
+    data += segment(0xC0, struct.pack('>BHHB', 8, height, width, 3) +
+                    b'\x00' * 9)
+    return data + segment(0xDA, b'\x00' * 10) + b'\xff\xd9'
+
+
+class HeaderTest(unittest.TestCase):
+    def parse(self, data):
+        return imageHeader.parse(io.BytesIO(data))
+
+    def assertHeader(self, header, format, width, height, preview=None):
+        self.assertEqual((header.format, header.width, header.height,
+                          header.preview), (format, width, height, preview))
+
+    def test_png(self):
+        data = imageHeader.PNG_SIGNATURE + struct.pack('>I', 13) + b'IHDR' + \
+            struct.pack('>IIBBBBB', 640, 480, 8, 6, 0, 0, 0)
+        self.assertHeader(self.parse(data), 'png', 640, 480)
+
+    def test_gif(self):
+        for signature in (b'GIF87a', b'GIF89a'):
+            data = signature + struct.pack('<HH', 320, 200) + b'\x00' * 20
+            self.assertHeader(self.parse(data), 'gif', 320, 200)
+
+    def test_bmp(self):
+        for height in (300, -300):
+            data = b'BM' + b'\x00' * 12 + \
+                struct.pack('<IiiHH', 40, 500, height, 1, 24) + b'\x00' * 24
+            self.assertHeader(self.parse(data), 'bmp', 500, 300)
+        # OS/2 core header with 16 bit sizes
+        data = b'BM' + b'\x00' * 12 + \
+            struct.pack('<IHHHH', 12, 500, 300, 1, 24) + b'\x00' * 24
+        self.assertHeader(self.parse(data), 'bmp', 500, 300)
+
+    def test_jpeg(self):
+        self.assertHeader(self.parse(jpeg(1920, 1080)), 'jpeg', 1920, 1080)
+        # fill bytes before the markers
+        data = jpeg(20, 10).replace(b'\xff\xc0', b'\xff\xff\xff\xc0')
+        self.assertHeader(self.parse(data), 'jpeg', 20, 10)
+
+    def test_jpegPreview(self):
+        # the thumbnail is stored in the second directory of the EXIF
+        exif = tiff([[], previewTags(8 + 6 + 2 + 24 + 4)]) + PREVIEW
+        header = self.parse(jpeg(4000, 3000, exif))
+        self.assertHeader(header, 'jpeg', 4000, 3000, PREVIEW)
+
+    def test_jpegCorruptExif(self):
+        # the directory runs past the end of the segment
+        exif = tiff([[(imageHeader.TAG_WIDTH, imageHeader.TYPE_LONG, 1)]])
+        header = self.parse(jpeg(4000, 3000, exif[:-6]))
+        self.assertHeader(header, 'jpeg', 4000, 3000)
+        exif = b'II*\x00' + struct.pack('<IH', 8, 0xFFFF)
+        header = self.parse(jpeg(4000, 3000, exif))
+        self.assertHeader(header, 'jpeg', 4000, 3000)
+
+    def test_tiff(self):
+        for endian in ('<', '>'):
+            tags = [(imageHeader.TAG_WIDTH, imageHeader.TYPE_LONG, 6000),
+                    (imageHeader.TAG_HEIGHT, imageHeader.TYPE_SHORT, 4000)]
+            offset = 8 + 2 + (len(tags) + 2) * 12 + 4
+            data = tiff([tags + previewTags(offset)], endian) + PREVIEW
+            self.assertHeader(self.parse(data), 'tiff', 6000, 4000, PREVIEW)
+
+    def test_tiffReduced(self):
+        # the first directory holds a thumbnail rather than the full image
+        tags = [(imageHeader.TAG_SUBFILE_TYPE, imageHeader.TYPE_LONG, 1),
+                (imageHeader.TAG_WIDTH, imageHeader.TYPE_SHORT, 160),
+                (imageHeader.TAG_HEIGHT, imageHeader.TYPE_SHORT, 120)]
+        self.assertHeader(self.parse(tiff([tags])), 'tiff', 0, 0)
+        tags[0] = (imageHeader.TAG_SUBFILE_TYPE, imageHeader.TYPE_LONG, 0)
+        self.assertHeader(self.parse(tiff([tags])), 'tiff', 160, 120)
+
+    def test_unknown(self):
+        self.assertHeader(self.parse(b'not an image'), None, 0, 0)
+        self.assertHeader(imageHeader.read(os.path.join(ROOT, 'missing.png')),
+                          None, 0, 0)
+
+    def test_files(self):
+        header = imageHeader.read(os.path.join(ROOT, '_test', 'boom.gif'))
+        self.assertEqual(header.format, 'gif')
+        self.assertTrue(header.width and header.height)
+        for name in ('taco.jpg', 'rgivogI.jpg', 'DN4t3Sv.png'):
+            header = imageHeader.read(os.path.join(ROOT, '_test', 'assets',
+                                                   name))
+            self.assertIn(header.format, ('jpeg', 'png'))
+            self.assertTrue(header.width and header.height, name)
+
+
+if __name__ == '__main__':
+    unittest.main()
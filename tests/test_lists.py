@@ -0,0 +1,191 @@
+import os
+import random
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import lists
+import pathCatalog
+
+
+def query(includes=(), excludes=(), required=(), starts=(), ends=(),
+          unified_excludes=False, case_sensitive=False):
+    """Query tuple in the layout of FilterList._query"""
+    return (tuple(includes), tuple(excludes), tuple(required), tuple(starts),
+            tuple(ends), unified_excludes, case_sensitive)
+
+
+def randomPaths(generator, count=2000):
+    words = ['taco', 'nacho', 'salsa', 'burrito', 'queso', 'lime', 'TACO']
+    paths = []
+    for n in range(count):
+        parts = [generator.choice(words) for i in range(generator.randint(1, 3))]
+        name = '{}_{}{}'.format(generator.choice(words), n,
+                                generator.choice(['.png', '.jpg', '.gif']))
+        paths.append('/'.join(['C:', 'images'] + parts + [name]))
+    return paths
+
+
+class NarrowsTest(unittest.TestCase):
+    def test_refinements(self):
+        self.assertTrue(lists.narrows(query(['tac']), query(['taco'])))
+        self.assertTrue(lists.narrows(query(['TAC']), query(['taco'])))
+        self.assertTrue(lists.narrows(query(required=['ta']),
+                                      query(required=['ta', 'png'])))
+        self.assertTrue(lists.narrows(query(excludes=['png']),
+                                      query(excludes=['png', 'gif'])))
+        self.assertTrue(lists.narrows(query(starts=['c:/im']),
+                                      query(starts=['c:/images'])))
+        self.assertTrue(lists.narrows(query(ends=['g']),
+                                      query(ends=['.png'])))
+        self.assertTrue(lists.narrows(query(['taco', 'nacho']),
+                                      query(['taco'])))
+
+    def test_broadenings(self):
+        self.assertFalse(lists.narrows(query(['taco']), query(['tac'])))
+        self.assertFalse(lists.narrows(query(['taco']),
+                                       query(['taco', 'nacho'])))
+        self.assertFalse(lists.narrows(query(required=['ta', 'png']),
+                                       query(required=['ta'])))
+        self.assertFalse(lists.narrows(query(excludes=['png']), query()))
+        self.assertFalse(lists.narrows(query(ends=['.png']),
+                                       query(ends=['g'])))
+        self.assertFalse(lists.narrows(query(['taco']), query()))
+
+    def test_options(self):
+        self.assertFalse(lists.narrows(query(['tac']),
+                                       query(['taco'], case_sensitive=True)))
+        self.assertFalse(lists.narrows(query(['TAC'], case_sensitive=True),
+                                       query(['taco'], case_sensitive=True)))
+        # wildcards are only comparable to identical terms
+        self.assertFalse(lists.narrows(query(['t*o']), query(['t*os'])))
+        self.assertTrue(lists.narrows(query(['t*o']), query(['t*o'])))
+
+
+class FilterListTest(unittest.TestCase):
+    def setUp(self):
+        self.items = randomPaths(random.Random(0))
+
+    def expected(self, **terms):
+        return lists.FilterList().run(items=self.items, **terms)
+
+    def test_narrowedResults(self):
+        # typing a term character by character matches the same items as
+        # filtering every item for the full term
+        catalog = pathCatalog.PathCatalog(self.items)
+        filterList = lists.FilterList()
+        for end in range(1, 6):
+            term = 'tacos'[:end]
+            results = filterList.run(items=catalog, includes=[term])
+            self.assertEqual([str(p) for p in results],
+                             self.expected(includes=[term]))
+        for term in ('taco', 'tac', 'ta', ''):
+            results = filterList.run(items=catalog, includes=[term],
+                                     excludes=['gif'])
+            self.assertEqual([str(p) for p in results],
+                             self.expected(includes=[term], excludes=['gif']))
+
+    def test_cachedResults(self):
+        catalog = pathCatalog.PathCatalog(self.items)
+        filterList = lists.FilterList()
+        first = filterList.run(items=catalog, includes=['salsa'])
+        filterList.run(items=catalog, includes=['lime'])
+        self.assertEqual(filterList.run(items=catalog, includes=['salsa']),
+                         first)
+        self.assertEqual(len(filterList._cache), 2)
+
+    def test_changedList(self):
+        # results of plain lists aren't cached, changes made in place to them
+        # can't be told apart
+        filterList = lists.FilterList()
+        filterList.run(items=self.items, includes=['salsa'])
+        self.assertEqual(len(filterList._cache), 0)
+        index = next(i for i, item in enumerate(self.items)
+                     if 'salsa' not in item)
+        self.items[index] = 'C:/images/salsa_new.png'
+        self.assertIn('C:/images/salsa_new.png',
+                      filterList.run(items=self.items, includes=['salsa']))
+        self.assertEqual(filterList.run(items=self.items, includes=['sals']),
+                         self.expected(includes=['sals']))
+
+    def test_changedCatalog(self):
+        catalog = pathCatalog.PathCatalog(self.items)
+        filterList = lists.FilterList()
+        before = filterList.run(items=catalog, includes=['queso'])
+        catalog.append('C:/images/queso_new.png')
+        catalog.remove([str(before[0])])
+        after = [str(p) for p in filterList.run(items=catalog,
+                                                 includes=['queso'])]
+        self.assertEqual(after, [str(p) for p in before[1:]] +
+                         ['C:/images/queso_new.png'])
+
+    def test_index(self):
+        index = lists.TrigramIndex(self.items)
+        filterList = lists.FilterList()
+        filterList.setIndex(index)
+        for terms in ({'includes': ['salsa']},
+                      {'includes': ['taco', 'lime_1']},
+                      {'required': ['queso', '.png']},
+                      {'includes': ['sa*sa']},
+                      {'excludes': ['taco']}):
+            self.assertEqual(filterList.run(items=self.items, **terms),
+                             self.expected(**terms))
+
+
+class TrigramIndexTest(unittest.TestCase):
+    def setUp(self):
+        self.items = randomPaths(random.Random(1))
+        self.index = lists.TrigramIndex(self.items)
+
+    def assertCandidates(self, term):
+        candidates = self.index.candidates(includes=[term])
+        matches = [i for i, item in enumerate(self.items)
+                   if term.lower() in item.lower()]
+        # every match is a candidate
+        self.assertFalse(set(matches) - set(candidates), term)
+        self.assertEqual(list(candidates), sorted(candidates))
+        return candidates
+
+    def test_candidates(self):
+        for term in ('taco', 'SALSA', 'lime_1', 'images/que', 'o_19',
+                     '.gif'):
+            self.assertCandidates(term)
+        # the name and directory trigrams are matched separately, so names
+        # narrow the candidates down to the items containing them
+        candidates = self.assertCandidates('burrito_12')
+        self.assertTrue(all('burrito_12' in self.items[i]
+                            for i in candidates))
+
+    def test_shortTerms(self):
+        self.assertIsNone(self.index.candidates(includes=['ta']))
+        self.assertIsNone(self.index.candidates(includes=['t*a*c*o']))
+        # any term that can't be narrowed leaves every item as a candidate
+        self.assertIsNone(self.index.candidates(includes=['taco', 'ta']))
+
+    def test_required(self):
+        candidates = self.index.candidates(required=['queso', 'lime'])
+        for i, item in enumerate(self.items):
+            if 'queso' in item.lower() and 'lime' in item.lower():
+                self.assertIn(i, candidates)
+
+    def test_remove(self):
+        candidates = self.assertCandidates('nacho_5')
+        self.index.remove(candidates[0])
+        self.assertNotIn(candidates[0],
+                         self.index.candidates(includes=['nacho_5']))
+        # indexed again once added back
+        self.index.add(candidates[0], self.items[candidates[0]])
+        self.assertIn(candidates[0],
+                      self.index.candidates(includes=['nacho_5']))
+
+    def test_add(self):
+        index = len(self.items)
+        self.items.append('C:/images/enchilada_0.png')
+        self.index.add(index, self.items[index])
+        self.assertEqual(list(self.index.candidates(includes=['enchilada'])),
+                         [index])
+
+
+if __name__ == '__main__':
+    unittest.main()
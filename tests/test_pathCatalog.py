@@ -0,0 +1,78 @@
+import os
+import pathlib
+import random
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pathCatalog
+
+PATHS = [os.path.join('C:', 'images', 'Zebra.png'),
+         os.path.join('C:', 'images', 'apple.jpg'),
+         os.path.join('C:', 'images', 'a', 'x.jpg'),
+         os.path.join('C:', 'images', 'B', 'y.jpg'),
+         os.path.join('C:', 'images', 'b.jpg'),
+         os.path.join('C:', 'images', 'café.png')]
+
+
+class PathCatalogTest(unittest.TestCase):
+    def test_storage(self):
+        catalog = pathCatalog.PathCatalog(PATHS)
+        self.assertEqual(len(catalog), len(PATHS))
+        self.assertEqual(list(catalog.strings()), PATHS)
+        handle = catalog[2]
+        self.assertEqual(str(handle), PATHS[2])
+        self.assertEqual(handle.name, 'x.jpg')
+        self.assertEqual(handle.stem, 'x')
+        self.assertEqual(handle.suffix, '.jpg')
+        self.assertEqual(handle.parent, os.path.dirname(PATHS[2]))
+        self.assertEqual(os.fspath(catalog[-1]), PATHS[-1])
+        self.assertEqual(handle, PATHS[2])
+        with self.assertRaises(IndexError):
+            catalog[len(PATHS)]
+
+    def test_find(self):
+        catalog = pathCatalog.PathCatalog(PATHS)
+        for i, path in enumerate(PATHS):
+            self.assertEqual(catalog.find(path), i)
+        self.assertIsNone(catalog.find(os.path.join('C:', 'missing.png')))
+        self.assertIn(PATHS[3], catalog)
+        # paths added after the first lookup are found too
+        generator = random.Random(0)
+        added = [os.path.join('C:', 'new', '{}.png'.format(generator.random()))
+                 for i in range(100)]
+        for path in added[:5]:
+            catalog.append(path)
+        catalog.extend(added[5:])
+        for i, path in enumerate(PATHS + added):
+            self.assertEqual(catalog.find(path), i)
+
+    def test_remove(self):
+        catalog = pathCatalog.PathCatalog(PATHS)
+        version = catalog.version
+        self.assertEqual(catalog.remove([PATHS[1], 'missing.png']), [1])
+        self.assertGreater(catalog.version, version)
+        self.assertEqual(len(catalog), len(PATHS) - 1)
+        self.assertIsNone(catalog.find(PATHS[1]))
+        self.assertNotIn(PATHS[1], [str(h) for h in catalog])
+        # handles given out keep their index
+        self.assertEqual(str(catalog[1]), PATHS[1])
+        # stored again under a new index
+        handle = catalog.append(PATHS[1])
+        self.assertEqual(handle.index, len(PATHS))
+        self.assertEqual(catalog.find(PATHS[1]), len(PATHS))
+
+    def test_sorted(self):
+        catalog = pathCatalog.PathCatalog(PATHS)
+        catalog.remove([PATHS[0]])
+        ordered = catalog.sorted()
+        expected = sorted(pathlib.PureWindowsPath(p) for p in PATHS[1:])
+        self.assertEqual([pathlib.PureWindowsPath(p) for p in ordered.strings()],
+                         expected)
+        self.assertEqual(ordered.ordered, len(PATHS) - 1)
+        self.assertEqual(sorted(catalog), list(ordered))
+
+
+if __name__ == '__main__':
+    unittest.main()
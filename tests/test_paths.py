@@ -0,0 +1,79 @@
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.append(os.path.join(ROOT, 'external'))
+
+import paths
+
+FILES = ['a.png', 'b.tmp', 'build/c.png', 'src/d.png', 'src/e.tmp',
+         'src/build/f.png', 'src/keep/build/g.png', 'src/keep/h.tmp',
+         'docs/i.png', 'docs/j/k.png', 'logs/l.png']
+IGNORE = """# comments and blank lines are skipped
+
+*.tmp
+!src/keep/*.tmp
+build/
+/docs/j
+logs
+"""
+
+
+class WalkTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        for name in FILES:
+            path = os.path.join(self.directory, *name.split('/'))
+            if not os.path.isdir(os.path.dirname(path)):
+                os.makedirs(os.path.dirname(path))
+            open(path, 'w').close()
+        with open(os.path.join(self.directory, paths.IGNORE_FILE), 'w') as f:
+            f.write(IGNORE)
+
+    def found(self, **kwargs):
+        results = paths.getPaths(paths=self.directory, find_dirs=False, compact=True,
+                                 **kwargs)
+        return sorted(os.path.relpath(str(p), self.directory).replace(
+            os.sep, '/') for p in results)
+
+    def test_ignoreFile(self):
+        self.assertEqual(self.found(), sorted(
+            [paths.IGNORE_FILE, 'a.png', 'src/d.png', 'src/keep/h.tmp',
+             'docs/i.png']))
+        self.assertEqual(len(self.found(ignore_file=None)), len(FILES) + 1)
+
+    def test_nestedIgnoreFile(self):
+        with open(os.path.join(self.directory, 'src', paths.IGNORE_FILE),
+                  'w') as f:
+            f.write('d.png\n')
+        self.assertNotIn('src/d.png', self.found())
+        self.assertIn('a.png', self.found())
+
+    def test_concurrent(self):
+        self.assertEqual(self.found(threads=4), self.found())
+        self.assertEqual(self.found(threads=4, excludes=['src']),
+                         self.found(excludes=['src']))
+
+    def test_pruning(self):
+        walked = []
+        for root, dirs, files in paths.walk(self.directory, ignore_file=None):
+            walked.append(os.path.relpath(root, self.directory))
+            dirs[:] = [d for d in dirs if d.name != 'src']
+        self.assertNotIn('src', walked)
+        self.assertIn(os.path.join('docs', 'j'), walked)
+
+    def test_mapBounded(self):
+        import concurrent.futures
+        with concurrent.futures.ThreadPoolExecutor(4) as executor:
+            results = list(paths.mapBounded(executor, lambda x: x * 2,
+                                            iter(range(100)), 8))
+        self.assertEqual(results, [x * 2 for x in range(100)])
+
+
+if __name__ == '__main__':
+    unittest.main()
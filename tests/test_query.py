@@ -0,0 +1,122 @@
+import os
+import sys
+import time
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import query
+
+MB = 1024 ** 2
+NOW = time.time()
+METADATA = {'C:/a/taco.png': {'size': 3 * MB, 'mtime': NOW - 3600,
+                              'width': 4096, 'height': 2048},
+            'C:/a/nacho.jpg': {'size': MB, 'mtime': NOW - 10 * 86400,
+                               'width': 800, 'height': 600},
+            'C:/b/salsa.GIF': {'size': 200 * 1024, 'mtime': NOW - 60,
+                               'width': 64, 'height': 64},
+            'C:/b/taco_night.jpg': {'size': 5 * MB, 'mtime': NOW - 30 * 86400,
+                                    'width': None, 'height': None},
+            'C:/b/missing.png': {}}
+ITEMS = sorted(METADATA)
+
+
+class QueryTest(unittest.TestCase):
+    def filter(self, text, **kwargs):
+        return query.Query(text).filter(ITEMS, metadata=METADATA.get,
+                                        statistics=query.Statistics(),
+                                        **kwargs)
+
+    def test_parse(self):
+        compiled = query.Query('taco, size>2MB -w<100 ext:png|jpg')
+        self.assertEqual(compiled.var_terms[0], ['taco'])
+        self.assertEqual([p.key for p in compiled.var_predicates],
+                         [('size', '>', 2.0 * MB, False),
+                          ('width', '<', 100.0, True),
+                          ('ext', ':', ('.png', '.jpg'), False)])
+        # invalid values are left as terms
+        compiled = query.Query('size>big')
+        self.assertFalse(compiled.var_predicates)
+        self.assertEqual(compiled.var_terms[0], ['size>big'])
+        self.assertIs(query.parse('taco'), query.parse('taco'))
+
+    def test_size(self):
+        self.assertEqual(self.filter('size>2MB'),
+                         ['C:/a/taco.png', 'C:/b/taco_night.jpg'])
+        self.assertEqual(self.filter('size<=1mb'),
+                         ['C:/a/nacho.jpg', 'C:/b/salsa.GIF'])
+        self.assertEqual(self.filter('size=200kb'), ['C:/b/salsa.GIF'])
+
+    def test_dimensions(self):
+        self.assertEqual(self.filter('w>=4096'), ['C:/a/taco.png'])
+        self.assertEqual(self.filter('h<1000'),
+                         ['C:/a/nacho.jpg', 'C:/b/salsa.GIF'])
+        # files without dimensions don't match either way
+        self.assertEqual(self.filter('-h<1000'), ['C:/a/taco.png'])
+
+    def test_mtime(self):
+        self.assertEqual(self.filter('mtime<7d'),
+                         ['C:/a/taco.png', 'C:/b/salsa.GIF'])
+        self.assertEqual(self.filter('mtime>2w'), ['C:/b/taco_night.jpg'])
+        self.assertEqual(self.filter('mtime<5m'), ['C:/b/salsa.GIF'])
+
+    def test_ext(self):
+        self.assertEqual(self.filter('ext:gif'), ['C:/b/salsa.GIF'])
+        self.assertEqual(self.filter('ext:png|.gif'),
+                         ['C:/a/taco.png', 'C:/b/missing.png',
+                          'C:/b/salsa.GIF'])
+        self.assertEqual(self.filter('ext!=jpg'),
+                         ['C:/a/taco.png', 'C:/b/missing.png',
+                          'C:/b/salsa.GIF'])
+        self.assertEqual(self.filter('-ext:jpg'), self.filter('ext!=jpg'))
+
+    def test_termsAndPredicates(self):
+        self.assertEqual(self.filter('taco size>4MB'),
+                         ['C:/b/taco_night.jpg'])
+        self.assertEqual(self.filter('-night size>2MB'), ['C:/a/taco.png'])
+        self.assertEqual(self.filter('taco'),
+                         ['C:/a/taco.png', 'C:/b/taco_night.jpg'])
+        self.assertEqual(self.filter(''), ITEMS)
+
+    def test_cancel(self):
+        items = ITEMS * query.CANCEL_INTERVAL
+        result = query.Query('size>2MB').filter(items, metadata=METADATA.get,
+                                                cancel=[True])
+        self.assertIsNone(result)
+
+    def test_statistics(self):
+        statistics = query.Statistics()
+        compiled = query.Query('size>4MB mtime<52w')
+        size, mtime = [p.key for p in compiled.var_predicates]
+        checks = compiled.checks(METADATA.get, statistics=statistics)
+        self.assertEqual([key for key, check in checks], [mtime, size])
+        compiled.filter(ITEMS, metadata=METADATA.get, statistics=statistics)
+        self.assertEqual(statistics.selectivity(mtime), 4 / 5.0)
+        self.assertEqual(statistics.selectivity(size), 1 / 4.0)
+        # the most selective check runs first once measured
+        checks = compiled.checks(METADATA.get, statistics=statistics)
+        self.assertEqual([key for key, check in checks], [size, mtime])
+
+    def test_similarAndDuplicates(self):
+        compiled = query.Query('similar:taco.png~4 duplicates:*')
+        self.assertEqual(compiled.var_similar, ('taco.png', 4))
+        self.assertTrue(compiled.var_duplicates)
+        calls = []
+
+        def similarity(items, target, distance, cancel):
+            calls.append(('similar', target, distance))
+            return list(reversed(items))
+
+        def duplicates(items, cancel):
+            calls.append(('duplicates',))
+            return items[:3]
+
+        results = compiled.filter(ITEMS, similarity=similarity,
+                                  duplicates=duplicates)
+        self.assertEqual(results, list(reversed(ITEMS[:3])))
+        self.assertEqual(calls, [('duplicates',),
+                                 ('similar', 'taco.png', 4)])
+
+
+if __name__ == '__main__':
+    unittest.main()
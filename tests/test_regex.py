@@ -0,0 +1,82 @@
+import itertools
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import regex
+
+ITEMS = ['C:/images/Taco.png', 'C:/images/taco_night.JPG',
+         'C:/images/burrito.png', 'C:/images/tacos/salsa.gif',
+         'C:/images/[draft] taco (1).png', 'C:/images/a.b.c.tif',
+         'D:/archive/Taco$.png', 'D:/archive/nacho.jpeg',
+         'D:/archive/TACO.PNG', 'D:/archive/x.png']
+TERMS = ['taco', 'TACO', 'png', '.png', 'images', '*.png', 'ta*o',
+         '[draft]', '(1)', 'taco$', 'a.b', 'nacho|burrito', 'ta?o']
+
+
+def precompiled(item, includes=[], excludes=[], required=[], starts=[],
+                ends=[], unified_excludes=False, case_sensitive=False):
+    """Match the item with the regExpressions of precompile, the way the
+     filters evaluated items before the Matcher"""
+    regs = regex.precompile(includes=includes, excludes=excludes,
+                            required=required, starts=starts, ends=ends,
+                            unified_excludes=unified_excludes,
+                            case_sensitive=case_sensitive)
+    includesREGs, excludesREGs, requiredREGs, startsREGs, endsREGs = regs
+    return (all(r.search(item) for r in requiredREGs) and
+            all(r.search(item) for r in endsREGs) and
+            not any(r.search(item) for r in excludesREGs) and
+            all(r.search(item) for r in startsREGs) and
+            all(r.search(item) for r in includesREGs))
+
+
+class MatcherTest(unittest.TestCase):
+    def assertMatchesPrecompile(self, **terms):
+        matcher = regex.Matcher(**terms)
+        for item in ITEMS:
+            self.assertEqual(matcher.match(item), precompiled(item, **terms),
+                             '{} {}'.format(item, terms))
+
+    def test_singleTerms(self):
+        for term in TERMS:
+            for kind in ('includes', 'excludes', 'required', 'starts',
+                         'ends'):
+                for case_sensitive in (False, True):
+                    self.assertMatchesPrecompile(
+                        case_sensitive=case_sensitive, **{kind: [term]})
+
+    def test_combinedTerms(self):
+        for first, second in itertools.combinations(TERMS, 2):
+            self.assertMatchesPrecompile(includes=[first, second])
+            self.assertMatchesPrecompile(required=[first, second])
+            self.assertMatchesPrecompile(excludes=[first, second])
+            self.assertMatchesPrecompile(excludes=[first, second],
+                                         unified_excludes=True)
+            self.assertMatchesPrecompile(includes=[first], excludes=[second])
+            self.assertMatchesPrecompile(starts=['c:/', 'd:/'],
+                                         ends=[first, second])
+
+    def test_manyLiterals(self):
+        # enough literal terms to be matched with a single alternation
+        terms = ['term{}'.format(i) for i in range(regex.ALTERNATION_THRESHOLD)]
+        self.assertMatchesPrecompile(includes=terms + ['taco'])
+        self.assertMatchesPrecompile(includes=terms + ['TACO'],
+                                     case_sensitive=True)
+
+    def test_nameAndPath(self):
+        matcher = regex.Matcher(includes=['taco'], starts=['sal'],
+                                ends=['.gif'])
+        self.assertTrue(matcher.matchName('salsa.gif'))
+        self.assertFalse(matcher.matchName('nacho.gif'))
+        self.assertTrue(matcher.matchPath('C:/images/tacos/salsa.gif'))
+        self.assertFalse(matcher.matchPath('C:/images/salsa.gif'))
+
+    def test_literal(self):
+        self.assertTrue(regex.Matcher(includes=['taco', '.png']).isLiteral())
+        self.assertFalse(regex.Matcher(includes=['*.png']).isLiteral())
+
+
+if __name__ == '__main__':
+    unittest.main()
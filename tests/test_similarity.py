@@ -0,0 +1,78 @@
+import os
+import random
+import sys
+import unittest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.append(os.path.join(ROOT, 'external'))
+
+import similarity
+
+
+def randomPixels(generator, size=32):
+    return [[generator.randrange(256) for x in range(size)]
+            for y in range(size)]
+
+
+class PerceptualHashTest(unittest.TestCase):
+    def fallbackHash(self, pixels):
+        """pHash computed without NumPy"""
+        numpy = similarity.numpy
+        cosines = dict(similarity._COSINES)
+        similarity.numpy = None
+        similarity._COSINES.clear()
+        try:
+            return similarity.phash(pixels)
+        finally:
+            similarity.numpy = numpy
+            similarity._COSINES.clear()
+            similarity._COSINES.update(cosines)
+
+    def test_fallbackMedian(self):
+        # 31 of the 63 coefficients after the average brightness are above
+        # their median
+        generator = random.Random(0)
+        for n in range(20):
+            value = self.fallbackHash(randomPixels(generator))
+            self.assertEqual(bin(value & (2 ** 63 - 1)).count('1'), 31)
+
+    @unittest.skipIf(similarity.numpy is None, 'NumPy is not installed')
+    def test_fallbackMatchesNumpy(self):
+        generator = random.Random(1)
+        for n in range(200):
+            pixels = randomPixels(generator)
+            self.assertEqual(similarity.phash(pixels),
+                             self.fallbackHash(pixels))
+
+
+class SimilarityIndexTest(unittest.TestCase):
+    def test_update(self):
+        index = similarity.SimilarityIndex()
+        hashes = dict(('{}.png'.format(n), {'dhash': n, 'phash': n})
+                      for n in range(1000))
+        paths = sorted(hashes) + ['missing.png']
+        self.assertEqual(index.update(paths, hasher=hashes.get), 1000)
+        self.assertEqual(len(index), 1000)
+        # only the new images are hashed
+        self.assertEqual(index.update(paths, hasher=hashes.get), 0)
+        similar = index.similar('3.png', 1)
+        self.assertEqual(similar[0], (0, '3.png'))
+        self.assertEqual(set(p for d, p in similar),
+                         set('{}.png'.format(3 ^ 1 << bit) for bit in range(10))
+                         | {'3.png'})
+
+    def test_cancel(self):
+        index = similarity.SimilarityIndex()
+        cancel = [False]
+
+        def hasher(path):
+            cancel[0] = True
+            return {'dhash': 0, 'phash': 0}
+        paths = ['{}.png'.format(n) for n in range(1000)]
+        self.assertIsNone(index.update(paths, cancel=cancel, hasher=hasher))
+        self.assertLess(len(index), 1000)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,246 @@
+import os
+import sqlite3
+import threading
+import time
+
+import paths
+
+
+class ThumbnailCache(object):
+    BUDGET = 1024 ** 3
+    COMMIT_INTERVAL = 200
+    # seconds before the access time of a thumbnail is written again, reads
+    # of recently used thumbnails don't write to the database
+    ACCESS_INTERVAL = 3600
+    # fraction of free pages in the database worth compacting it for
+    COMPACT_RATIO = 0.25
+
+    def __init__(self, path=None, budget=BUDGET):
+        """Persistent store of encoded thumbnails in SQLite, so folders that
+         were visited before don't have to decode their images again.
+        Thumbnails are keyed by the file path and resolution, and only
+         returned while the file's size and mtime match the stored ones.
+        The least recently used thumbnails are evicted once the stored bytes
+         exceed the budget.
+        Perceptual hashes of the images are stored alongside, validated the
+         same way.
+
+        :param path: 'str' database file, defaults to the user cache directory
+        :param budget: 'int' maximum number of thumbnail bytes to store
+        """
+        if path is None:
+            path = os.path.join(paths.cacheDir(), 'thumbnails.db')
+        self.var_path = path
+        self.var_budget = budget
+        self._lock = threading.RLock()
+        self._pending = 0
+        # the cache is shared by the decoder threads, access is serialized by
+        # the lock
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.execute('PRAGMA journal_mode=WAL')
+        self._connection.execute('PRAGMA synchronous=NORMAL')
+        self._connection.execute(
+            'CREATE TABLE IF NOT EXISTS thumbnails '
+            '(path TEXT, resolution INTEGER, size INTEGER, mtime REAL, '
+            'native_width INTEGER, native_height INTEGER, data BLOB, '
+            'bytes INTEGER, accessed REAL, PRIMARY KEY (path, resolution))')
+        self._connection.execute(
+            'CREATE INDEX IF NOT EXISTS thumbnails_accessed '
+            'ON thumbnails (accessed)')
+        self._connection.execute(
+            'CREATE TABLE IF NOT EXISTS hashes '
+            '(path TEXT PRIMARY KEY, size INTEGER, mtime REAL, '
+            'dhash INTEGER, phash INTEGER)')
+        self._connection.commit()
+        self._bytes = self._connection.execute(
+            'SELECT COALESCE(SUM(bytes), 0) FROM thumbnails').fetchone()[0]
+        self.compact()
+
+    def close(self):
+        """Commit any pending thumbnails and close the database, the cache
+         can't be used afterwards"""
+        with self._lock:
+            self._connection.commit()
+            self._connection.close()
+
+    def commit(self):
+        """Write the pending thumbnails to the database"""
+        with self._lock:
+            self._connection.commit()
+            self._pending = 0
+
+    def get(self, path, resolution):
+        """Stored thumbnail of the file, if the file didn't change since
+
+        :param path: 'str' file path
+        :param resolution: 'int' maximum width and height of the thumbnail
+        :return: 'list' encoded thumbnail data and the full resolution width
+            and height of the image, None if not stored or out of date
+        """
+        path = str(path)
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        with self._lock:
+            row = self._connection.execute(
+                'SELECT size, mtime, native_width, native_height, data, '
+                'accessed FROM thumbnails WHERE path = ? AND resolution = ?',
+                (path, resolution)).fetchone()
+            if row is None:
+                return None
+            size, mtime, width, height, data, accessed = row
+            if size != stat.st_size or mtime != stat.st_mtime:
+                self._remove(path, resolution)
+                return None
+            now = time.time()
+            if now - accessed > self.ACCESS_INTERVAL:
+                self._connection.execute(
+                    'UPDATE thumbnails SET accessed = ? '
+                    'WHERE path = ? AND resolution = ?',
+                    (now, path, resolution))
+                self._written()
+        return data, width, height
+
+    def put(self, path, resolution, data, width, height):
+        """Store the thumbnail of the file
+
+        :param path: 'str' file path
+        :param resolution: 'int' maximum width and height of the thumbnail
+        :param data: 'bytes' encoded thumbnail
+        :param width: 'int' full resolution width of the image
+        :param height: 'int' full resolution height of the image
+        """
+        path = str(path)
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return
+        data = bytes(data)
+        with self._lock:
+            self._remove(path, resolution)
+            self._connection.execute(
+                'INSERT INTO thumbnails VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                (path, resolution, stat.st_size, stat.st_mtime, width, height,
+                 sqlite3.Binary(data), len(data), time.time()))
+            self._bytes += len(data)
+            if self._bytes > self.var_budget:
+                self.evict()
+            self._written()
+
+    def getHashes(self, path):
+        """Stored perceptual hashes of the image, if the file didn't change
+         since
+
+        :param path: 'str' file path
+        :return: 'dict' 'dhash' and 'phash' of the image, None if not stored
+            or out of date
+        """
+        path = str(path)
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        with self._lock:
+            row = self._connection.execute(
+                'SELECT size, mtime, dhash, phash FROM hashes WHERE path = ?',
+                (path,)).fetchone()
+            if row is None:
+                return None
+            size, mtime, dhash, phash = row
+            if size != stat.st_size or mtime != stat.st_mtime:
+                self._connection.execute('DELETE FROM hashes WHERE path = ?',
+                                         (path,))
+                self._written()
+                return None
+        # sqlite integers are signed
+        return {'dhash': dhash % 2 ** 64, 'phash': phash % 2 ** 64}
+
+    def putHashes(self, path, dhash, phash):
+        """Store the perceptual hashes of the image
+
+        :param path: 'str' file path
+        :param dhash: 'int' 64 bit difference hash
+        :param phash: 'int' 64 bit perceptual hash
+        """
+        path = str(path)
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return
+        signed = [h - 2 ** 64 if h >= 2 ** 63 else h for h in (dhash, phash)]
+        with self._lock:
+            self._connection.execute(
+                'INSERT OR REPLACE INTO hashes VALUES (?, ?, ?, ?, ?)',
+                [path, stat.st_size, stat.st_mtime] + signed)
+            self._written()
+
+    def evict(self, budget=None):
+        """Remove the least recently used thumbnails until the stored bytes
+         fit the budget
+
+        :param budget: 'int' number of bytes to keep, defaults to the budget
+            of the cache
+        :return: 'int' number of thumbnails removed
+        """
+        if budget is None:
+            budget = self.var_budget
+        count = 0
+        with self._lock:
+            rows = self._connection.execute(
+                'SELECT path, resolution, bytes FROM thumbnails '
+                'ORDER BY accessed')
+            removals = []
+            total = self._bytes
+            for path, resolution, size in rows:
+                if total <= budget:
+                    break
+                removals.append((path, resolution))
+                total -= size
+            for path, resolution in removals:
+                self._remove(path, resolution)
+                count += 1
+            self.commit()
+        return count
+
+    def compact(self, force=False):
+        """Reclaim the space of removed thumbnails from the database file,
+         only when enough of it is unused unless forced.
+
+        :param force: 'bool' compact even if little space would be reclaimed
+        :return: 'bool' database was compacted
+        """
+        with self._lock:
+            pages = self._connection.execute('PRAGMA page_count').fetchone()[0]
+            free = self._connection.execute(
+                'PRAGMA freelist_count').fetchone()[0]
+            if not pages or (not force and free < pages * self.COMPACT_RATIO):
+                return False
+            self.commit()
+            self._connection.execute('VACUUM')
+        return True
+
+    def nbytes(self):
+        """Number of thumbnail bytes stored
+
+        :return: 'int' bytes stored
+        """
+        return self._bytes
+
+    def _remove(self, path, resolution):
+        """Remove a stored thumbnail, with the lock held"""
+        row = self._connection.execute(
+            'SELECT bytes FROM thumbnails WHERE path = ? AND resolution = ?',
+            (path, resolution)).fetchone()
+        if row is None:
+            return
+        self._connection.execute(
+            'DELETE FROM thumbnails WHERE path = ? AND resolution = ?',
+            (path, resolution))
+        self._bytes -= row[0]
+
+    def _written(self):
+        """Count a change, committing them in batches, with the lock held"""
+        self._pending += 1
+        if self._pending >= self.COMMIT_INTERVAL:
+            self.commit()
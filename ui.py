@@ -1,8 +1,12 @@
+import bisect
+import collections
+import functools
 import os
+import time
 
 from PySide2 import QtGui, QtCore, QtWidgets
 
-import paths, lists, multiThread
+import duplicates, iconCache, imageHeader, metadataCatalog, paths, pathCatalog, lists, multiProcess, multiThread, pipeline, query, scanIndex, similarity, thumbnailCache, watcher
 
 
 
@@ -35,61 +39,409 @@ class DockWidget(QtWidgets.QDockWidget):
 
 class ImageIcon(QtGui.QIcon):
     MOVIE_TYPES = '.gif'.split()
+    # types that may embed a JPEG preview in their header
+    PREVIEW_TYPES = '.jpg .jpeg .jpe .tif .tiff .dng .nef .cr2 .arw'.split()
+    SIZE = 256
 
-    def __init__(self, path):
-        """Widget used to load supported image types as a picture image or an
-         animated movie in a view that support icons.
+    def __init__(self, path, image=None, native=None, size=SIZE,
+                 preview=False):
+        """Widget used to load supported image types as a picture image in a
+         view that support icons. Images are decoded scaled down to the icon
+         size rather than at their full resolution, animated images show their
+         first frame and are played by an ImageAnimation.
         Reimplementation of QtGui.QIcon.
 
 
         :param path: 'str' File path that will attempt to be loaded onto
-            QIcon as image or movie.
+            QIcon as image.
+        :param image: 'QtGui.QImage' image already read from the path, see
+            'read'
+        :param native: 'QtCore.QSize' full resolution of the image read
+        :param size: 'int' maximum width and height the image is decoded at
+        :param preview: 'bool' image is a low resolution preview, to be
+            replaced by the decoded image
         """
-        super(ImageIcon, self).__init__(str(path))
+        super(ImageIcon, self).__init__()
 
         self.var_path = path
-        self.var_item = None
-        self.var_column = None
         self.var_pixmap = None
-        self.var_movie = None
+        self.var_native = native
+        self.var_preview = preview
+        self.var_size = size
         # setup pixmap for icon
-        if path.suffix.lower() not in self.MOVIE_TYPES:
-            pixmap = QtGui.QPixmap(str(path))
-            self.addPixmap(pixmap, QtGui.QIcon.Normal, QtGui.QIcon.Off)
+        if image is None:
+            image, self.var_native = self.read(path, size)
+        pixmap = QtGui.QPixmap.fromImage(image)
+        self.addPixmap(pixmap, QtGui.QIcon.Normal, QtGui.QIcon.Off)
+        self.var_pixmap = pixmap
+        if self.var_native is None or not self.var_native.isValid():
+            self.var_native = pixmap.size()
+
+    @classmethod
+    def animated(cls, path):
+        """Check if the file is an animated type, played by an ImageAnimation
+
+        :param path: 'str' file path of the image
+        :return: 'bool' file can be animated
+        """
+        return os.path.splitext(str(path))[1].lower() in cls.MOVIE_TYPES
+
+    @staticmethod
+    def scaledSize(native, size):
+        """Size fitting the image within the maximum size
+
+        :param native: 'QtCore.QSize' full resolution of the image
+        :param size: 'int' maximum width and height
+        :return: 'QtCore.QSize' scaled size, None if the image already fits
+            or its size is unknown
+        """
+        if not native.isValid():
+            return None
+        if native.width() <= size and native.height() <= size:
+            return None
+        return native.scaled(size, size, QtCore.Qt.KeepAspectRatio)
+
+    @classmethod
+    def read(cls, path, size=SIZE, cache=None):
+        """Read the image of the path scaled down to fit the size. The full
+         resolution is read from the header, and formats like JPEG decode
+         straight to the reduced size. Unlike a QPixmap, a QImage can be read
+         outside of the main thread.
+
+        :param path: 'str' file path of the image
+        :param size: 'int' maximum width and height of the image
+        :param cache: 'thumbnailCache.ThumbnailCache' persistent cache checked
+            before decoding and storing the decoded image
+        :return: 'list' QtGui.QImage image and QtCore.QSize full resolution,
+            only the first frame is read from animated images
+        """
+        if cache is not None:
+            stored = cache.get(path, size)
+            if stored:
+                data, width, height = stored
+                image = QtGui.QImage.fromData(data)
+                if not image.isNull():
+                    return image, QtCore.QSize(width, height)
+        reader = QtGui.QImageReader(str(path))
+        native = reader.size()
+        scaled = cls.scaledSize(native, size)
+        if scaled is not None:
+            reader.setScaledSize(scaled)
+        image = reader.read()
+        if not native.isValid() and \
+                (image.width() > size or image.height() > size):
+            # formats without a header size are scaled after decoding, their
+            # full resolution is the decoded one
+            native = image.size()
+            image = image.scaled(size, size, QtCore.Qt.KeepAspectRatio,
+                                 QtCore.Qt.SmoothTransformation)
+        if cache is not None and not image.isNull():
+            cache.put(path, size, cls.encode(image), native.width(),
+                      native.height())
+        return image, native
+
+    @classmethod
+    def preview(cls, path, size=SIZE):
+        """Read the preview embedded in the header of the file, such as an
+         EXIF thumbnail, reading kilobytes rather than the whole image.
+
+        :param path: 'str' file path of the image
+        :param size: 'int' maximum width and height of the image
+        :return: 'list' QtGui.QImage preview and QtCore.QSize full resolution,
+            None and None if the file has no preview
+        """
+        if os.path.splitext(str(path))[1].lower() not in cls.PREVIEW_TYPES:
+            return None, None
+        header = imageHeader.read(path)
+        if not header.preview:
+            return None, None
+        image = QtGui.QImage.fromData(header.preview)
+        if image.isNull():
+            return None, None
+        if image.width() > size or image.height() > size:
+            image = image.scaled(size, size, QtCore.Qt.KeepAspectRatio,
+                                 QtCore.Qt.FastTransformation)
+        native = QtCore.QSize(header.width, header.height)
+        return image, native
+
+    @staticmethod
+    def encode(image):
+        """Compress the image to store it
+
+        :param image: 'QtGui.QImage' image to compress
+        :return: 'bytes' PNG data
+        """
+        data = QtCore.QByteArray()
+        buffer = QtCore.QBuffer(data)
+        buffer.open(QtCore.QIODevice.WriteOnly)
+        image.save(buffer, 'PNG')
+        buffer.close()
+        return data.data()
+
+    def nbytes(self):
+        """Approximate number of bytes used by the icon's pixmaps
+
+        :return: 'int' bytes used
+        """
+        pixmap = self.var_pixmap
+        return pixmap.width() * pixmap.height() * max(pixmap.depth(), 8) // 8
+
+
+class ImageAnimation(QtCore.QObject):
+    signal_frame = QtCore.Signal(str)
+
+    # maximum number of animations playing at once, over all the views
+    LIMIT = 4
+    # maximum number of bytes of frames kept by each animation
+    FRAME_BUDGET = 32 * 1024 ** 2
+    # milliseconds between frames of images not specifying a delay
+    FRAME_DELAY = 100
+
+    _playing = collections.OrderedDict()
+
+    def __init__(self, path, size=ImageIcon.SIZE, parent=None):
+        """Player of an animated image, only created for the cells that are
+         hovered or current, so the memory used doesn't depend on how many
+         animated images are displayed. Frames are decoded scaled down to the
+         size, and kept to loop over while they fit the frame budget,
+         otherwise the image is decoded again on every loop.
+        Only LIMIT animations play at once, starting another one stops the
+         one playing the longest.
+
+        :param path: 'str' file path of the animated image
+        :param size: 'int' maximum width and height the frames are decoded at
+        :param parent: 'QtCore.QObject' parent of the animation
+        """
+        super(ImageAnimation, self).__init__(parent)
+        self.var_path = path
+        self.var_size = size
+        self.var_pixmap = None
+        self.var_frames = []
+        self.var_frame = 0
+        self.var_bytes = 0
+        # all the frames are kept, the file doesn't need to be read again
+        self.var_complete = False
+        # the frames exceed the budget, they're decoded on every loop instead
+        self.var_streamed = False
+        self._reader = None
+        self.ui_timer = QtCore.QTimer(self)
+        self.ui_timer.setSingleShot(True)
+        self.ui_timer.timeout.connect(self.on_frame_next)
+
+    def playing(self):
+        """Check if the animation is playing
+
+        :return: 'bool' animation is playing
+        """
+        return id(self) in ImageAnimation._playing
+
+    def start(self):
+        """Play the animation from its first frame, stopping the animation
+         playing the longest if too many are playing."""
+        playing = ImageAnimation._playing
+        if id(self) in playing:
+            return
+        while len(playing) >= ImageAnimation.LIMIT:
+            playing.popitem(last=False)[1].stop()
+        playing[id(self)] = self
+        self.var_frame = 0
+        self.on_frame_next()
+
+    def stop(self):
+        """Stop the animation, releasing its frames and the file so the cell
+         shows the icon again."""
+        self.ui_timer.stop()
+        ImageAnimation._playing.pop(id(self), None)
+        self._reader = None
+        self.var_frames = []
+        self.var_bytes = 0
+        self.var_frame = 0
+        self.var_complete = False
+        self.var_streamed = False
+        self.var_pixmap = None
+        self.signal_frame.emit(self.var_path)
+
+    def on_frame_next(self):
+        """Show the next frame and wait for the frame's delay.
+        Called by 'ui_timer' timeout signal.
+        """
+        if self.var_complete:
+            pixmap, delay = self.var_frames[self.var_frame]
+            self.var_frame = (self.var_frame + 1) % len(self.var_frames)
         else:
-            # need to hook into to a movie 'frameChanged' signal to animate
-            self.var_movie = QtGui.QMovie(str(path))
-            pixmap = self.var_movie.currentPixmap()
-            self.addPixmap(pixmap, QtGui.QIcon.Normal, QtGui.QIcon.Off)
-            self.var_movie.frameChanged.connect(self.on_image_update)
+            frame = self._read()
+            if frame is None:
+                self.stop()
+                return
+            pixmap, delay = frame
         self.var_pixmap = pixmap
+        self.signal_frame.emit(self.var_path)
+        if self.var_complete and len(self.var_frames) == 1:
+            # a single frame has nothing to play
+            return
+        self.ui_timer.start(delay if delay > 0 else self.FRAME_DELAY)
+
+    def _read(self):
+        """Decode the next frame of the file, keeping it while the frames fit
+         the budget and starting over at the end of the file.
+
+        :return: 'list' QtGui.QPixmap frame and its delay, None if the file
+            can't be read
+        """
+        for attempt in range(2):
+            if self._reader is None:
+                self._reader = QtGui.QImageReader(str(self.var_path))
+                scaled = ImageIcon.scaledSize(self._reader.size(),
+                                              self.var_size)
+                if scaled is not None:
+                    self._reader.setScaledSize(scaled)
+            image = self._reader.read()
+            if not image.isNull():
+                break
+            # the end of the file, loop over the kept frames if all of them
+            # fit, otherwise read the file again
+            self._reader = None
+            if self.var_frames and not self.var_streamed:
+                self.var_complete = True
+                self.var_frame = 1 % len(self.var_frames)
+                return self.var_frames[0]
+        else:
+            return None
+        delay = self._reader.nextImageDelay()
+        pixmap = QtGui.QPixmap.fromImage(image)
+        if not self.var_streamed:
+            self.var_bytes += image.byteCount()
+            if self.var_bytes > self.FRAME_BUDGET:
+                self.var_streamed = True
+                self.var_frames = []
+            else:
+                self.var_frames.append((pixmap, delay))
+        return pixmap, delay
 
-    def on_image_update(self, frame):
-        """Updates the render image of the icon to the give frame number.
 
-        :param frame: 'int' Movie frame number to render onto the icon.
+class ImageModel(QtCore.QAbstractListModel):
+    def __init__(self, icons=None, parent=None):
+        """Model of the files displayed in an ImageView. Icons are looked up
+         as the cells are painted, so only the visible cells are materialized
+         no matter how many files there are.
+        Reimplementation of QtCore.QAbstractListModel
+
+        :param icons: 'iconCache.IconCache' icons of the files by path
+        :param parent: 'QtCore.QObject' parent of the model
         """
-        if not self.var_movie:
+        super(ImageModel, self).__init__(parent)
+        self.var_files = []
+        self.var_rows = {}
+        self.var_icons = iconCache.IconCache() if icons is None else icons
+        self.var_animations = {}
+
+    def rowCount(self, parent=QtCore.QModelIndex()):
+        """Number of files in the model.
+        Reimplementation of inherited function.
+        """
+        if parent.isValid():
+            return 0
+        return len(self.var_files)
+
+    def data(self, index, role=QtCore.Qt.DisplayRole):
+        """Icon, name and path of the file at the index, icons still being
+         decoded show the file name until they're created. Animations that
+         are playing show their current frame instead of the icon.
+        Reimplementation of inherited function.
+        """
+        if not index.isValid():
+            return None
+        path = self.var_files[index.row()]
+        if role == QtCore.Qt.DecorationRole:
+            animation = self.var_animations.get(str(path))
+            if animation is not None and animation.var_pixmap is not None:
+                return animation.var_pixmap
+            # painting doesn't count as a lookup of the cache, the decoder
+            # looking for the icons it has to create does
+            return self.var_icons.peek(str(path))
+        if role == QtCore.Qt.DisplayRole:
+            if str(path) in self.var_icons:
+                return None
+            return os.path.basename(str(path))
+        if role == QtCore.Qt.ToolTipRole:
+            return str(path)
+        if role == QtCore.Qt.UserRole:
+            return path
+        return None
+
+    def on_file_set(self, files, rows=None):
+        """Display the files, resetting the model.
+
+        :param files: 'list' files to be displayed
+        :param rows: 'dict' row of each file path, built on the first icon
+            update if not given
+        """
+        self.beginResetModel()
+        self.var_files = files
+        self.var_rows = rows
+        self.endResetModel()
+
+    def on_icon_update(self, path):
+        """Repaint the cell of the file after its icon changed.
+
+        :param path: 'str' file path of the icon
+        """
+        if self.var_rows is None:
+            self.var_rows = dict((str(f), i)
+                                 for i, f in enumerate(self.var_files))
+        row = self.var_rows.get(str(path))
+        if row is None:
             return
-        self.var_item.setIcon(self.var_column, self.var_movie.currentPixmap())
+        index = self.index(row)
+        self.dataChanged.emit(index, index)
 
 
-class ImageView(QtWidgets.QTreeWidget):
+class ImageView(QtWidgets.QListView):
     signal_file_selected = QtCore.Signal(str)
 
+    FRAME_BUDGET = 0.008
+    # pages of cells to load ahead of the scroll direction, and behind it
+    PREFETCH_AHEAD = 1.0
+    PREFETCH_BEHIND = 0.5
+
     def __init__(self, *args, **kwargs):
         """A view that displays supported image types in a panel. Icons can be
          scaled up by holding 'Ctrl and scrolling', and rearrange to fill in a
          resized panel.
-        Reimplementation of QtWidgets.QTreeWidget
+        The files are displayed through an ImageModel in icon mode, so
+         resizing and zooming only lay out the grid again.
+        Reimplementation of QtWidgets.QListView
 
         :param args: standard inputs for a inherited class
         :param kwargs: standard inputs for a inherited class
         """
         super(ImageView, self).__init__(*args, **kwargs)
         self.var_files = []
-        self.var_icons = {}
+        # icons are evicted once over the budget, except the visible ones
+        self.var_icons = iconCache.IconCache(evicted=self.on_icon_evict)
         self.var_icon_maximum = 0
+        self.var_icon_size = ImageIcon.SIZE
+        # decoded thumbnails persist between sessions
+        self.var_thumbnail_cache = thumbnailCache.ThumbnailCache()
+        # icons are requested from the viewport, visible cells first. The
+        # images read on the decoder threads wait for their icons to be
+        # created on the main thread
+        self.var_decoder = multiThread.PriorityPool(name='generateIcons',
+                                                    maxThreadCount=8)
+        self.var_decoded = collections.deque()
+        # keys of the reads queued, running or waiting for their icons, so
+        # scrolling doesn't request them again
+        self.var_requested = set()
+        self.var_scroll_direction = 1
+        self.var_process_decoder = None
+        # decoders replaced by larger ones, closed once the decoding settles
+        self.var_decoders_retired = []
+        self.var_model = ImageModel(self.var_icons, self)
+        # animations of the hovered and current cells, shown by the model
+        self.var_animations = self.var_model.var_animations
+        self.var_hovered = None
+        self.var_closed = False
+        self.ui_timer = None
 
         self.on_ui_create()
 
@@ -107,53 +459,70 @@ class ImageView(QtWidgets.QTreeWidget):
             delta = event.delta()
             if delta == abs(delta):
                 # clamp the new size to prevent some troublesome scaling
-                newSize = min(self.var_icon_maximum, oldSize * 1.4)
+                newSize = int(min(self.var_icon_maximum, oldSize * 1.4))
             else:
-                newSize = max(100, oldSize / 1.4)
+                newSize = int(max(100, oldSize / 1.4))
             self.setIconSize(QtCore.QSize(newSize, newSize))
+            # the icons are decoded at a reduced size, decode them again when
+            # zooming in past it
+            if newSize > self.var_icon_size:
+                while self.var_icon_size < newSize:
+                    self.var_icon_size *= 2
+                # the icons stay displayed until they're replaced at the new
+                # size
+                self.on_decoder_resize()
             # reorganize the scaled images
             self.on_ui_reorganize()
         # maintain the original functionality of this event
         return super(ImageView, self).wheelEvent(event)
 
     def resizeEvent(self, event):
-        """Toggle the playback state of movies that are active as we resize
-         the window, in order to prevent some issues in pixmap updates as the
-         contents get reorganized.
+        """Request the icons of the cells brought into view as the grid is
+         laid out again.
         Reimplementation of inherited function.
         """
-        # check if the current selected item has a movie
-        movie = False
-        indices = self.selectedIndexes()
-        if indices:
-            index = indices[0]
-            path = self.itemFromIndex(index).toolTip(index.column())
-            if path and self.var_icons[path].var_movie:
-                icon = self.var_icons[path]
-                movie = True
-        # TODO: There are some limitations to using a tree view for this type
-        #  of scheme. Will need to look into a tableView and see if a different
-        #  model may help with the hacked together functionality we're roping in.
-        # disable the movie
-        if movie:
-            icon.var_movie.stop()
-        self.on_ui_reorganize()
-        # re-enable the movie
-        if movie:
-            icon.var_movie.start()
+        result = super(ImageView, self).resizeEvent(event)
+        self.on_icon_pin()
+        return result
+
+    def scrollContentsBy(self, dx, dy):
+        """Keep the icons scrolled into view in memory, and load ahead in the
+         direction of the scroll.
+        Reimplementation of inherited function.
+        """
+        if dy:
+            self.var_scroll_direction = 1 if dy < 0 else -1
+        result = super(ImageView, self).scrollContentsBy(dx, dy)
+        self.on_icon_pin()
+        return result
+
+    def mouseMoveEvent(self, event):
+        """Play the animation of the hovered cell, stopping the previously
+         hovered one.
+        Reimplementation of inherited function.
+        """
+        index = self.indexAt(event.pos())
+        path = index.data(QtCore.Qt.ToolTipRole) if index.isValid() else None
+        self.on_movie_hover(path)
         # maintain the original functionality of this event
-        return super(ImageView, self).resizeEvent(event)
+        return super(ImageView, self).mouseMoveEvent(event)
+
+    def leaveEvent(self, event):
+        """Stop the animation of the hovered cell.
+        Reimplementation of inherited function.
+        """
+        self.on_movie_hover(None)
+        # maintain the original functionality of this event
+        return super(ImageView, self).leaveEvent(event)
 
     def mouseDoubleClickEvent(self, event):
-        """Find the selected path from the item's columns and pass it into the
+        """Find the selected path from the item's index and pass it into the
          file selection signal.
         Reimplementation of inherited function.
         """
-        position = event.pos()
-        index = self.indexAt(position)
-        item = self.itemFromIndex(index)
-        if item:
-            path = item.toolTip(index.column())
+        index = self.indexAt(event.pos())
+        if index.isValid():
+            path = index.data(QtCore.Qt.ToolTipRole)
             if path:
                 self.signal_file_selected.emit(path)
         # maintain the original functionality of this event
@@ -162,131 +531,449 @@ class ImageView(QtWidgets.QTreeWidget):
     def on_ui_create(self):
         """Setups up view settings to a consistent configuration and standard
         signal connections."""
+        self.setModel(self.var_model)
+        self.setViewMode(self.IconMode)
+        self.setResizeMode(self.Adjust)
+        self.setMovement(self.Static)
+        self.setWrapping(True)
+        self.setUniformItemSizes(True)
+        self.setVerticalScrollMode(self.ScrollPerPixel)
         self.setSelectionMode(self.NoSelection)
+        # hovered cells play their animations
+        self.setMouseTracking(True)
         self.setIconSize(QtCore.QSize(150, 150))
         self.setSizePolicy(QtWidgets.QSizePolicy.Expanding,
                            QtWidgets.QSizePolicy.Expanding)
+        self.on_ui_reorganize()
+        # the decoded images are turned into icons in batches between repaints
+        self.ui_timer = QtCore.QTimer(self)
+        self.ui_timer.setInterval(0)
         # signal connections
-        self.currentItemChanged.connect(self.on_movie_toggle)
+        self.selectionModel().currentChanged.connect(self.on_movie_toggle)
+        self.ui_timer.timeout.connect(self.on_icon_batch)
 
-    def on_movie_toggle(self, currentItem, previousItem):
+    def on_movie_toggle(self, current, previous):
         """Enable movie playback on selected item index and disable playback on
         previously selected item.
-        Called by 'currentItemChanged' signal.
-        """
-        if previousItem:
-            # since we don't know the column of the previous select index,
-            # disable all movies in the given previous item
-            for i in range(self.columnCount()):
-                path = previousItem.toolTip(i)
-                if not path:
-                    continue
-                icon = self.var_icons[path]
-                if icon.var_movie:
-                    icon.var_movie.stop()
-                    icon.var_movie.jumpToFrame(0)
-        if currentItem:
+        Called by 'currentChanged' signal.
+        """
+        if previous.isValid():
+            path = previous.data(QtCore.Qt.ToolTipRole)
+            if path != self.var_hovered:
+                self.on_movie_stop(path)
+        if current.isValid():
             # enable the movie of the current item index
-            position = self.mapFromGlobal(QtGui.QCursor().pos())
-            index = self.indexAt(position)
-            path = currentItem.toolTip(index.column())
-            if path and self.var_icons[path].var_movie:
-                self.var_icons[path].var_movie.start()
+            self.on_movie_play(current.data(QtCore.Qt.ToolTipRole))
+
+    def on_movie_hover(self, path):
+        """Play the animation of the hovered file, stopping the one of the
+         previously hovered file unless it's the current item.
+
+        :param path: 'str' file path of the hovered cell, None if no cell is
+            hovered
+        """
+        if path == self.var_hovered:
+            return
+        previous = self.var_hovered
+        self.var_hovered = path
+        current = self.currentIndex()
+        if previous and (not current.isValid() or
+                         previous != current.data(QtCore.Qt.ToolTipRole)):
+            self.on_movie_stop(previous)
+        if path:
+            self.on_movie_play(path)
+
+    def on_movie_play(self, path):
+        """Start the animation of an animated file, decoding its frames at
+         the icon size. Icons of still images are left as they are.
+
+        :param path: 'str' file path of the animated image
+        """
+        if not ImageIcon.animated(path):
+            return
+        animation = self.var_animations.get(path)
+        if animation is None:
+            animation = ImageAnimation(path, self.iconSize().width(), self)
+            animation.signal_frame.connect(self.on_movie_frame)
+            self.var_animations[path] = animation
+        animation.start()
+
+    def on_movie_stop(self, path):
+        """Stop the animation of the file, releasing its frames.
+
+        :param path: 'str' file path of the animated image
+        """
+        animation = self.var_animations.pop(path, None)
+        if animation is not None:
+            animation.stop()
+            animation.deleteLater()
+
+    def on_movie_frame(self, path):
+        """Repaint the cell of an animation showing a new frame, dropping the
+         animations stopped to make room for others.
+        Called by the animation's 'signal_frame' signal.
+
+        :param path: 'str' file path of the animated image
+        """
+        animation = self.var_animations.get(path)
+        if animation is not None and not animation.playing():
+            del self.var_animations[path]
+            animation.deleteLater()
+        self.var_model.on_icon_update(path)
 
     def on_ui_reorganize(self):
-        """Reconfigure the Layout of all the icons to move off screen images or
-        fill in empty space, after the icon or view size updates.
-        """
-        # determine how many images in a row by dividing the view size
-        # by icon size, minimum of one.
-        columnCount = self.size().width() // self.iconSize().width()
-        if columnCount < 1:
-            columnCount = 1
-        self.setColumnCount(columnCount)
-        # reset all the icons with the new column count
-        self.on_file_set()
-        # update the column size and headers
-        headers = []
-        for i in range(self.columnCount()):
-            headers.append('')
-            self.resizeColumnToContents(i)
-        self.setHeaderLabels(headers)
-
-    def on_icon_create(self, path):
+        """Fit the grid cells to the icon size after it updates, the view lays
+         out the visible cells again without recreating anything.
+        """
+        size = self.iconSize()
+        # leave room for the file name shown until the icon is created
+        self.setGridSize(QtCore.QSize(size.width() + 8, size.height() + 24))
+        self.on_icon_pin()
+
+    def on_icon_create(self, path, image=None, native=None, preview=False,
+                       size=None):
         """Creation function that generates a new icon and caches it into
          memory, as well as tracking a maximum icon size.
-        A scalable function for multiThreading.
+        Icons of previews and of smaller icon sizes are replaced once the
+         image is decoded.
+        Must be called on the main thread, use 'ImageIcon.read' to read the
+         image on another thread.
 
         :param path: 'str' file path for image to be displayed
+        :param image: 'QtGui.QImage' image already read from the path
+        :param native: 'QtCore.QSize' full resolution of the image
+        :param preview: 'bool' image is a low resolution preview
+        :param size: 'int' icon size the image was read for, defaults to the
+            current icon size
         """
-        # if str(path) in self.var_icons:
-        #    return
-        icon = ImageIcon(path)
+        if size is None:
+            size = self.var_icon_size
+        existing = self.var_icons.peek(str(path))
+        if existing is not None:
+            if preview or not (existing.var_preview or
+                               existing.var_size < size):
+                return
+            if image is not None and image.isNull():
+                # keep the icon of files that can't be decoded
+                existing.var_preview = False
+                existing.var_size = size
+                return
+        icon = ImageIcon(path, image, native, size, preview)
         self.var_icons[str(path)] = icon
-        # determine a maximum icon size
+        if str(path) not in self.var_icons:
+            # evicted right away, every other icon is visible
+            return
+        # determine a maximum icon size from the full resolution, as the
+        # icons are decoded scaled down
         self.var_icon_maximum = max([self.var_icon_maximum,
-                                     icon.var_pixmap.width(),
-                                     icon.var_pixmap.height()])
+                                     icon.var_native.width(),
+                                     icon.var_native.height()])
+        # update the icon if it's displayed
+        self.var_model.on_icon_update(path)
 
-    def on_file_process(self, files=None):
-        """Files will be processed to generate icons to update the display of
-         the view, based on the given or cached input.
+    def on_icon_read(self, path, size=ImageIcon.SIZE):
+        """Read the image of the path and queue it for its icon to be created.
+        Runs on the decoder threads.
 
-        :param files: 'list' File paths to create icons and update display
+        :param path: 'str' file path for image to be displayed
+        :param size: 'int' maximum width and height the image is decoded at
         """
-        if files is None:
-            files = self.var_files
+        image, native = ImageIcon.read(path, size, self.var_thumbnail_cache)
+        self.var_decoded.append((path, image, native, False, size))
+
+    def on_icon_preview(self, path, size=ImageIcon.SIZE):
+        """Read the preview embedded in the header of the file and queue it
+         for its icon to be created, until the image is decoded.
+        Runs on the decoder threads.
+
+        :param path: 'str' file path for image to be displayed
+        :param size: 'int' maximum width and height of the preview
+        """
+        if str(path) in self.var_icons:
+            return
+        image, native = ImageIcon.preview(path, size)
+        if image is not None:
+            self.var_decoded.append((path, image, native, True, size))
+
+    def on_icon_decode(self, path, size=ImageIcon.SIZE):
+        """Decode the image of the path in the process decoder and queue it
+         for its icon to be created. The pixels are copied out of the
+         decoder's slot right away, so the slot is free for the next image.
+        Runs on the decoder threads.
+
+        :param path: 'str' file path for image to be displayed
+        :param size: 'int' icon size the image is requested for, the
+            decoder's size is used
+        """
+        decoder = self.var_process_decoder
+        cache = self.var_thumbnail_cache
+        # previously decoded thumbnails don't need the processes
+        stored = cache.get(path, decoder.var_size)
+        if stored:
+            data, width, height = stored
+            image = QtGui.QImage.fromData(data)
+            if not image.isNull():
+                native = QtCore.QSize(width, height)
+                self.var_decoded.append((path, image, native, False, size))
+                return
+        thumbnail = decoder.decode(path)
+        image, native = QtGui.QImage(), None
+        if thumbnail is not None:
+            image = decoder.image(thumbnail).copy()
+            decoder.release(thumbnail)
+            native = QtCore.QSize(thumbnail.nativeWidth,
+                                  thumbnail.nativeHeight)
+            cache.put(path, decoder.var_size, ImageIcon.encode(image),
+                      thumbnail.nativeWidth, thumbnail.nativeHeight)
+        self.var_decoded.append((path, image, native, False, size))
+
+    def on_decoder_set(self, decoder=None):
+        """Decode the images in the worker processes of the decoder instead of
+         on threads of this process.
+
+        :param decoder: 'multiProcess.ProcessDecoder' decoder to use, None to
+            decode on threads
+        """
+        self.var_process_decoder = decoder
+
+    def on_decoder_resize(self):
+        """Replace the process decoder with one decoding at the icon size once
+         the icons are zoomed past its size. The new decoder shares the same
+         amount of memory over fewer, larger slots, the previous one is closed
+         once the calls still using it are done.
+        """
+        decoder = self.var_process_decoder
+        size = self.var_icon_size
+        if decoder is None or decoder.var_size >= size:
+            return
+        slots = max(decoder.var_processes,
+                    decoder.var_slots * decoder.var_size ** 2 // size ** 2)
+        self.var_process_decoder = multiProcess.ProcessDecoder(
+            processes=decoder.var_processes, size=size, slots=slots)
+        self.var_decoders_retired.append(decoder)
+
+    def on_icon_batch(self):
+        """Create the icons of the decoded images until the frame budget is
+         spent, leaving the rest for the next round of the event loop so the
+         view keeps repainting and responding.
+        Called by 'ui_timer' timeout signal.
+        """
+        start = time.perf_counter()
+        decoded = self.var_decoded
+        while decoded and time.perf_counter() - start < self.FRAME_BUDGET:
+            path, image, native, preview, size = decoded.popleft()
+            if not preview:
+                # previews aren't read again, files without one don't have
+                # their header read on every scroll
+                self.var_requested.discard((str(path), size))
+            if size != self.var_icon_size:
+                # read for a previous icon size by a call that was already
+                # running when the size changed
+                continue
+            self.on_icon_create(path, image, native, preview, size)
+        if not decoded and self.var_decoder.idle():
+            self.ui_timer.stop()
+            # the thumbnails are written in batches, store the last of them
+            # once the decoding settles
+            self.var_thumbnail_cache.commit()
+            # no call uses the replaced decoders anymore
+            while self.var_decoders_retired:
+                self.var_decoders_retired.pop().close()
+
+    def on_ui_close(self):
+        """Stop decoding and creating icons, shut down the worker processes
+         of the decoders and store the pending thumbnails, the view can't
+         decode images afterwards."""
+        self.var_closed = True
+        self.ui_timer.stop()
+        # the calls still running finish on their own, their images are
+        # dropped
+        self.var_decoder.shutdown(wait=False)
+        self.on_icon_flush()
+        for path in list(self.var_animations):
+            self.on_movie_stop(path)
+        decoders = self.var_decoders_retired + [self.var_process_decoder]
+        self.var_decoders_retired = []
+        self.var_process_decoder = None
+        for decoder in decoders:
+            if decoder is not None:
+                decoder.close()
+        self.var_thumbnail_cache.close()
+
+    def on_icon_flush(self):
+        """Drop the decoded images that are still waiting for their icons,
+         they're requested again the next time they're displayed."""
+        self.var_requested.clear()
+        self.var_decoded.clear()
+
+    def on_icon_remove(self, files):
+        """Remove the cached icons of the given files, so they will be created
+         again the next time they're displayed.
+
+        :param files: 'list' file paths of the icons to remove
+        """
+        for path in files:
+            self.var_icons.pop(str(path), None)
+            self.on_movie_stop(str(path))
+            self.var_requested.discard((str(path), self.var_icon_size))
+            self.var_requested.discard(('preview', str(path)))
+
+    def on_icon_evict(self, path, icon):
+        """Clear an evicted icon from the view, showing the file name until
+         it's scrolled into view and requested again.
+        Called by the icon cache.
+
+        :param path: 'str' file path of the evicted icon
+        :param icon: 'ImageIcon' evicted icon
+        """
+        self.var_requested.discard((str(path), self.var_icon_size))
+        self.var_requested.discard(('preview', str(path)))
+        self.var_model.on_icon_update(path)
+
+    def on_icon_done(self, key, future):
+        """Forget a read that was cancelled or failed, so it's requested
+         again the next time its cell is near the view.
+        Called by the read's future once it's done, on any thread.
+
+        :param key: 'object' key of the read
+        :param future: 'concurrent.futures.Future' result of the read
+        """
+        if future.cancelled() or future.exception() is not None:
+            self.var_requested.discard(key)
+
+    def on_icon_visible(self):
+        """Range of the cells within the viewport, found from the grid layout
+         rather than by querying the cells.
+
+        :return: 'list' index of the first visible file and after the last
+        """
+        grid = self.gridSize()
+        rect = self.viewport().rect()
+        if grid.width() < 1 or grid.height() < 1:
+            return 0, 0
+        columnCount = max(1, rect.width() // grid.width())
+        top = self.verticalScrollBar().value()
+        first = top // grid.height() * columnCount
+        last = ((top + rect.height()) // grid.height() + 1) * columnCount
+        return first, min(last, len(self.var_files))
+
+    def on_icon_pin(self):
+        """Keep the visible icons from being evicted, and request the icons
+         of the visible cells and the prefetch margin around them."""
+        if self.var_closed:
+            return
+        first, last = self.on_icon_visible()
+        self.var_icons.pin([str(f) for f in self.var_files[first:last]])
+        self.on_icon_request(first, last)
+
+    def on_icon_request(self, first, last):
+        """Queue the icons missing from the visible cells first, then the
+         cells ahead of the scroll direction and the ones behind it. Queued
+         icons of cells that are no longer near the viewport are cancelled,
+         reads that are running or waiting for their icons aren't queued
+         again.
+        The embedded previews of the visible cells are read before any image
+         is decoded, so they show right away.
+
+        :param first: 'int' index of the first visible file
+        :param last: 'int' index after the last visible file
+        """
+        files = self.var_files
+        page = max(last - first, 1)
+        ahead = int(page * self.PREFETCH_AHEAD)
+        behind = int(page * self.PREFETCH_BEHIND)
+        if self.var_scroll_direction < 0:
+            start, end = first - ahead, last + behind
         else:
-            self.var_files = files
-        # create icons for images
-        # This process seemed to length the ui load times for large numbers of
-        # images. MultiThreading this operation appears to cut the time by half.
-        threadPool = multiThread.ThreadPool(name='generateIcons',
-                                            functionArgs=[[f] for f in files],
-                                            function=self.on_icon_create,
-                                            pause=True, mainThread=True)
-        threadPool.run()
-        self.on_ui_reorganize()
+            start, end = first - behind, last + ahead
+        start, end = max(0, start), min(len(files), end)
+        function = self.on_icon_read
+        decoder = self.var_process_decoder
+        if decoder is not None and decoder.var_size >= self.var_icon_size:
+            # the threads only wait on the decoder's processes
+            function = self.on_icon_decode
+        requests = {}
+        for i in range(start, end):
+            path = files[i]
+            icon = self.var_icons.get(str(path))
+            if icon is not None and not icon.var_preview and \
+                    icon.var_size >= self.var_icon_size:
+                continue
+            # distance from the viewport, cells behind the scroll direction
+            # come after the ones ahead of it
+            if i < first:
+                distance = first - i
+                forward = self.var_scroll_direction < 0
+            elif i >= last:
+                distance = i - last + 1
+                forward = self.var_scroll_direction >= 0
+            else:
+                distance = 0
+                forward = True
+            if distance:
+                priority = page + distance if forward else 2 * page + distance
+            else:
+                priority = i - first
+                if icon is None:
+                    # ahead of every decode
+                    requests[('preview', str(path))] = (
+                        priority - page, path, self.on_icon_preview)
+            requests[(str(path), self.var_icon_size)] = (priority, path,
+                                                         function)
+        self.var_decoder.retain(requests)
+        requested = self.var_requested
+        for key, (priority, path, call) in requests.items():
+            if key in requested:
+                # queued, running or decoded already, only the priority of a
+                # queued read can change
+                self.var_decoder.prioritize(key, priority)
+                continue
+            requested.add(key)
+            future = self.var_decoder.submit(
+                key, args=(path, self.var_icon_size), priority=priority,
+                function=call)
+            future.add_done_callback(
+                functools.partial(self.on_icon_done, key))
+        if requests:
+            self.ui_timer.start()
 
-    def on_file_set(self, files=None):
-        """Given or cached images will be displayed in the view, using the
-         current row column configuration.
+    def on_file_process(self, files=None, rows=None):
+        """Files will be processed to generate icons to update the display of
+         the view, based on the given or cached input.
+        Only the model is updated, the icons of files that were displayed
+         before are kept, so narrowing down or widening a filter doesn't
+         decode them again.
 
-        :param files: 'list' files to be displayed
+        :param files: 'list' File paths to create icons and update display
+        :param rows: 'dict' row of each file path, such as built along with
+            the files on the filter thread
         """
         if files is None:
             files = self.var_files
+            rows = self.var_model.var_rows
         else:
             self.var_files = files
-        # add icons to display
-        self.clear()
-        rowItems = []
-        for i, path in enumerate(files):
-            # determine the row and column for this icon entry
-            columnCount = self.columnCount()
-            row = i // columnCount
-            column = i - (row * columnCount)
-            if len(rowItems) != row + 1:
-                # use existing items if they're will be on the same row
-                item = QtWidgets.QTreeWidgetItem(self)
-                rowItems.append(item)
-            else:
-                item = rowItems[row]
-            # reuse and update the cached icon
-            icon = self.var_icons[str(path)]
-            icon.var_item = item
-            icon.var_column = column
-            if not icon.var_pixmap and not icon.var_movie:
-                relativePath = path.name
-                item.setText(column, relativePath)
-            item.setIcon(column, icon)
-            item.setToolTip(column, str(path))
-            item.setTextAlignment(column, QtCore.Qt.AlignCenter)
+        # display the files right away, icons are only requested for the
+        # cells in and around the view so the first screen doesn't wait on
+        # the rest of the files. Requests of cells that aren't around the
+        # view anymore are dropped as the new ones are queued
+        self.var_model.on_file_set(files, rows)
+        self.on_icon_pin()
 
 
 class ImageBrowser(DockWidget):
     signal_path_process = QtCore.Signal(str)
     signal_filter_process = QtCore.Signal(str)
+    signal_file_change = QtCore.Signal(list, list, list)
+    signal_metadata_process = QtCore.Signal(object)
+
+    DECODER_CORES = 8
+    # milliseconds to wait for further typing before scanning or filtering
+    PATH_DELAY = 300
+    FILTER_DELAY = 150
+    # seconds between polls of the watched directories where they can't be
+    # watched for events, longer for large trees
+    POLL_INTERVAL = 10.0
 
     def __init__(self, path='', *args, **kwargs):
         """Widget to search given or set folder path and find all files in
@@ -303,12 +990,71 @@ class ImageBrowser(DockWidget):
         self.ui_fileView = None
         self.ui_filterLine = None
 
-        self.var_files = []
+        self.var_files = pathCatalog.PathCatalog()
         self.var_files_filtered = []
+        self.var_query = query.parse('')
+        # changes found by the watcher, applied to the files by the filter
+        # thread
+        self.var_changes = collections.deque()
+        # query, files and results of the last filtering that completed,
+        # only used by the filter thread
+        self.var_filter_result = None
+        self.var_metadata = {}
+        self.var_filter = lists.FilterList()
+        # wildcard terms over very large file lists are spread over processes
+        self.var_filter_backend = multiProcess.ProcessFilter()
+        self.var_filter.setBackend(self.var_filter_backend)
+        self.var_filter_index = None
+        # header metadata of the files, used for the query predicates once
+        # it's extracted
+        self.var_catalog = None
+        self.var_catalog_ready = False
+        # perceptual hashes of the files, indexed the first time similar
+        # images are looked for
+        self.var_similarity = None
+        # digests of the files compared for duplicates, kept between sessions
+        self.var_digests = duplicates.DigestCache()
+        self.var_index = scanIndex.ScanIndex()
+        self.var_watcher = None
+        # scanning and filtering run on background threads, only the results
+        # of the latest input are applied
+        self.var_pipeline = pipeline.Pipeline(self)
+        self.var_pipeline.signal_result.connect(self.on_pipeline_result)
+        self.var_closed = False
         self.on_ui_create()
+        # decoding is bound by the GIL, spread it over processes on machines
+        # with enough cores to make up for the transfer
+        if (os.cpu_count() or 1) >= ImageBrowser.DECODER_CORES:
+            self.ui_fileView.on_decoder_set(multiProcess.ProcessDecoder())
         if path:
             self.ui_pathLine.setText(path)
 
+    def closeEvent(self, event):
+        """Release the caches of the browser once it's closed.
+        Reimplementation of inherited function.
+        """
+        self.on_ui_close()
+        # maintain the original functionality of this event
+        return super(ImageBrowser, self).closeEvent(event)
+
+    def on_ui_close(self):
+        """Stop watching, scanning and filtering, shut down the worker
+         processes and store the pending thumbnails and hashes, only the
+         first call has any effect.
+        Called on close and by the application's 'aboutToQuit' signal.
+        """
+        if self.var_closed:
+            return
+        self.var_closed = True
+        if self.var_watcher:
+            self.var_watcher.stop()
+            self.var_watcher = None
+        self.var_pipeline.shutdown()
+        self.var_index.close()
+        self.var_filter_backend.close()
+        self.var_digests.close()
+        self.ui_fileView.on_ui_close()
+
     def on_ui_create(self):
         """Setups up widget settings to a consistent configuration and standard
          signal connections."""
@@ -351,7 +1097,11 @@ Double click on icon to open file''')
 ! : term will be required for matches
 + : display entries matching any of these terms
 < : term should include any prefix
-> : any suffix should be a term''')
+> : any suffix should be a term
+size>2MB, w>=4096, h<512, mtime<7d, ext:png|jpg : match file metadata
+similar:name.png~6 : images similar to the file, within an optional distance
+similar:* : group the near duplicate images
+duplicates:* : group the files with identical contents''')
         filterLine.textChanged.connect(self.signal_filter_process)
         self.ui_filterLine = filterLine
         mainLayout.addWidget(filterLine)
@@ -359,52 +1109,466 @@ Double click on icon to open file''')
         # signal connections
         self.signal_path_process.connect(self.on_file_process)
         self.signal_filter_process.connect(self.on_filter_process)
+        self.signal_file_change.connect(self.on_file_change)
+        self.signal_metadata_process.connect(self.on_metadata_process)
+        application = QtWidgets.QApplication.instance()
+        if application is not None:
+            application.aboutToQuit.connect(self.on_ui_close)
 
     def on_filter_process(self, filter_terms=None):
         """Filter terms will be processed to filter file paths displayed in
-         view, by fragmenting text input into groups and using regExpressions
-         include valid matches.
+         view, by compiling the text input into a query of terms and metadata
+         predicates to include valid matches.
+        The filtering runs once the typing pauses, on the filter thread.
 
         :param filter_terms: 'str' Formatted terms to filter terms based on
          inclusion, exclusion, required, starting and ending patterns.
         """
         if not filter_terms:
             filter_terms = self.ui_filterLine.text()
-        # break up the string term based common separator characters
-        terms = lists.fragment(terms=filter_terms, splits=list(' ,'),
-                               clean=True)
-        # group up common terms based on their starting character. We should
-        # get 5 groups: includes, excludes, required, starts, ends
-        groupings = lists.grouping(items=terms,
-                                   searchTerms=[[t] for t in '+-!<>'])
-        files = self.var_files
-        if groupings:
-            # if we have an extra group, it means there was no matching
-            # character and we can assume those to include terms
-            if len(groupings) == 6:
-                groupings[0].extend(groupings.pop())
-            includes, excludes, required, starts, ends = groupings
-            # filter the list of files
-            files = lists.filter(self.var_files, includes=includes,
-                                 excludes=excludes, required=required,
-                                 starts=starts, ends=ends)
-        self.var_files_filtered = files
-        self.ui_fileView.on_file_process(files)
+        # compiled queries are cached by their text, so retyping or deleting
+        # characters doesn't parse the terms again
+        self.var_query = query.parse(filter_terms)
+        self.on_filter_request(ImageBrowser.FILTER_DELAY)
+
+    def on_filter_request(self, delay=0):
+        """Filter the current files with the current query on the filter
+         thread, cancelling any filtering still running.
+
+        :param delay: 'int' milliseconds to wait for further requests
+        """
+        catalog = self.var_catalog if self.var_catalog_ready else None
+        self.var_pipeline.on_request(
+            'filter', self.on_filter_run,
+            args=(self.var_files, self.var_filter_index, self.var_query,
+                  catalog),
+            delay=delay)
+
+    def on_filter_run(self, files, index, filterQuery, catalog=None,
+                      cancel=None):
+        """Filter the files, run on the filter thread. The persistent filter
+         is only used by this thread.
+        Changes found by the watcher are applied to the files first, when
+         the query is the same as the last filtering only the added and
+         modified files are filtered and merged into its results.
+
+        :param files: 'pathCatalog.PathCatalog' file paths to be filtered
+        :param index: 'lists.TrigramIndex' index built over the files
+        :param filterQuery: 'query.Query' query to filter with
+        :param catalog: 'metadataCatalog.MetadataCatalog' extracted metadata
+            of the files
+        :param cancel: 'list' Cancel the filtering
+        :return: 'generator' file paths matching the query and the row of
+            each of the paths, nothing if cancelled
+        """
+        cancel = [False] if cancel is None else cancel
+        changes = self.on_file_update(files, index)
+        previous = self.var_filter_result
+        # the results only stay valid if this filtering completes
+        self.var_filter_result = None
+        # similar images and duplicates compare the changed files against
+        # all the others
+        if changes is not None and previous is not None \
+                and previous[0] is filterQuery and previous[1] is files \
+                and not filterQuery.var_duplicates \
+                and filterQuery.var_similar is None:
+            results = self.on_filter_merge(files, previous[2], changes,
+                                           filterQuery, cancel)
+        else:
+            self.var_filter.setIndex(index)
+            # the persistent filter reuses the results of previous terms, so
+            # typing or deleting characters only evaluates the narrowed
+            # results
+            results = self.on_filter_apply(files, self.var_filter,
+                                           filterQuery, cancel, catalog)
+            if results is not None and not filterQuery.var_duplicates \
+                    and filterQuery.var_similar is None:
+                results = self.on_filter_sort(files, results)
+        if results is None:
+            return
+        self.var_filter_result = (filterQuery, files, results)
+        # the view looks up the cells of the icons it updates by their path
+        rows = dict((str(f), i) for i, f in enumerate(results))
+        if cancel[0]:
+            return
+        yield results, rows
+
+    def on_filter_merge(self, files, filtered, changes, filterQuery,
+                        cancel=None):
+        """Filter the added and modified files and merge them into the
+         results of the last filtering, in sorted order.
+        Runs on the filter thread.
+
+        :param files: 'pathCatalog.PathCatalog' files that were filtered
+        :param filtered: 'list' file handles matching the query before the
+            changes
+        :param changes: 'tuple' handles of the added files and indices of the
+            removed and modified files, see 'on_file_update'
+        :param filterQuery: 'query.Query' query to filter with
+        :param cancel: 'list' Cancel the filtering
+        :return: 'list' file paths matching the query, None if cancelled
+        """
+        added, removed, modified = changes
+        changed = removed | modified
+        results = [f for f in filtered if f.index not in changed]
+        checked = [h for h in added if h.index not in removed]
+        checked.extend(files[i] for i in sorted(modified - removed))
+        # the predicates of the changed files are checked against their
+        # headers, their rows in the catalog are read again
+        matches = self.on_filter_apply(checked, filterQuery=filterQuery,
+                                       cancel=cancel)
+        if matches is None:
+            return None
+        for handle in sorted(matches):
+            bisect.insort(results, handle)
+        return results
+
+    def on_filter_sort(self, files, filtered):
+        """Move the files added by the watcher since the files were sorted
+         into their sorted position among the filtered files.
+        Runs on the filter thread.
+
+        :param files: 'pathCatalog.PathCatalog' files that were filtered
+        :param filtered: 'list' file handles matching the query
+        :return: 'list' file handles in sorted order
+        """
+        ordered = getattr(files, 'ordered', 0)
+        if not ordered or files.slots() == ordered:
+            return filtered
+        results = [f for f in filtered if f.index < ordered]
+        for handle in sorted(f for f in filtered if f.index >= ordered):
+            bisect.insort(results, handle)
+        return results
+
+    def on_filter_apply(self, files, filterList=None, filterQuery=None,
+                        cancel=None, catalog=None):
+        """Filter the given file paths with the current query. The metadata
+         predicates are compared over the catalog's columns when it holds
+         the files, otherwise the file headers are read as they're checked.
+
+        :param files: 'list' file paths to be filtered
+        :param filterList: 'lists.FilterList' filter keeping the results of
+            previous terms to reuse
+        :param filterQuery: 'query.Query' query to filter with, defaults to
+            the current query
+        :param cancel: 'list' Cancel the filtering
+        :param catalog: 'metadataCatalog.MetadataCatalog' extracted metadata
+            of the files
+        :return: 'list' file paths matching the query, None if cancelled
+        """
+        cancel = [False] if cancel is None else cancel
+        if filterQuery is None:
+            filterQuery = self.var_query
+        if not filterQuery:
+            return list(files)
+        if catalog is not None and catalog.var_paths is files:
+            return filterQuery.filter(files, filterList,
+                                      metadata=catalog.metadata, indexed=True,
+                                      cancel=cancel, catalog=catalog,
+                                      similarity=self.on_file_similar,
+                                      duplicates=self.on_file_duplicates)
+        # the dimensions need the file headers, they're only read for the
+        # width and height predicates
+        dimensions = any(p.var_field in ('width', 'height')
+                         for p in filterQuery.var_predicates)
+        cached = self.var_metadata
+        # metadata read before is as cheap to check as an index
+        indexed = bool(filterQuery.var_predicates) and all(
+            str(f) in cached and (not dimensions or 'width' in cached[str(f)])
+            for f in files)
+        return filterQuery.filter(files, filterList,
+                                  metadata=functools.partial(
+                                      self.on_file_metadata,
+                                      dimensions=dimensions),
+                                  indexed=indexed, cancel=cancel,
+                                  similarity=self.on_file_similar,
+                                  duplicates=self.on_file_duplicates)
+
+    def on_file_duplicates(self, files, cancel=None):
+        """Files with identical contents grouped together. Digests are kept
+         between sessions, so only new or changed files are read again.
+        Runs on the filter thread.
+
+        :param files: 'list' file paths to compare
+        :param cancel: 'list' Cancel the comparison
+        :return: 'list' duplicate file paths, None if cancelled
+        """
+        cancel = [False] if cancel is None else cancel
+        groups = duplicates.find(files, cache=self.var_digests, cancel=cancel)
+        if groups is None:
+            return None
+        return [path for group in groups for path in group]
+
+    def on_file_similar(self, files, target, distance=None, cancel=None):
+        """Files similar to the target file, or all the groups of near
+         duplicates, hashing the files that weren't hashed yet. Hashes are
+         stored in the thumbnail cache, so only new or changed files are
+         hashed again.
+        Runs on the filter thread.
+
+        :param files: 'list' file paths to look through
+        :param target: 'str' name or path of the file to find similar images
+            to, '*' to group all the near duplicates
+        :param distance: 'int' maximum hamming distance of the hashes
+        :param cancel: 'list' Cancel the hashing
+        :return: 'list' similar file paths, closest or grouped together, None
+            if cancelled
+        """
+        cancel = [False] if cancel is None else cancel
+        index = self.var_similarity
+        if index is None:
+            index = similarity.SimilarityIndex(
+                cache=self.ui_fileView.var_thumbnail_cache,
+                resolution=self.ui_fileView.var_icon_size)
+            self.var_similarity = index
+        updated = index.update(files, cancel=cancel)
+        # the hashes are stored with the thumbnails, which only commit in
+        # batches
+        index.var_cache.commit()
+        if updated is None:
+            return None
+        if distance is None:
+            distance = similarity.DISTANCE
+        lookup = dict((str(f), f) for f in files)
+        if target == '*':
+            return [lookup[p] for group in index.groups(distance)
+                    for p in group if p in lookup]
+        if target not in lookup:
+            # find the file by its name
+            name = target.lower()
+            matches = [p for p in lookup
+                       if os.path.basename(p).lower() == name]
+            if not matches:
+                return []
+            target = matches[0]
+        return [lookup[p] for d, p in index.similar(target, distance)
+                if p in lookup]
+
+    def on_file_metadata(self, path, dimensions=True):
+        """Metadata of the file for the query predicates, reading the image
+         dimensions from the file header when asked for. Results are kept
+         until the file changes.
+
+        :param path: 'str' file path
+        :param dimensions: 'bool' read the width and height of the image
+        :return: 'dict' size, mtime, width and height of the file, the width
+            and height are None if they can't be read
+        """
+        key = str(path)
+        data = self.var_metadata.get(key)
+        if data is None:
+            data = query.statMetadata(key)
+            self.var_metadata[key] = data
+        if dimensions and data and 'width' not in data:
+            # the common formats are parsed without Qt, the rest are left to
+            # the image readers
+            width = height = None
+            header = imageHeader.read(key)
+            if header.width and header.height:
+                width, height = header.width, header.height
+            else:
+                size = QtGui.QImageReader(key).size()
+                if size.isValid():
+                    width, height = size.width(), size.height()
+            data['height'] = height
+            data['width'] = width
+        return data
+
+    def on_file_change(self, added, removed, modified):
+        """Queue the changes found by the watcher for the filter thread, which
+         applies them to the file lists and only filters the added and
+         modified files. The icons of the changed files are created again.
+        Called by 'signal_file_change' signal.
+
+        :param added: 'list' file paths that were created
+        :param removed: 'list' file paths that were deleted
+        :param modified: 'list' file paths whose contents changed
+        """
+        catalog = self.var_catalog
+        if catalog is None or catalog.var_paths is not self.var_files:
+            # the files are being scanned again, which finds the changes
+            return
+        self.var_changes.append((catalog, added, removed, modified))
+        self.ui_fileView.on_icon_remove(removed + modified)
+        self.on_filter_request()
+
+    def on_file_update(self, files, index):
+        """Apply the changes queued by the watcher to the files, their filter
+         index and the metadata catalog. The headers of the changed files
+         are read on the metadata thread, along with any rows an extraction
+         still running didn't get to.
+        Runs on the filter thread, the only one changing the files.
+
+        :param files: 'pathCatalog.PathCatalog' files being filtered
+        :param index: 'lists.TrigramIndex' index built over the files
+        :return: 'tuple' handles of the added files and sets of the indices
+            of the removed and modified files, None if nothing changed
+        """
+        if files is not self.var_files:
+            # replaced since the filtering was requested, the request of the
+            # current files applies the changes
+            return None
+        added, removed, modified = [], set(), set()
+        changes = self.var_changes
+        while changes:
+            catalog, addedPaths, removedPaths, modifiedPaths = \
+                changes.popleft()
+            if catalog.var_paths is not files:
+                # changes of files scanned before
+                continue
+            for path in removedPaths + modifiedPaths:
+                self.var_metadata.pop(str(path), None)
+            removedIndices = files.remove(removedPaths)
+            modifiedIndices = [i for i in (files.find(p)
+                                           for p in modifiedPaths)
+                               if i is not None]
+            handles = files.extend(addedPaths)
+            # keep the filter index in sync with the files
+            if index is not None and index.var_items is files:
+                for i in removedIndices:
+                    index.remove(i)
+                for handle in handles:
+                    index.add(handle.index, handle)
+            catalog.remove(removedIndices)
+            catalog.invalidate(handles + modifiedIndices)
+            self.signal_metadata_process.emit(catalog)
+            added.extend(handles)
+            removed.update(removedIndices)
+            modified.update(modifiedIndices)
+        if not (added or removed or modified):
+            return None
+        if removed or modified:
+            # the hashes are indexed again, unchanged ones from the cache
+            self.var_similarity = None
+        return added, removed, modified
 
     def on_file_process(self, path=None):
         """The folder path will be processed to find the full list of files
          located under that directory path. This list will be filtered to
-         display the matching items
+         display the matching items.
+        The search runs once the typing pauses, on the scan thread.
 
         :param path: 'str' Directory path to locate all files underneath
         """
         if not path:
             path = self.ui_pathLine.text()
-        if not os.path.exists(path):
+        self.var_pipeline.on_request('scan', self.on_file_scan, args=(path,),
+                                     delay=ImageBrowser.PATH_DELAY)
+
+    def on_file_scan(self, path, cancel=None):
+        """Find all the files under the directory, run on the scan thread.
+         The first batch of files is yielded as soon as it's found so the
+         view isn't left empty for the duration of the search, followed by
+         all the files in sorted order and their filter index.
+
+        :param path: 'str' Directory path to locate all files underneath
+        :param cancel: 'list' Cancel the search
+        :return: 'generator' ('batch', files) then ('files', (path, files,
+            index))
+        """
+        cancel = [False] if cancel is None else cancel
+        if not os.path.isdir(path):
+            return
+        # previously scanned directories are answered from the index
+        files = pathCatalog.PathCatalog()
+        for batch in paths.iterPaths(paths=path, find_dirs=False,
+                                     index=self.var_index, compact=True):
+            if cancel[0]:
+                return
+            if not files:
+                yield 'batch', batch
+            files.extend(batch)
+        # validate the indexed directories, only updating the files if any of
+        # them changed since they were stored
+        if self.var_index.refresh(path):
+            files = paths.getPaths(paths=path, find_dirs=False,
+                                   index=self.var_index, compact=True)
+        else:
+            # the batches are only sorted per directory
+            files = files.sorted()
+        if cancel[0]:
+            return
+        # index the files for filtering when there are enough of them for
+        # filtering every file to be slow
+        index = None
+        if len(files) >= lists.TrigramIndex.MINIMUM_ITEMS:
+            index = lists.TrigramIndex(files)
+        yield 'files', (path, files, index)
+
+    def on_metadata_process(self, catalog):
+        """Read the headers of the rows of the catalog that weren't read yet,
+         on the metadata thread.
+        Called by 'signal_metadata_process' signal.
+
+        :param catalog: 'metadataCatalog.MetadataCatalog' catalog of the files
+        """
+        if catalog is self.var_catalog:
+            self.var_pipeline.on_request('metadata', self.on_metadata_extract,
+                                         args=(catalog,))
+
+    def on_metadata_extract(self, catalog, cancel=None):
+        """Read the headers of the files into the catalog, run on the
+         metadata thread.
+
+        :param catalog: 'metadataCatalog.MetadataCatalog' catalog of the files
+        :param cancel: 'list' Cancel the extraction
+        :return: 'generator' the catalog once extracted, nothing if cancelled
+        """
+        cancel = [False] if cancel is None else cancel
+        if catalog.extract(cancel=cancel) is not None:
+            yield catalog
+
+    def on_pipeline_result(self, stage, generation, result):
+        """Apply the results of the scan and filter threads, dropping the
+         results of inputs that were replaced since.
+        Called by the pipeline's 'signal_result' signal.
+
+        :param stage: 'str' name of the stage, 'scan', 'metadata' or 'filter'
+        :param generation: 'int' generation of the result
+        :param result: 'object' result yielded by the stage
+        """
+        if not self.var_pipeline.current(stage, generation):
+            return
+        if stage == 'filter':
+            files, rows = result
+            self.var_files_filtered = files
+            self.ui_fileView.on_file_process(files, rows)
+            return
+        if stage == 'metadata':
+            if result is not self.var_catalog:
+                return
+            self.var_catalog_ready = True
+            # icons can be zoomed up to the largest image, known without
+            # decoding any of them
+            view = self.ui_fileView
+            view.var_icon_maximum = max(view.var_icon_maximum,
+                                        int(result.maximum('width')),
+                                        int(result.maximum('height')))
+            if self.var_query.var_predicates:
+                self.on_filter_request()
+            return
+        kind, data = result
+        if kind == 'batch':
+            self.var_files = data
+            self.var_filter_index = None
+            self.on_filter_request()
             return
-        # find all the files in the directory and subdirectories
-        self.var_files = paths.getPaths(paths=path, find_dirs=False)
-        self.on_filter_process()
+        path, files, index = data
+        self.var_files = files
+        self.var_filter_index = index
+        self.var_metadata = {}
+        self.var_catalog = metadataCatalog.MetadataCatalog(files)
+        self.var_catalog_ready = False
+        self.var_similarity = None
+        self.on_filter_request()
+        self.var_pipeline.on_request('metadata', self.on_metadata_extract,
+                                     args=(self.var_catalog,))
+        # track changes to the files from here on
+        if self.var_watcher:
+            self.var_watcher.stop()
+        self.var_watcher = watcher.watch(
+            path, index=self.var_index, callback=self.signal_file_change.emit,
+            poll_interval=ImageBrowser.POLL_INTERVAL)
 
     def on_file_open(self, path):
         """Open a file in the default application.
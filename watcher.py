@@ -0,0 +1,425 @@
+import ctypes
+import ctypes.util
+import os
+import select
+import struct
+import threading
+import time
+
+import paths
+
+# inotify event flags
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_ISDIR = 0x40000000
+
+_EVENT_HEADER = struct.Struct('iIII')
+
+
+def watch(path, callback=None, interval=0.5, poll_interval=5.0, excludes=[],
+          ignore_file=paths.IGNORE_FILE, index=None, polling=False):
+    """Start watching the directory tree for changes, using inotify when the
+     platform supports it and polling directory mtimes otherwise.
+
+    :param path: 'str' root directory to watch
+    :param callback: 'function' Called with the added, removed and modified
+        file paths each time changes are found
+    :param interval: 'float' seconds to gather events before reporting them
+    :param poll_interval: 'float' minimum seconds between polls, growing
+        with the number of directories polled
+    :param excludes: 'list' precompiled regExpressions of directories to prune
+    :param ignore_file: 'str' name of gitignore-style files to prune with
+    :param index: 'scanIndex.ScanIndex' answers the listings of the first
+        snapshot from its stored entries
+    :param polling: 'bool' Use the polling watcher even if inotify is available
+    :return: 'Watcher' the started watcher
+    """
+    watcherClass = PollingWatcher
+    if not polling and InotifyWatcher.available():
+        watcherClass = InotifyWatcher
+    watcher = watcherClass(path, callback=callback, interval=interval,
+                           poll_interval=poll_interval, excludes=excludes,
+                           ignore_file=ignore_file, index=index)
+    watcher.start()
+    return watcher
+
+
+class Delta(object):
+    def __init__(self):
+        """Collection of the file paths that were added, removed or modified
+         since the last report."""
+        self.added = set()
+        self.removed = set()
+        self.modified = set()
+
+    def __bool__(self):
+        return bool(self.added or self.removed or self.modified)
+
+    def add(self, path):
+        if path in self.removed:
+            # removed and created again, report it as a modification
+            self.removed.discard(path)
+            self.modified.add(path)
+        else:
+            self.added.add(path)
+
+    def remove(self, path):
+        self.modified.discard(path)
+        if path in self.added:
+            self.added.discard(path)
+        else:
+            self.removed.add(path)
+
+    def modify(self, path):
+        if path not in self.added:
+            self.modified.add(path)
+
+
+class Watcher(object):
+    # directories stat'ed per second at most when polling, the interval
+    # between polls grows with the number of directories so large trees on
+    # network shares aren't stat'ed constantly
+    POLL_RATE = 200
+
+    def __init__(self, path, callback=None, interval=0.5, poll_interval=5.0,
+                 excludes=[], ignore_file=paths.IGNORE_FILE, index=None):
+        """Tracks the files of a directory tree, reporting which files were
+         added, removed or modified. Subclasses decide which directories need
+         to be listed again; any change to a directory is diffed against the
+         stored snapshot of its entries.
+
+        :param path: 'str' root directory to watch
+        :param callback: 'function' Called with the added, removed and
+            modified file paths each time changes are found
+        :param interval: 'float' seconds to gather events before reporting
+            them
+        :param poll_interval: 'float' minimum seconds between polls of the
+            directory mtimes
+        :param excludes: 'list' precompiled regExpressions of directories to
+            prune
+        :param ignore_file: 'str' name of gitignore-style files to prune with
+        :param index: 'scanIndex.ScanIndex' answers the listings of the first
+            snapshot from its stored entries
+        """
+        self.var_path = os.path.normpath(path)
+        self.var_callback = callback
+        self.var_interval = interval
+        self.var_poll_interval = poll_interval
+        self.var_excludes = excludes
+        self.var_ignore_file = ignore_file
+        self.var_index = index
+        # directory -> [mtime, subdirectory names, file names, inherited rules]
+        self._tree = {}
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        """Start watching on a thread, which first snapshots the directory
+         tree."""
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._watch, name='watcher')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        """Stop watching and wait for the thread to finish"""
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+            self._thread = None
+
+    def files(self):
+        """All file paths currently tracked
+
+        :return: 'list' file paths
+        """
+        results = []
+        for directory, (mtime, dirs, files, rules) in self._tree.items():
+            results.extend(os.path.join(directory, f) for f in files)
+        return results
+
+    def _watch(self):
+        """Snapshot the directory tree and run until stopped"""
+        self._addTree(self.var_path, [], Delta(), self.var_index)
+        self._run()
+
+    def _run(self):
+        raise NotImplementedError
+
+    def _report(self, delta):
+        """Pass the changes on to the callback"""
+        if delta and self.var_callback:
+            self.var_callback(sorted(delta.added), sorted(delta.removed),
+                              sorted(delta.modified))
+
+    def _scan(self, directory, rules, index=None):
+        """List the directory and store its snapshot
+
+        :param directory: 'str' directory path
+        :param rules: 'list' ignore rules inherited from parent directories
+        :param index: 'scanIndex.ScanIndex' answers the listing from its
+            stored entries instead of the filesystem
+        :return: 'list' subdirectory names, file names and the rules that
+            apply to the subdirectories
+        """
+        try:
+            mtime = os.stat(directory).st_mtime
+        except OSError:
+            mtime = None
+        dirs, files, childRules = paths.scanDirectory(
+            directory, rules, self.var_excludes, self.var_ignore_file,
+            index=index)
+        dirNames = set(e.name for e in dirs if not e.is_symlink())
+        fileNames = set(e.name for e in files)
+        self._tree[directory] = [mtime, dirNames, fileNames, rules]
+        return dirNames, fileNames, childRules
+
+    def _addTree(self, directory, rules, delta, index=None):
+        """Snapshot the directory and all of its children, reporting their
+         files as added."""
+        stack = [(directory, rules)]
+        while stack and not self._stop.is_set():
+            directory, rules = stack.pop()
+            dirNames, fileNames, childRules = self._scan(directory, rules,
+                                                         index)
+            self._onDirectoryAdded(directory)
+            for name in fileNames:
+                delta.add(os.path.join(directory, name))
+            for name in dirNames:
+                stack.append((os.path.join(directory, name), childRules))
+
+    def _removeTree(self, directory, delta):
+        """Forget the directory and all of its children, reporting their
+         files as removed."""
+        stack = [directory]
+        while stack:
+            directory = stack.pop()
+            snapshot = self._tree.pop(directory, None)
+            if snapshot is None:
+                continue
+            self._onDirectoryRemoved(directory)
+            mtime, dirNames, fileNames, rules = snapshot
+            for name in fileNames:
+                delta.remove(os.path.join(directory, name))
+            for name in dirNames:
+                stack.append(os.path.join(directory, name))
+
+    def _rescan(self, directory, delta):
+        """List a tracked directory again and diff it against its snapshot"""
+        snapshot = self._tree.get(directory)
+        if snapshot is None:
+            return
+        if not os.path.isdir(directory):
+            self._removeTree(directory, delta)
+            return
+        mtime, oldDirs, oldFiles, rules = snapshot
+        dirNames, fileNames, childRules = self._scan(directory, rules)
+        for name in fileNames - oldFiles:
+            delta.add(os.path.join(directory, name))
+        for name in oldFiles - fileNames:
+            delta.remove(os.path.join(directory, name))
+        for name in oldDirs - dirNames:
+            self._removeTree(os.path.join(directory, name), delta)
+        for name in dirNames - oldDirs:
+            self._addTree(os.path.join(directory, name), childRules, delta)
+
+    def _poll(self, directories, delta):
+        """Stat the directories, listing again only those whose mtime changed
+
+        :param directories: 'list' tracked directory paths
+        :param delta: 'Delta' collects the changes found
+        """
+        for directory in directories:
+            snapshot = self._tree.get(directory)
+            if snapshot is None:
+                # removed along with a parent directory
+                continue
+            try:
+                mtime = os.stat(directory).st_mtime
+            except OSError:
+                self._removeTree(directory, delta)
+                continue
+            if mtime != snapshot[0]:
+                self._rescan(directory, delta)
+
+    def _pollInterval(self, count):
+        """Seconds until the next poll of the directories
+
+        :param count: 'int' number of directories polled
+        :return: 'float' seconds to wait
+        """
+        return max(self.var_poll_interval, count / float(self.POLL_RATE))
+
+    def _onDirectoryAdded(self, directory):
+        """Called when a directory starts being tracked"""
+
+    def _onDirectoryRemoved(self, directory):
+        """Called when a directory stops being tracked"""
+
+
+class PollingWatcher(Watcher):
+    """Watcher that stats every tracked directory each poll interval,
+     listing again only those whose mtime changed. A directory's mtime only
+     changes when entries are added, removed or renamed, so files modified
+     in place are not reported."""
+
+    def _run(self):
+        while not self._stop.wait(self._pollInterval(len(self._tree))):
+            delta = Delta()
+            self._poll(list(self._tree), delta)
+            self._report(delta)
+
+
+class InotifyWatcher(Watcher):
+    MASK = (IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM |
+            IN_MOVED_TO | IN_CREATE | IN_DELETE | IN_DELETE_SELF |
+            IN_MOVE_SELF | IN_ONLYDIR)
+    _libc = None
+
+    def __init__(self, *args, **kwargs):
+        """Watcher driven by inotify events, with a watch on every tracked
+         directory. Events mark directories to be listed again, and writes
+         to files are reported as modifications. Events are gathered for the
+         interval before being reported together.
+        Directories that can't be watched, such as once the limit of
+         watches is reached, are polled instead.
+
+        :param args: standard inputs for a inherited class
+        :param kwargs: standard inputs for a inherited class
+        """
+        super(InotifyWatcher, self).__init__(*args, **kwargs)
+        self._fd = None
+        self._watches = {}
+        self._directories = {}
+        self._polled = set()
+
+    @classmethod
+    def available(cls):
+        """Check if inotify can be used on this platform
+
+        :return: 'bool' inotify is supported
+        """
+        if cls._libc is None:
+            cls._libc = False
+            name = ctypes.util.find_library('c')
+            if name:
+                libc = ctypes.CDLL(name, use_errno=True)
+                if hasattr(libc, 'inotify_init1'):
+                    libc.inotify_add_watch.argtypes = [ctypes.c_int,
+                                                       ctypes.c_char_p,
+                                                       ctypes.c_uint32]
+                    libc.inotify_rm_watch.argtypes = [ctypes.c_int,
+                                                      ctypes.c_int]
+                    cls._libc = libc
+        return bool(cls._libc)
+
+    def start(self):
+        self._fd = self._libc.inotify_init1(os.O_CLOEXEC)
+        if self._fd < 0:
+            raise OSError(ctypes.get_errno(), 'inotify_init1 failed')
+        super(InotifyWatcher, self).start()
+
+    def stop(self):
+        super(InotifyWatcher, self).stop()
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+        self._watches = {}
+        self._directories = {}
+        self._polled = set()
+
+    def _onDirectoryAdded(self, directory):
+        if directory in self._directories or directory in self._polled:
+            return
+        wd = self._libc.inotify_add_watch(self._fd, os.fsencode(directory),
+                                          self.MASK)
+        if wd < 0:
+            error = ctypes.get_errno()
+            if not self._polled:
+                print('inotify watch failed, polling instead: '
+                      '{0} ({1})'.format(directory, os.strerror(error)))
+            self._polled.add(directory)
+            return
+        self._watches[wd] = directory
+        self._directories[directory] = wd
+
+    def _onDirectoryRemoved(self, directory):
+        self._polled.discard(directory)
+        wd = self._directories.pop(directory, None)
+        if wd is not None:
+            self._watches.pop(wd, None)
+            self._libc.inotify_rm_watch(self._fd, wd)
+
+    def _read(self, timeout):
+        """Read the pending events
+
+        :param timeout: 'float' seconds to wait for events
+        :return: 'list' (directory, mask, name) of each event
+        """
+        ready, _, _ = select.select([self._fd], [], [], timeout)
+        if not ready:
+            return []
+        data = os.read(self._fd, 64 * 1024)
+        events = []
+        offset = 0
+        while offset < len(data):
+            wd, mask, cookie, length = _EVENT_HEADER.unpack_from(data, offset)
+            offset += _EVENT_HEADER.size
+            name = data[offset:offset + length].rstrip(b'\0')
+            offset += length
+            events.append((self._watches.get(wd), mask, os.fsdecode(name)))
+        return events
+
+    def _run(self):
+        polled = time.time()
+        while not self._stop.is_set():
+            events = self._read(self.var_interval)
+            if self._polled and time.time() - polled >= \
+                    self._pollInterval(len(self._polled)):
+                delta = Delta()
+                self._poll(list(self._polled), delta)
+                self._report(delta)
+                polled = time.time()
+            if not events:
+                continue
+            # gather the events for the interval, so bursts of writes are
+            # reported together
+            deadline = time.time() + self.var_interval
+            while time.time() < deadline and not self._stop.is_set():
+                events.extend(self._read(max(0, deadline - time.time())))
+            delta = Delta()
+            dirty = set()
+            modified = set()
+            for directory, mask, name in events:
+                if mask & IN_Q_OVERFLOW:
+                    # events were dropped, every directory needs checking
+                    dirty.update(self._tree)
+                    continue
+                if directory is None or mask & IN_IGNORED:
+                    continue
+                if mask & (IN_DELETE_SELF | IN_MOVE_SELF):
+                    dirty.add(os.path.dirname(directory))
+                elif mask & (IN_CREATE | IN_DELETE | IN_MOVED_FROM |
+                             IN_MOVED_TO):
+                    dirty.add(directory)
+                elif mask & (IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE):
+                    if not mask & IN_ISDIR:
+                        modified.add(os.path.join(directory, name))
+            for directory in sorted(dirty):
+                self._rescan(directory, delta)
+            for path in modified:
+                directory, name = os.path.split(path)
+                snapshot = self._tree.get(directory)
+                if snapshot and name in snapshot[2]:
+                    delta.modify(path)
+            self._report(delta)